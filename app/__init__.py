@@ -14,6 +14,7 @@ from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
 from dotenv import load_dotenv
 from app.config import config
+from app.utils.db_routing import RoutingSession, REPLICA_BIND
 import os
 
 # Load environment variables
@@ -27,21 +28,21 @@ db = SQLAlchemy(engine_options={
     'pool_timeout': 60,         # Increased for better timeout handling
     'max_overflow': 10,         # Allow more overflow connections
     'pool_use_lifo': True,      # Use LIFO for better performance
-})
+}, session_options={'class_': RoutingSession})  # Sends read-only requests to the replica when configured
 migrate = Migrate()
 login_manager = LoginManager()
 bcrypt = Bcrypt()
 mail = Mail()
-limiter = Limiter(
-    key_func=get_remote_address,
-    storage_uri="memory://",
-    strategy="fixed-window"
-)
+# Storage and strategy come from the RATELIMIT_* settings, see create_app
+limiter = Limiter(key_func=get_remote_address)
 
-def create_app(config_name=None):
+def create_app(config_name=None, overrides=None):
     if config_name is None:
         config_name = 'production' if os.getenv('FLASK_ENV') == 'production' else 'default'
     app = Flask(__name__)
+    # Uploaded files stream straight into the upload folder, see UploadRequest
+    from app.utils.file_utils import UploadRequest
+    app.request_class = UploadRequest
     
     # Configure logging
     if os.getenv('FLASK_ENV') != 'production':
@@ -55,6 +56,7 @@ def create_app(config_name=None):
     
     # Load config
     app.config.from_object(config[config_name])
+    app.config.update(overrides or {})  # Settings a test (or script) needs before the extensions start
     config[config_name].init_app(app)
     
     # Configure base session settings
@@ -71,22 +73,29 @@ def create_app(config_name=None):
     if not app.secret_key:
         app.secret_key = os.urandom(32)
     
-    # Initialize extensions with app
-    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
-        'pool_size': int(os.getenv('DB_POOL_SIZE', '20')),
-        'pool_recycle': int(os.getenv('DB_POOL_RECYCLE', '900')),
-        'pool_pre_ping': True,
-        'pool_timeout': int(os.getenv('DB_POOL_TIMEOUT', '60')),
-        'max_overflow': int(os.getenv('DB_MAX_OVERFLOW', '10')),
-        'pool_use_lifo': True,
-        'connect_args': {
-            'connect_timeout': 20,
-            'keepalives': 1,
-            'keepalives_idle': 60,
-            'keepalives_interval': 10,
-            'keepalives_count': 5
+    # Initialize extensions with app (the Postgres pool settings; tests run on SQLite)
+    if not app.testing:
+        app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+            'pool_size': int(os.getenv('DB_POOL_SIZE', '20')),
+            'pool_recycle': int(os.getenv('DB_POOL_RECYCLE', '900')),
+            'pool_pre_ping': True,
+            'pool_timeout': int(os.getenv('DB_POOL_TIMEOUT', '60')),
+            'max_overflow': int(os.getenv('DB_MAX_OVERFLOW', '10')),
+            'pool_use_lifo': True,
+            'connect_args': {
+                'connect_timeout': 20,
+                'keepalives': 1,
+                'keepalives_idle': 60,
+                'keepalives_interval': 10,
+                'keepalives_count': 5
+            }
+        }
+
+    # Optional read replica for @read_only views, with the same pool settings
+    if app.config.get('SQLALCHEMY_REPLICA_URI'):
+        app.config['SQLALCHEMY_BINDS'] = {
+            REPLICA_BIND: dict(app.config['SQLALCHEMY_ENGINE_OPTIONS'], url=app.config['SQLALCHEMY_REPLICA_URI'])
         }
-    }
     
     # Initialize core extensions
     db.init_app(app)
@@ -94,14 +103,21 @@ def create_app(config_name=None):
     login_manager.init_app(app)
     bcrypt.init_app(app)
     mail.init_app(app)
-    limiter.init_app(app)
 
     # Setup async environment
     from app.utils.async_utils import setup_async
     setup_async(app)
 
+    # Count SQL queries per request against QUERY_BUDGET
+    from app.utils.query_budget import setup_query_budget
+    setup_query_budget(app)
+
+    # Route read-only requests to the replica, keeping each user's reads after a write on the primary
+    from app.utils.db_routing import replica_router
+    replica_router.init_app(app, db)
+
     # Initialize Redis and session handling
-    if app.config.get('UPSTASH_REDIS_REST_URL') and app.config.get('UPSTASH_REDIS_REST_TOKEN'):
+    if app.config.get('REDIS_URL') or (app.config.get('UPSTASH_REDIS_REST_URL') and app.config.get('UPSTASH_REDIS_REST_TOKEN')):
         from app.utils.redis_client import RedisManager
         from app.utils.session_interface import UpstashRedisSessionInterface
         redis_manager = RedisManager()
@@ -123,6 +139,49 @@ def create_app(config_name=None):
             app.logger.warning("Falling back to default session interface")
     else:
         app.logger.warning("Redis configuration not found, using default session interface")
+
+    # Cache user identities for login_manager.user_loader, shared through Redis when available
+    from app.utils.identity_cache import identity_cache
+    identity_cache.init_app(app, redis=getattr(app, 'redis', None))
+
+    # Password hashing runs on a bounded pool of native threads, off the request greenlets
+    from app.utils.passwords import password_hasher
+    password_hasher.init_app(app, bcrypt)
+
+    # Content-addressed storage behind the logical upload paths
+    from app.utils.blob_store import blob_store
+    blob_store.init_app(app)
+
+    # Chunked upload sessions that survive dropped connections
+    from app.utils.resumable import resumable_uploads
+    resumable_uploads.init_app(app)
+
+    # Notification emails are queued in the database and sent by `flask send-email`
+    from app.utils.outbox import email_outbox
+    email_outbox.init_app(app)
+    from app.utils.notifications import notification_digests
+    notification_digests.init_app(app)
+
+    # Dashboards link to files with signed, expiring URLs
+    from app.utils.download_urls import download_url
+    app.add_template_global(download_url)
+
+    # Faculty list for the upload form, versioned in Redis when available
+    from app.utils.faculty_directory import faculty_directory
+    faculty_directory.init_app(app, redis=getattr(app, 'redis', None))
+
+    # Rate limits are counted in the shared Redis when available, so all workers enforce one budget
+    if not app.config.get('RATELIMIT_STORAGE_URI'):
+        if getattr(app, 'redis', None) is not None:
+            from app.utils.rate_limit import RedisManagerStorage  # Registers redismanager://
+            app.config['RATELIMIT_STORAGE_URI'] = 'redismanager://'
+            app.config['RATELIMIT_STORAGE_OPTIONS'] = {
+                'redis_manager': app.redis,
+                'local_block_seconds': app.config.get('RATELIMIT_LOCAL_BLOCK_SECONDS', 5)
+            }
+        else:
+            app.config['RATELIMIT_STORAGE_URI'] = 'memory://'
+    limiter.init_app(app)
     
     # Configure login manager with secure settings
     login_manager.login_view = 'auth.login'
@@ -0,0 +1,502 @@
+import asyncio
+import contextvars
+import functools
+import io
+import logging
+import mimetypes
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from hashlib import sha512
+from itertools import chain
+from urllib.parse import parse_qs
+from flask import g
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from werkzeug.http import dump_options_header, http_date, parse_cookie, parse_etags, parse_range_header
+from app.utils.blob_store import blob_store, BlobStore
+from app.utils.download_urls import verify_download, TOKEN_ARG
+from app.utils.file_utils import COPY_CHUNK_SIZE, INCOMING_DIR
+from app.utils.metrics import metrics
+from app.utils.resumable import ResumableUploads
+from app.utils.session_interface import SessionNotHinted
+
+logger = logging.getLogger(__name__)
+
+DOWNLOAD_PREFIX = '/uploads/'
+
+# Paths under /uploads/ that only Flask answers (with a 404)
+_PRIVATE_DIRECTORIES = (INCOMING_DIR + '/', BlobStore.DIRECTORY + '/', ResumableUploads.DIRECTORY + '/')
+
+# Endpoint -> async view answering it on the event loop (see native_view)
+NATIVE_VIEWS = {}
+
+def native_view(endpoint):
+    """Register an async version of a read-only GET view for the ASGI app.
+
+    The coroutine runs in the request context with current_user set and
+    receives an AsyncSession; it returns what the Flask view would, or
+    None to leave the request to the Flask view (wrong role, bad cursor).
+    """
+    def decorator(f):
+        NATIVE_VIEWS[endpoint] = f
+        return f
+    return decorator
+
+def _headers(scope):
+    """Request headers as a dict of lower-case names, repeated headers joined like a WSGI server does"""
+    headers = {}
+    for name, value in scope.get('headers', []):
+        name, value = name.decode('latin1'), value.decode('latin1')
+        headers[name] = f"{headers[name]},{value}" if name in headers else value
+    return headers
+
+def _login_identifier(headers, client):
+    """The session identifier Flask-Login stores as _id (flask_login.utils._create_identifier)"""
+    address = headers.get('x-forwarded-for', client[0] if client else None)
+    if address is not None:
+        address = address.encode('utf-8').split(b',')[0].strip()
+    user_agent = headers.get('user-agent')
+    if user_agent is not None:
+        user_agent = user_agent.encode('utf-8')
+    return sha512(f"{address}|{user_agent}".encode('utf8')).hexdigest()
+
+class _RequestBody(io.RawIOBase):
+    """Request body for wsgi.input, received from the ASGI server as Flask reads it.
+
+    Nothing is read ahead or written to disk: a body the app never reads
+    is never received, and werkzeug refuses one over MAX_CONTENT_LENGTH
+    (413) before reading past the limit. Runs on the Flask thread, waiting
+    on the event loop for each message.
+    """
+
+    def __init__(self, receive, loop):
+        self._receive = receive
+        self._loop = loop
+        self._pending = memoryview(b'')
+        self._finished = False
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while not self._pending and not self._finished:
+            message = asyncio.run_coroutine_threadsafe(self._receive(), self._loop).result()
+            if message['type'] == 'http.disconnect':
+                # A short body; werkzeug reports it as a client disconnect
+                self._finished = True
+                break
+            self._pending = memoryview(message.get('body', b''))
+            self._finished = not message.get('more_body')
+        size = min(len(buffer), len(self._pending))
+        buffer[:size] = self._pending[:size]
+        self._pending = self._pending[size:]
+        return size
+
+class AsgiApp:
+    """ASGI entry point (see asgi.py): native async downloads and pages, Flask for the rest.
+
+    GET and HEAD requests for /uploads/ are answered on the event loop: the
+    user comes from the signed identity hint in the session cookie, signed
+    links are verified in memory and other links are authorized with one
+    query on an async SQLAlchemy engine, then the blob is streamed with
+    reads on the loop's executor. Native downloads are not counted by the
+    rate limiter.
+
+    Pages with a native_view are answered the same way: the session is
+    opened from its hint (confirmed with an async EXISTS when the cookie is
+    aging), the view queries through an AsyncSession, and an unchanged
+    session is saved with an async EXPIRE. Only the rate limit check, whose
+    storage is synchronous, and the save of a changed session run on a
+    thread.
+
+    Whatever the native paths do not handle with certainty (no identity
+    hint, a denied or unknown file, a session key outside the hint, no
+    async database driver, If-Range, proxy offload, files without a digest)
+    goes to Flask, which gives the same answer it always has. Every other
+    request runs the Flask app on a bounded pool of threads.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.native_downloads = app.config.get('ASGI_NATIVE_DOWNLOADS', True)
+        self.native_pages = app.config.get('ASGI_NATIVE_PAGES', True)
+        self.threads = ThreadPoolExecutor(max_workers=int(app.config.get('ASGI_WSGI_THREADS', 40)),
+                                          thread_name_prefix='edusync-wsgi')
+        self._engine = None
+        self._engine_unavailable = False
+        app.extensions['asgi'] = self
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self._lifespan(receive, send)
+        if scope['type'] != 'http':
+            return  # No websockets
+        kind, native = self._native(scope)
+        if native is not None:
+            started = []
+
+            async def tracked_send(message):
+                started.append(True)
+                await send(message)
+
+            try:
+                if await native(scope, tracked_send):
+                    return
+            except Exception as e:
+                if started:
+                    raise
+                logger.error(f"Native response for {scope['path']} failed, handing it to Flask: {str(e)}")
+            metrics.incr(f'asgi.deferred_{kind}')
+        await self._wsgi(scope, receive, send)
+
+    def _native(self, scope):
+        """(kind, coroutine) answering the request on the event loop, (None, None) for Flask"""
+        if scope['method'] not in ('GET', 'HEAD'):
+            return None, None
+        if scope['path'].startswith(DOWNLOAD_PREFIX):
+            return ('downloads', self._download) if self.native_downloads else (None, None)
+        if self.native_pages and NATIVE_VIEWS:
+            return 'pages', self._page
+        return None, None
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                if self._engine is not None:
+                    await self._engine.dispose()
+                self.threads.shutdown(wait=False)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    # Flask
+
+    def _environ(self, scope, body):
+        script_name = scope.get('root_path', '').encode('utf8').decode('latin1')
+        path_info = scope['path'].encode('utf8').decode('latin1')
+        if path_info.startswith(script_name):
+            path_info = path_info[len(script_name):]
+        server = scope.get('server') or ('localhost', 80)
+        environ = {
+            'REQUEST_METHOD': scope['method'],
+            'SCRIPT_NAME': script_name,
+            'PATH_INFO': path_info,
+            'QUERY_STRING': scope['query_string'].decode('ascii'),
+            'SERVER_NAME': server[0],
+            'SERVER_PORT': str(server[1]),
+            'SERVER_PROTOCOL': f"HTTP/{scope['http_version']}",
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': scope.get('scheme', 'http'),
+            'wsgi.input': body,
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': True,
+            'wsgi.run_once': False,
+        }
+        if scope.get('client'):
+            environ['REMOTE_ADDR'] = scope['client'][0]
+        headers = _headers(scope)
+        if 'content-length' not in headers:
+            # Chunked request bodies end where the ASGI server says they do
+            environ['wsgi.input_terminated'] = True
+        for name, value in headers.items():
+            if name == 'content-length':
+                environ['CONTENT_LENGTH'] = value
+            elif name == 'content-type':
+                environ['CONTENT_TYPE'] = value
+            else:
+                environ['HTTP_' + name.upper().replace('-', '_')] = value
+        return environ
+
+    async def _wsgi(self, scope, receive, send):
+        """Run the Flask app on the thread pool, streaming its response back"""
+        loop = asyncio.get_running_loop()
+        body = io.BufferedReader(_RequestBody(receive, loop), buffer_size=COPY_CHUNK_SIZE)
+        environ = self._environ(scope, body)
+
+        def send_from_thread(message):
+            asyncio.run_coroutine_threadsafe(send(message), loop).result()
+
+        def run():
+            response = {'start': None, 'sent': False}
+
+            def write(data):
+                if not response['sent']:
+                    send_from_thread(response['start'])
+                    response['sent'] = True
+                if data:
+                    send_from_thread({'type': 'http.response.body', 'body': data, 'more_body': True})
+
+            def start_response(status, headers, exc_info=None):
+                if exc_info and response['sent']:
+                    raise exc_info[1].with_traceback(exc_info[2])
+                response['start'] = {
+                    'type': 'http.response.start',
+                    'status': int(status.split(' ', 1)[0]),
+                    'headers': [(k.lower().encode('latin1'), v.encode('latin1')) for k, v in headers],
+                }
+                return write
+
+            result = self.app(environ, start_response)
+            try:
+                for chunk in result:
+                    if chunk:
+                        write(chunk)
+                write(b'')
+                send_from_thread({'type': 'http.response.body'})
+            finally:
+                # Closes files behind send_file responses
+                close = getattr(result, 'close', None)
+                if close is not None:
+                    close()
+
+        await loop.run_in_executor(self.threads, run)
+
+    def _in_thread(self, func, *args):
+        """Run func on the thread pool in the caller's context (request context included)"""
+        context = contextvars.copy_context()
+        return asyncio.get_running_loop().run_in_executor(self.threads, functools.partial(context.run, func, *args))
+
+    # Native downloads and pages
+
+    def _hinted_user(self, scope, headers, hint):
+        """The logged-in user's id according to a session's identity hint, None if that is not enough"""
+        if not hint or '_user_id' not in hint:
+            return None
+        # Flask-Login would drop (strong) or distrust (basic) a session used from elsewhere
+        login_manager = getattr(self.app, 'login_manager', None)
+        if login_manager is not None and login_manager.session_protection:
+            if hint.get('_id') != _login_identifier(headers, scope.get('client')):
+                return None
+        try:
+            return int(hint['_user_id'])
+        except (TypeError, ValueError):
+            return None
+
+    def _session_user(self, scope, headers):
+        """The logged-in user's id from the session cookie alone, None if that is not enough"""
+        peek = getattr(self.app.session_interface, 'peek_hint', None)
+        if peek is None:
+            return None
+        cookies = parse_cookie(headers.get('cookie', ''))
+        return self._hinted_user(scope, headers, peek(cookies.get(self.app.config['SESSION_COOKIE_NAME'])))
+
+    def _async_engine(self):
+        if self._engine is None and not self._engine_unavailable:
+            from sqlalchemy.ext.asyncio import create_async_engine
+            url = self.app.config.get('ASYNC_DATABASE_URI')
+            options = self.app.config.get('ASYNC_ENGINE_OPTIONS', {}) if url and url.startswith('postgresql') else {}
+            try:
+                self._engine = create_async_engine(url, **options)
+            except Exception as e:
+                # No asyncio driver installed: pages and unsigned links are answered by Flask
+                logger.warning(f"Async database engine unavailable ({str(e)}), "
+                               f"pages and unsigned downloads go through Flask")
+                self._engine_unavailable = True
+        return self._engine
+
+    async def _authorize(self, filename, user_id):
+        """Digest of filename if user_id may download it under main.uploaded_file's rules.
+
+        Returns (True, sha256) or (False, None); False also when the answer
+        needs Flask (no engine, unexpected paths, missing rows).
+        """
+        from app.models import Document, User
+        engine = self._async_engine()
+        if engine is None:
+            return False, None
+        parts = filename.split('/')
+        try:
+            owner_id = int(parts[1].split('_')[1]) if parts[0] == 'reviews' else int(parts[0].split('_')[1])
+        except (IndexError, ValueError):
+            return False, None
+
+        async with engine.connect() as conn:
+            role = await conn.scalar(select(User.role).where(User.id == user_id))
+            if parts[0] == 'reviews':
+                row = (await conn.execute(
+                    select(Document.uploader_id, Document.assigned_faculty_id,
+                           Document.review_file1_path, Document.review_file1_sha256,
+                           Document.review_file2_path, Document.review_file2_sha256)
+                    .where(Document.id == owner_id)
+                )).first()
+                if row is None:
+                    return False, None
+                if (role == 'faculty' and row.assigned_faculty_id != user_id) or \
+                        (role == 'student' and row.uploader_id != user_id) or role not in ('faculty', 'student'):
+                    return False, None
+                return True, {row.review_file1_path: row.review_file1_sha256,
+                              row.review_file2_path: row.review_file2_sha256}.get(filename)
+
+            row = (await conn.execute(
+                select(Document.assigned_faculty_id, Document.sha256)
+                .where(Document.file_path == filename).limit(1)
+            )).first()
+        if role == 'student' and owner_id == user_id:
+            return True, row.sha256 if row else None
+        if role == 'faculty' and row is not None and row.assigned_faculty_id == user_id:
+            return True, row.sha256
+        return False, None
+
+    async def _download(self, scope, send):
+        """Answer a download natively; False hands the request to Flask"""
+        config = self.app.config
+        headers = _headers(scope)
+        filename = scope['path'][len(DOWNLOAD_PREFIX):]
+        if (not filename or filename.startswith(_PRIVATE_DIRECTORIES) or config.get('DOWNLOAD_OFFLOAD')
+                or 'if-range' in headers or ('if-modified-since' in headers and 'if-none-match' not in headers)):
+            return False
+        user_id = self._session_user(scope, headers)
+        if user_id is None:
+            return False
+
+        token = parse_qs(scope['query_string'].decode('latin1')).get(TOKEN_ARG, [None])[0]
+        with self.app.app_context():
+            grant = verify_download(filename, token, user_id)
+        if grant is not None:
+            sha256 = grant.sha256
+        else:
+            allowed, sha256 = await self._authorize(filename, user_id)
+            if not allowed:
+                return False
+        if not sha256:
+            return False  # Files from before digests were recorded keep Flask's ETags
+
+        base = [(b'etag', f'"{sha256}"'.encode()), (b'cache-control', b'no-cache, private')]
+        if 'if-none-match' in headers and parse_etags(headers['if-none-match']).contains(sha256):
+            await send({'type': 'http.response.start', 'status': 304, 'headers': base})
+            await send({'type': 'http.response.body'})
+            metrics.incr('downloads.not_modified')
+            return True
+
+        with self.app.app_context():
+            path = blob_store.locate(filename, sha256)
+        loop = asyncio.get_running_loop()
+        try:
+            fd = await loop.run_in_executor(None, os.open, path, os.O_RDONLY)
+        except (OSError, TypeError):
+            return False
+        try:
+            stat = os.fstat(fd)
+            start, length, status = 0, stat.st_size, 200
+            if 'range' in headers:
+                requested = parse_range_header(headers['range'])
+                bounds = requested.range_for_length(stat.st_size) if requested else None
+                if bounds is None:
+                    return False  # Malformed, unsatisfiable or multiple ranges
+                start, length, status = bounds[0], bounds[1] - bounds[0], 206
+                base.append((b'content-range', f'bytes {bounds[0]}-{bounds[1] - 1}/{stat.st_size}'.encode()))
+
+            download_name = os.path.basename(filename)
+            await send({'type': 'http.response.start', 'status': status, 'headers': base + [
+                (b'content-type', (mimetypes.guess_type(download_name)[0] or 'application/octet-stream').encode()),
+                (b'content-length', str(length).encode()),
+                (b'content-disposition', dump_options_header('inline', {'filename': download_name}).encode('latin1')),
+                (b'last-modified', http_date(stat.st_mtime).encode()),
+                (b'accept-ranges', b'bytes'),
+            ]})
+            metrics.incr('asgi.native_downloads')
+            if scope['method'] == 'HEAD':
+                await send({'type': 'http.response.body'})
+                return True
+            offset, end = start, start + length
+            while offset < end:
+                chunk = await loop.run_in_executor(None, os.pread, fd, min(COPY_CHUNK_SIZE, end - offset), offset)
+                if not chunk:
+                    break
+                offset += len(chunk)
+                await send({'type': 'http.response.body', 'body': chunk, 'more_body': offset < end})
+            if offset < end:
+                await send({'type': 'http.response.body'})
+            return True
+        finally:
+            os.close(fd)
+
+    async def _load_user(self, engine, user_id):
+        """The user as login_manager.user_loader returns it, from the identity cache or one query"""
+        from app.models import User
+        from app.utils.identity_cache import CachedUser, identity_cache
+        fields = await identity_cache.get_async(user_id)
+        if fields is None:
+            async with engine.connect() as conn:
+                row = (await conn.execute(
+                    select(*(getattr(User, field) for field in CachedUser.FIELDS)).where(User.id == user_id)
+                )).first()
+            if row is None:
+                return None
+            fields = row._asdict()
+        return CachedUser(**fields)
+
+    def _within_limits(self):
+        """Flask-Limiter's check for the current request; False when a limit is exceeded"""
+        from flask_limiter.errors import RateLimitExceeded
+        from app import limiter
+        try:
+            limiter.check()
+        except RateLimitExceeded:
+            return False  # Flask counts the request again and answers 429
+        return True
+
+    def _after_request(self, ctx, response):
+        """The after_request functions, as Flask's process_response runs them before saving the session"""
+        for func in ctx._after_request_functions:
+            response = self.app.ensure_sync(func)(response)
+        for name in chain(ctx.request.blueprints, (None,)):
+            for func in reversed(self.app.after_request_funcs.get(name, ())):
+                response = self.app.ensure_sync(func)(response)
+        return response
+
+    async def _page(self, scope, send):
+        """Answer a page with a native_view; False hands the request to Flask"""
+        interface = self.app.session_interface
+        if not hasattr(interface, 'open_session_async'):
+            return False  # Sessions without an identity hint
+        environ = self._environ(scope, io.BytesIO())
+        ctx = self.app.request_context(environ)
+        ctx.match_request()
+        view = NATIVE_VIEWS.get(ctx.request.endpoint)
+        if view is None:
+            return False
+        engine = self._async_engine()
+        if engine is None:
+            return False
+        session = await interface.open_session_async(self.app, ctx.request)
+        if session is None:
+            return False
+        user_id = self._hinted_user(scope, _headers(scope), session.hint)
+        if user_id is None:
+            return False
+        user = await self._load_user(engine, user_id)
+        if user is None:
+            return False
+
+        ctx.session = session
+        ctx.push()
+        try:
+            g._login_user = user
+            try:
+                async with AsyncSession(engine) as db:
+                    rv = await view(db)
+                if rv is None:
+                    return False
+                response = self.app.make_response(rv)
+            except SessionNotHinted:
+                return False  # The page needs the full session (pending flashes, for one)
+            if not await self._in_thread(self._within_limits):
+                return False
+            response = self._after_request(ctx, response)
+            if not await interface.save_session_async(self.app, session, response):
+                await self._in_thread(interface.save_session, self.app, session, response)
+            headers = response.get_wsgi_headers(environ)
+            body = b'' if scope['method'] == 'HEAD' else b''.join(response.iter_encoded())
+        finally:
+            ctx.pop()
+
+        await send({'type': 'http.response.start', 'status': response.status_code,
+                    'headers': [(k.lower().encode('latin1'), v.encode('latin1')) for k, v in headers.items()]})
+        await send({'type': 'http.response.body', 'body': body})
+        metrics.incr('asgi.native_pages')
+        return True
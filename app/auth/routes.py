@@ -1,8 +1,10 @@
 from flask import render_template, redirect, url_for, flash, request, current_app, session
-from app.utils.async_utils import async_route
 from flask_login import login_user, logout_user, login_required, current_user
 from urllib.parse import urlparse
-from app import db, bcrypt
+from app import db
+from app.utils.metrics import metrics
+from app.utils.passwords import password_hasher, PasswordHasherBusy
+from app.utils.faculty_directory import faculty_directory
 import logging
 
 logger = logging.getLogger(__name__)
@@ -11,8 +13,7 @@ from app.models import User
 from app.auth.forms import LoginForm, RegistrationForm
 
 @bp.route('/login', methods=['GET', 'POST'])
-@async_route
-async def login():
+def login():
     if current_user.is_authenticated:
         return redirect(url_for('main.index'))
         
@@ -27,11 +28,21 @@ async def login():
                 flash('Invalid email or password', 'danger')
                 return redirect(url_for('auth.login'))
             
-            if not bcrypt.check_password_hash(user.password_hash, form.password.data):
+            if not password_hasher.check(user.password_hash, form.password.data):
                 logger.warning(f"Login failed: Invalid password for email: {form.email.data}")
                 flash('Invalid email or password', 'danger')
                 return redirect(url_for('auth.login'))
             
+            # Bring the hash to the configured work factor while the password is at hand
+            if password_hasher.needs_rehash(user.password_hash):
+                try:
+                    user.password_hash = password_hasher.hash(form.password.data)
+                    db.session.commit()
+                    metrics.incr('passwords.rehashes')
+                except Exception as e:
+                    db.session.rollback()
+                    logger.warning(f"Password rehash skipped for user {user.id}: {str(e)}")
+            
             # Clear any existing session first
             session.clear()
             
@@ -58,6 +69,7 @@ async def login():
                 return redirect(url_for('auth.login'))
             
             # Log successful login and session details
+            metrics.incr('auth.logins')
             logger.info(f"Login successful for user: {user.email} (role: {user.role})")
             logger.debug(f"Session data: user_id={session.get('user_id')}, " + 
                       f"authenticated={current_user.is_authenticated}, " +
@@ -72,6 +84,10 @@ async def login():
                     next_page = url_for('faculty.dashboard')
             return redirect(next_page)
             
+        except PasswordHasherBusy:
+            logger.warning(f"Login deferred, password hashing queue full: {form.email.data}")
+            flash('The server is busy. Please try again in a moment.', 'warning')
+            return render_template('auth/login.html', title='Sign In', form=form), 503
         except Exception as e:
             logger.error(f"Database error during login: {str(e)}", exc_info=True)
             if "SSL SYSCALL error" in str(e):
@@ -92,7 +108,7 @@ def signup():
     form = RegistrationForm()
     if form.validate_on_submit():
         try:
-            hashed_password = bcrypt.generate_password_hash(form.password.data).decode('utf-8')
+            hashed_password = password_hasher.hash(form.password.data)
             user = User(
             email=form.email.data,
             password_hash=hashed_password,
@@ -103,9 +119,16 @@ def signup():
             db.session.add(user)
             db.session.commit()
             logger.info(f"New user registered: {user.email} (role: {user.role})")
+            if user.role == 'faculty':
+                # New faculty must show up on every worker's upload form
+                faculty_directory.invalidate()
         
             flash('Your account has been created! You can now log in.', 'success')
             return redirect(url_for('auth.login'))
+        except PasswordHasherBusy:
+            logger.warning(f"Registration deferred, password hashing queue full: {form.email.data}")
+            flash('The server is busy. Please try again in a moment.', 'warning')
+            return render_template('auth/signup.html', title='Sign Up', form=form), 503
         except Exception as e:
             logger.error(f"Registration error: {str(e)}", exc_info=True)
             if "SSL SYSCALL error" in str(e):
@@ -118,8 +141,7 @@ def signup():
 
 @bp.route('/logout')
 @login_required
-@async_route
-async def logout():
+def logout():
     try:
         # Log before logout
         logger.debug(f"Logging out user. Session data: user_id={session.get('user_id')}, " +
@@ -1,7 +1,9 @@
 import os
 import logging
+import tempfile
 from datetime import timedelta
 from logging.handlers import RotatingFileHandler
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
 
 class Config:
     # Flask
@@ -13,6 +15,12 @@ class Config:
     # Redis Configuration
     UPSTASH_REDIS_REST_URL = os.getenv('UPSTASH_REDIS_REST_URL')
     UPSTASH_REDIS_REST_TOKEN = os.getenv('UPSTASH_REDIS_REST_TOKEN')
+    REDIS_URL = os.getenv('REDIS_URL')  # redis:// or rediss:// for a native connection, overrides the REST URL
+    REDIS_POOL_SIZE = int(os.getenv('REDIS_POOL_SIZE', '20'))             # Keep-alive connections per worker
+    REDIS_COMMAND_TIMEOUT = int(os.getenv('REDIS_COMMAND_TIMEOUT', '10'))  # Seconds per Redis call
+    # Under gevent workers, sync Redis calls go through a blocking gevent transport instead of the event loop
+    REDIS_GEVENT_TRANSPORT = os.getenv('REDIS_GEVENT_TRANSPORT', 'True').lower() == 'true'
+    REDIS_GEVENT_POOL_SIZE = int(os.getenv('REDIS_GEVENT_POOL_SIZE', '0'))  # 0: the worker's --worker-connections
     
     # Session Configuration
     SESSION_TYPE = 'redis'
@@ -21,7 +29,38 @@ class Config:
     SESSION_USE_SIGNER = True
     SESSION_VALIDATION_ENABLED = True
     SESSION_REFRESH_EACH_REQUEST = True
-    
+    # Unchanged sessions only get their TTL extended (EXPIRE) once this fraction of the lifetime has passed
+    SESSION_REFRESH_FRACTION = float(os.getenv('SESSION_REFRESH_FRACTION', '0.5'))
+
+    # Session Cache (per worker, avoids a Redis round trip on repeat requests)
+    SESSION_CACHE_ENABLED = os.getenv('SESSION_CACHE_ENABLED', 'True').lower() == 'true'
+    SESSION_CACHE_MAX_ENTRIES = int(os.getenv('SESSION_CACHE_MAX_ENTRIES', '2048'))
+    SESSION_CACHE_TTL = int(os.getenv('SESSION_CACHE_TTL', '30'))  # Staleness window in seconds
+    # Defer the Redis fetch until a view reads session data beyond the identity hint in the cookie
+    SESSION_LAZY_LOADING = os.getenv('SESSION_LAZY_LOADING', 'True').lower() == 'true'
+    # Past this age a cookie's identity hint is only used once the Redis session is confirmed to exist
+    SESSION_HINT_REVALIDATE_SECONDS = int(os.getenv('SESSION_HINT_REVALIDATE_SECONDS', '60'))
+    # Storage format: 'json' or 'binary' (compact). Both are always readable; switch to
+    # 'binary' only once no worker from before the binary format is still running
+    SESSION_SERIALIZER = os.getenv('SESSION_SERIALIZER', 'json')
+    SESSION_COMPRESS_THRESHOLD = int(os.getenv('SESSION_COMPRESS_THRESHOLD', '512'))  # zlib bodies of this many bytes or more
+
+    # Identity cache for current_user (per worker, optionally shared through Redis)
+    IDENTITY_CACHE_ENABLED = os.getenv('IDENTITY_CACHE_ENABLED', 'True').lower() == 'true'
+    IDENTITY_CACHE_MAX_ENTRIES = int(os.getenv('IDENTITY_CACHE_MAX_ENTRIES', '1024'))
+    IDENTITY_CACHE_TTL = int(os.getenv('IDENTITY_CACHE_TTL', '60'))  # Bounds staleness on other workers after a change
+    IDENTITY_CACHE_REDIS = os.getenv('IDENTITY_CACHE_REDIS', 'True').lower() == 'true'
+    IDENTITY_CACHE_REDIS_TTL = int(os.getenv('IDENTITY_CACHE_REDIS_TTL', '600'))
+
+    # Faculty directory: workers check the shared version at most this often (seconds)
+    FACULTY_DIRECTORY_CHECK_INTERVAL = int(os.getenv('FACULTY_DIRECTORY_CHECK_INTERVAL', '30'))
+    FACULTY_DIRECTORY_TTL = int(os.getenv('FACULTY_DIRECTORY_TTL', '3600'))  # Lifetime of a version in Redis
+
+    # Password hashing: bcrypt work factor (existing hashes are upgraded at the next login)
+    BCRYPT_LOG_ROUNDS = int(os.getenv('BCRYPT_LOG_ROUNDS', '12'))
+    PASSWORD_HASH_WORKERS = int(os.getenv('PASSWORD_HASH_WORKERS', '2'))  # Native threads per worker, 0 hashes inline
+    PASSWORD_HASH_MAX_PENDING = int(os.getenv('PASSWORD_HASH_MAX_PENDING', '32'))  # Queued + running, beyond that 503
+
     # Database
     @staticmethod
     def get_database_url():
@@ -31,8 +70,54 @@ class Config:
             url = url.replace('postgres://', 'postgresql://', 1)
         return url
 
+    @staticmethod
+    def get_replica_url():
+        """Get the read replica URL, None when no replica is configured"""
+        url = os.getenv('REPLICA_DATABASE_URL')
+        if url and url.startswith('postgres://'):
+            url = url.replace('postgres://', 'postgresql://', 1)
+        return url
+
+    @staticmethod
+    def get_async_database_url(url):
+        """The database URL with an asyncio driver, for the ASGI app's native downloads and pages"""
+        if url.startswith('sqlite://'):
+            return url.replace('sqlite://', 'sqlite+aiosqlite://', 1)
+        if not url.startswith('postgresql://'):
+            return url
+        # SSL follows the URL, as for the sync engine: asyncpg takes ssl= where libpq takes
+        # sslmode=, and rejects libpq-only parameters such as channel_binding (certificate
+        # files come from PGSSLROOTCERT/PGSSLCERT/PGSSLKEY instead)
+        parts = urlsplit(url.replace('postgresql://', 'postgresql+asyncpg://', 1))
+        query = [('ssl' if name == 'sslmode' else name, value)
+                 for name, value in parse_qsl(parts.query, keep_blank_values=True)
+                 if name not in ('channel_binding', 'connect_timeout', 'options', 'target_session_attrs',
+                                 'sslrootcert', 'sslcert', 'sslkey')]
+        return urlunsplit(parts._replace(query=urlencode(query)))
+
     SQLALCHEMY_DATABASE_URI = get_database_url()
+    # Read replica: @read_only views send their SELECTs here (unset: everything uses the primary)
+    SQLALCHEMY_REPLICA_URI = get_replica_url()
+    # A user's reads stay on the primary this long after their last write, or the measured lag if longer
+    REPLICA_READ_YOUR_WRITES_SECONDS = float(os.getenv('REPLICA_READ_YOUR_WRITES_SECONDS', '5'))
+    REPLICA_MAX_LAG_SECONDS = float(os.getenv('REPLICA_MAX_LAG_SECONDS', '30'))  # Bypass the replica beyond this
+    REPLICA_LAG_CHECK_INTERVAL = float(os.getenv('REPLICA_LAG_CHECK_INTERVAL', '5'))  # Seconds between lag checks per worker
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # ASGI mode (asgi.py): downloads are authorized on this async engine, the rest runs on Flask's
+    ASYNC_DATABASE_URI = os.getenv('ASYNC_DATABASE_URL') or get_async_database_url(SQLALCHEMY_DATABASE_URI)
+    ASYNC_ENGINE_OPTIONS = {
+        'pool_size': int(os.getenv('ASYNC_DB_POOL_SIZE', '10')),
+        'max_overflow': int(os.getenv('DB_MAX_OVERFLOW', '10')),
+        'pool_recycle': int(os.getenv('DB_POOL_RECYCLE', '900')),
+        'pool_pre_ping': True,
+        'connect_args': {
+            'timeout': 20,
+            'server_settings': {'application_name': 'edusync-asgi', 'statement_timeout': '60000'}
+        }
+    }
+    ASGI_NATIVE_DOWNLOADS = os.getenv('ASGI_NATIVE_DOWNLOADS', 'True').lower() == 'true'
+    ASGI_NATIVE_PAGES = os.getenv('ASGI_NATIVE_PAGES', 'True').lower() == 'true'  # Dashboards on the event loop
+    ASGI_WSGI_THREADS = int(os.getenv('ASGI_WSGI_THREADS', '40'))  # Threads running Flask requests per ASGI worker
     
     # Database Connection Settings for Neon (Optimized for concurrent users)
     SQLALCHEMY_ENGINE_OPTIONS = {
@@ -65,20 +150,60 @@ class Config:
         'zip',  # Archives
     }
     
+    # Downloads: dashboard links are signed for their viewer and skip the database check until they expire
+    DOWNLOAD_URL_TTL = int(os.getenv('DOWNLOAD_URL_TTL', 900))  # Links stay valid for one to two TTLs, 0 disables signing
+    # Downloads: after the authorization check, let the front proxy send the file:
+    # 'x-accel-redirect' (nginx) or 'x-sendfile' (Apache, lighttpd); unset streams it from Python
+    DOWNLOAD_OFFLOAD = os.getenv('DOWNLOAD_OFFLOAD', '').lower()
+    DOWNLOAD_ACCEL_PREFIX = os.getenv('DOWNLOAD_ACCEL_PREFIX', '/protected-uploads/')  # nginx internal location for UPLOAD_FOLDER
+    USE_X_SENDFILE = DOWNLOAD_OFFLOAD == 'x-sendfile'
+
+    # Resumable uploads: fixed chunk size, largest file accepted, and how long an idle session is kept
+    RESUMABLE_CHUNK_SIZE = int(os.getenv('RESUMABLE_CHUNK_SIZE', str(1024 * 1024)))
+    RESUMABLE_MAX_SIZE = int(os.getenv('RESUMABLE_MAX_SIZE', os.getenv('MAX_CONTENT_LENGTH', '20971520')))
+    RESUMABLE_UPLOAD_TTL = int(os.getenv('RESUMABLE_UPLOAD_TTL', '86400'))
+    # Unreferenced blobs (and orphaned blob files) are kept this long before `flask gc-blobs` deletes them
+    BLOB_GC_GRACE_SECONDS = int(os.getenv('BLOB_GC_GRACE_SECONDS', '3600'))
+    
+    # Documents per page on the dashboards and reviewed list
+    DOCUMENTS_PER_PAGE = int(os.getenv('DOCUMENTS_PER_PAGE', '20'))
+    
     # Mail
     MAIL_SERVER = os.getenv('MAIL_SERVER')
     MAIL_PORT = int(os.getenv('MAIL_PORT', 587))
     MAIL_USE_TLS = os.getenv('MAIL_USE_TLS', 'True').lower() == 'true'
     MAIL_USERNAME = os.getenv('MAIL_USERNAME')
     MAIL_PASSWORD = os.getenv('MAIL_PASSWORD')
+    MAIL_DEFAULT_SENDER = os.getenv('MAIL_DEFAULT_SENDER', 'noreply@university.edu')
+    MAIL_MAX_EMAILS = int(os.getenv('MAIL_MAX_EMAILS', '0')) or None  # Messages per SMTP connection before reconnecting, 0 for no limit
+    # Collect notifications per recipient for this many seconds and send one digest; 0 sends each review at once
+    # (new submission digests for faculty are only sent in digest mode)
+    NOTIFICATION_DIGEST_SECONDS = float(os.getenv('NOTIFICATION_DIGEST_SECONDS', '0'))
+    MAIL_LINK_BASE_URL = os.getenv('MAIL_LINK_BASE_URL', 'http://localhost:5000')  # Links in emails built outside a request
+    # Outbox drained by `flask send-email`: rows per batch (and commit), retries with exponential backoff
+    OUTBOX_BATCH_SIZE = int(os.getenv('OUTBOX_BATCH_SIZE', '50'))
+    OUTBOX_MAX_ATTEMPTS = int(os.getenv('OUTBOX_MAX_ATTEMPTS', '8'))
+    OUTBOX_RETRY_BASE_SECONDS = float(os.getenv('OUTBOX_RETRY_BASE_SECONDS', '30'))
+    OUTBOX_RETRY_MAX_SECONDS = float(os.getenv('OUTBOX_RETRY_MAX_SECONDS', '3600'))
+    OUTBOX_POLL_INTERVAL = float(os.getenv('OUTBOX_POLL_INTERVAL', '5'))  # Seconds between checks when idle
     
     # Rate Limiting
     RATELIMIT_DEFAULT = "100/hour"
-    RATELIMIT_STORAGE_URI = "memory://"
-    RATELIMIT_STRATEGY = "fixed-window"
+    RATELIMIT_STORAGE_URI = os.getenv('RATELIMIT_STORAGE_URI')  # Unset: the shared Redis if configured, else per-worker memory
+    RATELIMIT_STRATEGY = os.getenv('RATELIMIT_STRATEGY', 'moving-window')  # Sliding window, no bursts at window edges
+    # Clients over a limit are refused by the worker itself for up to this many seconds
+    RATELIMIT_LOCAL_BLOCK_SECONDS = float(os.getenv('RATELIMIT_LOCAL_BLOCK_SECONDS', '5'))
     
     # File Upload Rate Limits
     UPLOAD_RATELIMIT = "10/hour"  # Limit file uploads
+
+    # Query budget: requests running more SQL queries than this are logged (0 disables);
+    # views can set their own with @query_budget. Strict mode raises instead, for tests
+    QUERY_BUDGET = int(os.getenv('QUERY_BUDGET', '20'))
+    QUERY_BUDGET_STRICT = os.getenv('QUERY_BUDGET_STRICT', 'False').lower() == 'true'
+
+    # Monitoring: expose per-worker counters as JSON at /metrics
+    METRICS_ENDPOINT_ENABLED = os.getenv('METRICS_ENDPOINT_ENABLED', 'False').lower() == 'true'
     
     @staticmethod
     def init_app(app):
@@ -175,8 +300,30 @@ class ProductionConfig(Config):
         app.logger.addHandler(mail_handler)
         
 
+class TestingConfig(Config):
+    TESTING = True
+    SECRET_KEY = 'testing'
+    SESSION_COOKIE_SECURE = False
+    WTF_CSRF_ENABLED = False
+    # SQLite without the Postgres pool settings (tests pass their own database
+    # file), and no Redis: cookie sessions and memory:// rate limits are used
+    SQLALCHEMY_DATABASE_URI = 'sqlite:///' + os.path.join(tempfile.gettempdir(), 'edusync-test.db')
+    SQLALCHEMY_REPLICA_URI = None
+    SQLALCHEMY_ENGINE_OPTIONS = {}
+    UPSTASH_REDIS_REST_URL = None
+    UPSTASH_REDIS_REST_TOKEN = None
+    REDIS_URL = None
+    RATELIMIT_ENABLED = False
+    QUERY_BUDGET_STRICT = False
+
+    @staticmethod
+    def init_app(app):
+        # No log files; tests set UPLOAD_FOLDER themselves
+        pass
+
 config = {
     'development': DevelopmentConfig,
     'production': ProductionConfig,
+    'testing': TestingConfig,
     'default': DevelopmentConfig
 }
@@ -1,12 +1,20 @@
-from flask import render_template, flash, redirect, url_for, request, current_app
+from flask import render_template, flash, redirect, url_for, request, current_app, abort, jsonify
 from flask_login import login_required, current_user
 from app import db, limiter
 from app.faculty import bp
 from app.models import Document, User
-from app.faculty.utils import send_review_notification
+from app.faculty.utils import queue_review_notification
 from app.config import Config
 from app.utils.file_utils import allowed_file, save_file
+from app.utils.pagination import paginate_keyset, paginate_keyset_async, InvalidCursor
+from app.utils.db_routing import read_only
+from app.asgi import native_view
+from app.utils.blob_store import blob_store
+from app.utils.resumable import resumable_uploads, UploadSessionError
+from werkzeug.datastructures import FileStorage
 from werkzeug.utils import secure_filename
+from sqlalchemy import select
+from sqlalchemy.orm import joinedload
 from datetime import datetime
 import os
 import logging
@@ -16,37 +24,80 @@ logger = logging.getLogger(__name__)
 @bp.route('/faculty/dashboard')
 @limiter.limit("100/hour")
 @login_required
+@read_only
 def dashboard():
     if current_user.role != 'faculty':
         flash('Access denied. Faculty only.', 'danger')
         return redirect(url_for('main.index'))
     
-    # Get documents assigned to this faculty member that are pending review
-    documents = Document.query.filter_by(
-        assigned_faculty_id=current_user.id,
-        status='pending_review'
-    ).order_by(Document.upload_date.desc()).all()
+    per_page = current_app.config['DOCUMENTS_PER_PAGE']
+    try:
+        # Get documents assigned to this faculty member that are pending review
+        # (uploaders are joined in, the template shows their names)
+        documents = paginate_keyset(
+            Document.query.options(joinedload(Document.uploader)).filter_by(
+                assigned_faculty_id=current_user.id,
+                status='pending_review'
+            ),
+            Document.upload_date, cursor=request.args.get('cursor'), per_page=per_page
+        )
+    except InvalidCursor:
+        abort(400)
     
-    # Get documents reviewed by this faculty member
-    reviewed = Document.query.filter_by(
-        assigned_faculty_id=current_user.id,
-        reviewer_id=current_user.id,
-        status='reviewed'
-    ).order_by(Document.review_date.desc()).all()
+    # Most recent documents reviewed by this faculty member, the rest are on the reviewed page
+    reviewed = paginate_keyset(
+        Document.query.options(joinedload(Document.uploader)).filter_by(
+            assigned_faculty_id=current_user.id,
+            reviewer_id=current_user.id,
+            status='reviewed'
+        ),
+        Document.review_date, per_page=per_page
+    )
     
     return render_template('faculty/dashboard.html',
                          pending_documents=documents,
                          reviewed_documents=reviewed)
 
+@native_view('faculty.dashboard')
+async def dashboard_async(db):
+    """dashboard on the ASGI event loop"""
+    if current_user.role != 'faculty':
+        return None
+    per_page = current_app.config['DOCUMENTS_PER_PAGE']
+    try:
+        documents = await paginate_keyset_async(
+            db,
+            select(Document).options(joinedload(Document.uploader)).filter_by(
+                assigned_faculty_id=current_user.id,
+                status='pending_review'
+            ),
+            Document.upload_date, cursor=request.args.get('cursor'), per_page=per_page
+        )
+    except InvalidCursor:
+        return None
+    reviewed = await paginate_keyset_async(
+        db,
+        select(Document).options(joinedload(Document.uploader)).filter_by(
+            assigned_faculty_id=current_user.id,
+            reviewer_id=current_user.id,
+            status='reviewed'
+        ),
+        Document.review_date, per_page=per_page
+    )
+    return render_template('faculty/dashboard.html',
+                         pending_documents=documents,
+                         reviewed_documents=reviewed)
+
 @bp.route('/faculty/document/<int:id>')
 @limiter.limit("100/hour")
 @login_required
+@read_only
 def view_document(id):
     if current_user.role != 'faculty':
         flash('Access denied. Faculty only.', 'danger')
         return redirect(url_for('main.index'))
     
-    document = Document.query.get_or_404(id)
+    document = Document.query.options(joinedload(Document.uploader)).get_or_404(id)
     
     # Ensure faculty can only view documents assigned to them
     if document.assigned_faculty_id != current_user.id:
@@ -54,12 +105,39 @@ def view_document(id):
         flash('Access denied. You can only view documents assigned to you.', 'danger')
         return redirect(url_for('faculty.dashboard'))
         
-    student = User.query.get(document.uploader_id)
+    student = document.uploader
     
     return render_template('faculty/document.html',
                          document=document,
                          student=student)
 
+def _attach_review_file(document, slot, file):
+    """Save a review file into slot 1 or 2, releasing the blob of a replaced one"""
+    directory = f"reviews/document_{document.id}"
+    saved = save_file(file, directory)
+    previous = getattr(document, f'review_file{slot}_sha256')
+    if previous:
+        blob_store.release(previous)
+    setattr(document, f'review_file{slot}_path', os.path.join(directory, saved.filename))
+    setattr(document, f'review_file{slot}_sha256', saved.sha256)
+
+def _finish_review(document):
+    """Mark a document reviewed by the current user and notify the student"""
+    document.status = 'reviewed'
+    document.reviewer_id = current_user.id
+    document.review_date = datetime.utcnow()
+    
+    # The notification commits with the review and is sent by `flask send-email`
+    queue_review_notification(document)
+    db.session.commit()
+
+def _reviewable_document(doc_id):
+    """The document with doc_id if the current faculty member may review it, else None"""
+    document = Document.query.get(doc_id)
+    if document is None or document.assigned_faculty_id != current_user.id:
+        return None
+    return document
+
 @bp.route('/faculty/upload_review/<int:doc_id>', methods=['GET', 'POST'])
 @limiter.limit(Config.UPLOAD_RATELIMIT)
 @login_required
@@ -68,7 +146,7 @@ def upload_review(doc_id):
         flash('Access denied. Faculty only.', 'danger')
         return redirect(url_for('main.index'))
     
-    document = Document.query.get_or_404(doc_id)
+    document = Document.query.options(joinedload(Document.uploader)).get_or_404(doc_id)
     
     # Ensure faculty can only review documents assigned to them
     if document.assigned_faculty_id != current_user.id:
@@ -98,46 +176,118 @@ def upload_review(doc_id):
         try:
             # Save review files
             for i, file in review_files:
-                directory = f"reviews/document_{doc_id}"
-                filename = save_file(file, directory)
-                
-                # Update document record
-                if i == 1:
-                    document.review_file1_path = os.path.join(directory, filename)
-                else:
-                    document.review_file2_path = os.path.join(directory, filename)
-            
-            # Update document status
-            document.status = 'reviewed'
-            document.reviewer_id = current_user.id
-            document.review_date = datetime.utcnow()
-            
-            db.session.commit()
-            
-            # Send notification to student
-            send_review_notification(document)
+                _attach_review_file(document, i, file)
+            _finish_review(document)
             
             flash('Review uploaded successfully', 'success')
             return redirect(url_for('faculty.dashboard'))
             
         except Exception as e:
+            db.session.rollback()
             flash(f'Error uploading review: {str(e)}', 'danger')
             return redirect(request.url)
     
     return render_template('faculty/upload_review.html', document=document)
 
+@bp.route('/faculty/upload_review/<int:doc_id>/resumable', methods=['POST'])
+@limiter.limit(Config.UPLOAD_RATELIMIT)
+@login_required
+def start_resumable_review(doc_id):
+    """Open a resumable upload session for one review file, see app/utils/resumable.py"""
+    if current_user.role != 'faculty':
+        return jsonify(error='Faculty only'), 403
+    if _reviewable_document(doc_id) is None:
+        return jsonify(error='Unknown document'), 404
+    
+    data = request.get_json(silent=True) or {}
+    filename = data.get('filename') or ''
+    if not allowed_file(filename):
+        return jsonify(error='File type not allowed'), 400
+    if data.get('slot') not in (1, 2):
+        return jsonify(error='slot must be 1 or 2'), 400
+    
+    try:
+        meta = resumable_uploads.create(current_user.id, filename, data.get('size'),
+                                        {'document_id': doc_id, 'slot': data['slot']})
+    except UploadSessionError as e:
+        return jsonify(error=str(e)), e.status
+    complete_url = url_for('faculty.complete_resumable_review', doc_id=doc_id, upload_id=meta['id'])
+    return jsonify(resumable_uploads.describe(meta, complete_url)), 201
+
+@bp.route('/faculty/upload_review/<int:doc_id>/resumable/<upload_id>/complete', methods=['POST'])
+@limiter.exempt
+@login_required
+def complete_resumable_review(doc_id, upload_id):
+    """Attach a fully received upload session to a document as a review file"""
+    if current_user.role != 'faculty':
+        return jsonify(error='Faculty only'), 403
+    
+    try:
+        meta = resumable_uploads.get(upload_id, current_user.id)
+        document = _reviewable_document(doc_id)
+        if document is None or meta['target']['document_id'] != doc_id:
+            raise UploadSessionError('Unknown document', 404)
+        ingest = resumable_uploads.claim(meta)
+    except UploadSessionError as e:
+        return jsonify(error=str(e)), e.status
+    
+    try:
+        _attach_review_file(document, meta['target']['slot'],
+                            FileStorage(stream=ingest, filename=meta['filename']))
+        _finish_review(document)
+    except Exception as e:
+        logger.error(f"Error completing resumable review upload {upload_id}: {str(e)}")
+        db.session.rollback()
+        ingest.close()
+        resumable_uploads.unclaim(meta)
+        return jsonify(error='Error uploading review'), 500
+    ingest.close()
+    resumable_uploads.discard(meta)
+    
+    return jsonify(document_id=document.id, redirect=url_for('faculty.dashboard')), 201
+
 @bp.route('/faculty/reviewed')
 @login_required
+@read_only
 def reviewed_documents():
     if current_user.role != 'faculty':
         flash('Access denied. Faculty only.', 'danger')
         return redirect(url_for('main.index'))
     
-    # Get all documents reviewed by current faculty
-    documents = Document.query.filter_by(
-        assigned_faculty_id=current_user.id,
-        reviewer_id=current_user.id,
-        status='reviewed'
-    ).order_by(Document.review_date.desc()).all()
+    # Get documents reviewed by current faculty, one page at a time
+    try:
+        documents = paginate_keyset(
+            Document.query.options(joinedload(Document.uploader)).filter_by(
+                assigned_faculty_id=current_user.id,
+                reviewer_id=current_user.id,
+                status='reviewed'
+            ),
+            Document.review_date,
+            cursor=request.args.get('cursor'),
+            per_page=current_app.config['DOCUMENTS_PER_PAGE']
+        )
+    except InvalidCursor:
+        abort(400)
     
     return render_template('faculty/reviewed.html', documents=documents)
+
+@native_view('faculty.reviewed_documents')
+async def reviewed_documents_async(db):
+    """reviewed_documents on the ASGI event loop"""
+    if current_user.role != 'faculty':
+        return None
+    try:
+        documents = await paginate_keyset_async(
+            db,
+            select(Document).options(joinedload(Document.uploader)).filter_by(
+                assigned_faculty_id=current_user.id,
+                reviewer_id=current_user.id,
+                status='reviewed'
+            ),
+            Document.review_date,
+            cursor=request.args.get('cursor'),
+            per_page=current_app.config['DOCUMENTS_PER_PAGE']
+        )
+    except InvalidCursor:
+        return None
+    return render_template('faculty/reviewed.html', documents=documents)
@@ -1,11 +1,21 @@
-from flask import send_from_directory, current_app, abort, redirect, url_for
+from flask import send_file, current_app, abort, redirect, url_for, jsonify, request
+from werkzeug.exceptions import HTTPException
 import logging
 
 logger = logging.getLogger(__name__)
 from flask_login import login_required, current_user
 from app.main import bp
 from app.models import Document
+from app.utils.metrics import metrics
+from app.utils.db_routing import read_only
+from app.utils.file_utils import INCOMING_DIR, upload_root
+from app.utils.blob_store import blob_store, BlobStore
+from app.utils.download_urls import verify_download, TOKEN_ARG
+from app.utils.resumable import resumable_uploads, ResumableUploads, UploadSessionError
+from app import limiter
+import mimetypes
 import os
+from urllib.parse import quote
 
 @bp.route('/')
 def index():
@@ -16,9 +26,25 @@ def index():
             return redirect(url_for('faculty.dashboard'))
     return redirect(url_for('auth.login'))
 
+@bp.route('/metrics')
+def worker_metrics():
+    # Counters are per worker process; disabled unless explicitly enabled
+    if not current_app.config.get('METRICS_ENDPOINT_ENABLED'):
+        abort(404)
+    return jsonify(metrics.snapshot())
+
 @bp.route('/uploads/<path:filename>')
 @login_required
+@read_only
 def uploaded_file(filename):
+    # Only logical document paths are served, never the store's own directories
+    if filename.startswith((INCOMING_DIR + '/', BlobStore.DIRECTORY + '/', ResumableUploads.DIRECTORY + '/')):
+        abort(404)
+    # Links from the dashboards carry a signed grant, checked without the database
+    grant = verify_download(filename, request.args.get(TOKEN_ARG), current_user.id)
+    if grant is not None:
+        metrics.incr('downloads.signed')
+        return _serve(filename, grant.sha256)
     # Security check - verify if user has access to the file
     if filename.startswith('reviews/'):
         # For review files, check if user is faculty or the student who owns the reviewed document
@@ -30,26 +56,100 @@ def uploaded_file(filename):
             abort(403)
         elif current_user.role == 'student' and document.uploader_id != current_user.id:
             abort(403)
+        sha256 = {document.review_file1_path: document.review_file1_sha256,
+                  document.review_file2_path: document.review_file2_sha256}.get(filename)
     else:
         # For student uploads, check if user owns the file or is assigned faculty
         student_id = filename.split('/')[0].split('_')[1]
         if current_user.role == 'student' and str(current_user.id) != student_id:
             abort(403)
-        elif current_user.role == 'faculty':
-            document = Document.query.filter_by(file_path=filename).first()
-            if not document or document.assigned_faculty_id != current_user.id:
-                abort(403)
+        document = Document.query.filter_by(file_path=filename).first()
+        if current_user.role == 'faculty' and (not document or document.assigned_faculty_id != current_user.id):
+            abort(403)
+        sha256 = document.sha256 if document else None
+
+    return _serve(filename, sha256)
 
+def _serve(filename, sha256):
     try:
-        upload_path = current_app.config['UPLOAD_FOLDER']
-        if not os.path.isabs(upload_path):
-            upload_path = os.path.abspath(upload_path)
-        
-        file_path = os.path.join(upload_path, filename)
-        directory = os.path.dirname(file_path)
-        file_name = os.path.basename(file_path)
-        
-        return send_from_directory(directory, file_name)
+        return _send_upload(filename, sha256)
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error serving file {filename}: {str(e)}")
         abort(404)
+
+def _send_upload(filename, sha256):
+    """Respond with the content behind a logical upload path.
+
+    The content digest is the ETag, so a client revalidating its copy gets
+    a 304 without the file being opened; Range requests are answered with
+    206 partial content. With DOWNLOAD_OFFLOAD the front proxy sends the
+    bytes instead.
+    """
+    if sha256 and sha256 in request.if_none_match:
+        metrics.incr('downloads.not_modified')
+        response = current_app.response_class(status=304)
+        response.set_etag(sha256)
+        response.cache_control.private = True
+        response.cache_control.no_cache = True
+        return response
+
+    # The blob holding the content, or the file itself if it predates the blob store
+    file_path = blob_store.locate(filename, sha256)
+    if file_path is None or not os.path.isfile(file_path):
+        abort(404)
+    download_name = os.path.basename(filename)
+
+    if current_app.config.get('DOWNLOAD_OFFLOAD') == 'x-accel-redirect':
+        # nginx serves the file from an internal location aliased to UPLOAD_FOLDER
+        prefix = current_app.config['DOWNLOAD_ACCEL_PREFIX'].rstrip('/')
+        relative = os.path.relpath(file_path, upload_root()).replace(os.sep, '/')
+        response = current_app.response_class(
+            mimetype=mimetypes.guess_type(download_name)[0] or 'application/octet-stream'
+        )
+        response.headers['X-Accel-Redirect'] = f"{prefix}/{quote(relative)}"
+        response.headers['Content-Disposition'] = f"inline; filename={quote(download_name)}"
+        if sha256:
+            response.set_etag(sha256)
+        metrics.incr('downloads.offloaded')
+    else:
+        # send_file emits X-Sendfile itself when DOWNLOAD_OFFLOAD is x-sendfile (USE_X_SENDFILE)
+        response = send_file(file_path, download_name=download_name, etag=sha256 or True, conditional=True)
+        # Advertised on full responses too, PDF viewers look for it before fetching by range
+        response.accept_ranges = 'bytes'
+        metrics.incr('downloads.offloaded' if current_app.config.get('USE_X_SENDFILE') else 'downloads.served')
+    # Authorization may change, so shared caches must not keep the file and browsers revalidate
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    response.cache_control.public = None
+    return response
+
+@bp.route('/resumable/<upload_id>', methods=['GET', 'HEAD', 'DELETE'])
+@login_required
+@limiter.exempt
+def resumable_upload(upload_id):
+    """Offset of an upload session (GET/HEAD), or abandon it (DELETE)"""
+    try:
+        meta = resumable_uploads.get(upload_id, current_user.id)
+    except UploadSessionError as e:
+        return jsonify(error=str(e)), e.status
+    if request.method == 'DELETE':
+        resumable_uploads.discard(meta)
+        return '', 204
+    status = resumable_uploads.status(meta)
+    return jsonify(status), 200, {'Upload-Offset': str(status['offset'])}
+
+@bp.route('/resumable/<upload_id>/<int:index>', methods=['PUT'])
+@login_required
+@limiter.exempt
+def resumable_chunk(upload_id, index):
+    """Receive one chunk; the body is the raw bytes, X-Chunk-SHA256 their hex digest"""
+    try:
+        meta = resumable_uploads.get(upload_id, current_user.id)
+        resumable_uploads.write_chunk(meta, index, request.stream, request.content_length,
+                                      request.headers.get('X-Chunk-SHA256'))
+    except UploadSessionError as e:
+        return jsonify(error=str(e)), e.status
+    status = resumable_uploads.status(meta)
+    return jsonify(status), 200, {'Upload-Offset': str(status['offset'])}
@@ -4,6 +4,7 @@ from sqlalchemy.exc import OperationalError, SQLAlchemyError
 from flask import current_app
 import logging
 from . import db, login_manager
+from app.utils.identity_cache import identity_cache, CachedUser
 
 logger = logging.getLogger(__name__)
 
@@ -35,6 +36,8 @@ class Document(db.Model):
     file_type = db.Column(db.String(50), nullable=False)
     upload_date = db.Column(db.DateTime, default=datetime.utcnow)
     status = db.Column(db.String(20), default='pending_review')  # pending_review, reviewed
+    sha256 = db.Column(db.String(64), nullable=True)  # Hex digest of the uploaded file, names its blob
+    file_size = db.Column(db.BigInteger, nullable=True)  # Bytes
     
     # Foreign Keys
     uploader_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
@@ -44,17 +47,97 @@ class Document(db.Model):
     # Review Documents
     review_file1_path = db.Column(db.String(512), nullable=True)
     review_file2_path = db.Column(db.String(512), nullable=True)
+    review_file1_sha256 = db.Column(db.String(64), nullable=True)  # Blobs behind the review files
+    review_file2_sha256 = db.Column(db.String(64), nullable=True)
     review_date = db.Column(db.DateTime, nullable=True)
+
+    # Indexes for the dashboard queries and the file_path lookup in uploaded_file
+    __table_args__ = (
+        db.Index('ix_document_uploader_id_upload_date', 'uploader_id', 'upload_date'),
+        db.Index('ix_document_pending_review', 'assigned_faculty_id', 'upload_date',
+                 postgresql_where=db.text("status = 'pending_review'"),
+                 sqlite_where=db.text("status = 'pending_review'")),
+        db.Index('ix_document_faculty_reviewer_status_review_date',
+                 'assigned_faculty_id', 'reviewer_id', 'status', 'review_date'),
+        db.Index('ix_document_file_path', 'file_path', unique=True),
+    )
     
     def __repr__(self):
         return f'<Document {self.original_filename}>'
 
+class Blob(db.Model):
+    """File content in the blob store, shared by every document path with the same bytes"""
+    sha256 = db.Column(db.String(64), primary_key=True)
+    size = db.Column(db.BigInteger, nullable=False)
+    ref_count = db.Column(db.Integer, nullable=False, default=0)  # Document paths naming this blob
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    released_at = db.Column(db.DateTime, nullable=True)  # When ref_count last dropped to zero
+
+    def __repr__(self):
+        return f'<Blob {self.sha256[:12]} refs={self.ref_count}>'
+
+class OutboxEmail(db.Model):
+    """An email committed together with the change it announces, see app/utils/outbox.py"""
+    __tablename__ = 'email_outbox'
+    id = db.Column(db.Integer, primary_key=True)
+    idempotency_key = db.Column(db.String(255), nullable=False, unique=True)  # Also the Message-ID
+    sender = db.Column(db.String(255), nullable=False)
+    recipient = db.Column(db.String(255), nullable=False)
+    subject = db.Column(db.String(255), nullable=False)
+    body = db.Column(db.Text, nullable=False)
+    html = db.Column(db.Text, nullable=True)
+    status = db.Column(db.String(20), nullable=False, default='pending')  # pending, sent, failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    next_attempt_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    last_error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    sent_at = db.Column(db.DateTime, nullable=True)
+
+    # The sender's scan for due messages
+    __table_args__ = (
+        db.Index('ix_email_outbox_due', 'next_attempt_at',
+                 postgresql_where=db.text("status = 'pending'"),
+                 sqlite_where=db.text("status = 'pending'")),
+    )
+
+    def __repr__(self):
+        return f'<OutboxEmail {self.id} {self.status}>'
+
+class NotificationEvent(db.Model):
+    """Something to tell a user about in their next digest, see app/utils/notifications.py"""
+    __tablename__ = 'notification_event'
+    id = db.Column(db.Integer, primary_key=True)
+    recipient_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    kind = db.Column(db.String(20), nullable=False)  # review, submission
+    document_id = db.Column(db.Integer, db.ForeignKey('document.id'), nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    document = db.relationship('Document')
+
+    __table_args__ = (
+        db.Index('ix_notification_event_recipient_kind', 'recipient_id', 'kind', 'created_at'),
+    )
+
+    def __repr__(self):
+        return f'<NotificationEvent {self.kind} for {self.recipient_id}>'
+
 @login_manager.user_loader
 def load_user(user_id):
+    # Steady state: the identity comes from the cache, no database round trip
+    fields = identity_cache.get(user_id)
+    if fields is not None:
+        return CachedUser(**fields)
+
     retries = 3
     while retries > 0:
         try:
-            return User.query.get(int(user_id))
+            user = User.query.get(int(user_id))
+            if user is None or not identity_cache.enabled:
+                return user
+            # Same type whether or not the cache was hit
+            cached = CachedUser.from_user(user)
+            identity_cache.put(user.id, cached.to_dict())
+            return cached
         except OperationalError as e:
             retries -= 1
             logger.warning(f"Database connection error, retries left: {retries}. Error: {str(e)}")
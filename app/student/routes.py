@@ -1,11 +1,21 @@
-from flask import render_template, flash, redirect, url_for, request, current_app
+from flask import render_template, flash, redirect, url_for, request, current_app, abort, jsonify
 from flask_login import login_required, current_user
 from app import db, limiter
 from app.student import bp
 from app.models import Document, User
 from app.config import Config
-from app.utils.file_utils import allowed_file, save_file
+from app.utils.file_utils import allowed_file, save_file, unique_filename
+from app.utils.blob_store import blob_store
+from app.utils.pagination import paginate_keyset, paginate_keyset_async, InvalidCursor
+from app.utils.faculty_directory import faculty_directory
+from app.utils.notifications import notification_digests, SUBMISSION
+from app.utils.db_routing import read_only
+from app.asgi import native_view
+from app.utils.resumable import resumable_uploads, UploadSessionError
+from werkzeug.datastructures import FileStorage
 from werkzeug.utils import secure_filename
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
 import os
 import logging
 
@@ -13,17 +23,80 @@ logger = logging.getLogger(__name__)
 
 @bp.route('/student/dashboard')
 @login_required
+@read_only
 def dashboard():
     if current_user.role != 'student':
         logger.warning(f"Non-student user {current_user.id} attempted to access student dashboard")
         flash('Access denied. Students only.', 'danger')
         return redirect(url_for('main.index'))
     
-    documents = Document.query.filter_by(uploader_id=current_user.id).order_by(
-        Document.upload_date.desc()
-    ).all()
+    try:
+        documents = paginate_keyset(
+            Document.query.filter_by(uploader_id=current_user.id),
+            Document.upload_date,
+            cursor=request.args.get('cursor'),
+            per_page=current_app.config['DOCUMENTS_PER_PAGE']
+        )
+    except InvalidCursor:
+        abort(400)
     return render_template('student/dashboard.html', documents=documents)
 
+@native_view('student.dashboard')
+async def dashboard_async(db):
+    """dashboard on the ASGI event loop"""
+    if current_user.role != 'student':
+        return None
+    try:
+        documents = await paginate_keyset_async(
+            db,
+            select(Document).filter_by(uploader_id=current_user.id),
+            Document.upload_date,
+            cursor=request.args.get('cursor'),
+            per_page=current_app.config['DOCUMENTS_PER_PAGE']
+        )
+    except InvalidCursor:
+        return None
+    return render_template('student/dashboard.html', documents=documents)
+
+def _store_document(file, faculty):
+    """Save an uploaded file and record it as a document for faculty to review"""
+    # Save file with student's ID in the path
+    directory = f"student_{current_user.id}"
+    saved = save_file(file, directory)
+    
+    for attempt in range(2):
+        # Create document record
+        document = Document(
+            filename=saved.filename,
+            original_filename=secure_filename(file.filename),
+            file_path=os.path.join(directory, saved.filename),
+            file_type=file.filename.rsplit('.', 1)[1].lower(),
+            sha256=saved.sha256,
+            file_size=saved.size,
+            uploader_id=current_user.id,
+            assigned_faculty_id=faculty['id']
+        )
+        
+        db.session.add(document)
+        # Faculty hear about new submissions in their digest, when digests are enabled
+        if notification_digests.enabled:
+            notification_digests.record(faculty['id'], SUBMISSION, document)
+        try:
+            db.session.commit()
+            break
+        except IntegrityError:
+            db.session.rollback()
+            if attempt:
+                raise
+            # The logical name was taken (file_path is unique); the content is already
+            # stored, so count the rolled-back blob reference again under a new name
+            logger.warning(f"File path {document.file_path} already in use, retrying with a new name")
+            blob_store.add_ref(saved.sha256, saved.size)
+            saved = saved._replace(filename=unique_filename(file.filename))
+    
+    logger.info(f"Document {saved.filename} uploaded successfully by user {current_user.id}")
+    return document
+
 @bp.route('/student/upload_document', methods=['GET', 'POST'])
 @login_required
 @limiter.limit(Config.UPLOAD_RATELIMIT)
@@ -33,8 +106,8 @@ def upload_document():
         flash('Access denied. Students only.', 'danger')
         return redirect(url_for('main.index'))
 
-    # Get list of faculty members for dropdown
-    faculties = User.query.filter_by(role='faculty').order_by(User.first_name).all()
+    # Get list of faculty members for dropdown (cached, see faculty_directory)
+    faculties = faculty_directory.all()
     
     if request.method == 'POST':
         # Validate faculty selection
@@ -43,7 +116,7 @@ def upload_document():
             flash('Please select a faculty member', 'danger')
             return redirect(request.url)
             
-        faculty = User.query.filter_by(id=faculty_id, role='faculty').first()
+        faculty = faculty_directory.get(faculty_id)
         if not faculty:
             flash('Invalid faculty selection', 'danger')
             return redirect(request.url)
@@ -62,24 +135,7 @@ def upload_document():
             return redirect(request.url)
         
         try:
-            # Save file with student's ID in the path
-            directory = f"student_{current_user.id}"
-            filename = save_file(file, directory)
-            
-            # Create document record
-            document = Document(
-                filename=filename,
-                original_filename=secure_filename(file.filename),
-                file_path=os.path.join(directory, filename),
-                file_type=file.filename.rsplit('.', 1)[1].lower(),
-                uploader_id=current_user.id,
-                assigned_faculty_id=faculty.id
-            )
-            
-            db.session.add(document)
-            db.session.commit()
-            
-            logger.info(f"Document {filename} uploaded successfully by user {current_user.id}")
+            _store_document(file, faculty)
             flash('Document uploaded successfully', 'success')
             return redirect(url_for('student.dashboard'))
             
@@ -90,8 +146,65 @@ def upload_document():
     
     return render_template('student/upload.html', faculties=faculties)
 
+@bp.route('/student/upload_document/resumable', methods=['POST'])
+@login_required
+@limiter.limit(Config.UPLOAD_RATELIMIT)
+def start_resumable_upload():
+    """Open a resumable upload session, see app/utils/resumable.py"""
+    if current_user.role != 'student':
+        return jsonify(error='Students only'), 403
+    
+    data = request.get_json(silent=True) or {}
+    filename = data.get('filename') or ''
+    if not allowed_file(filename):
+        return jsonify(error='File type not allowed. Allowed types: ' +
+                       ', '.join(current_app.config['ALLOWED_EXTENSIONS'])), 400
+    faculty = faculty_directory.get(data.get('faculty'))
+    if not faculty:
+        return jsonify(error='Invalid faculty selection'), 400
+    
+    try:
+        meta = resumable_uploads.create(current_user.id, filename, data.get('size'),
+                                        {'faculty_id': faculty['id']})
+    except UploadSessionError as e:
+        return jsonify(error=str(e)), e.status
+    complete_url = url_for('student.complete_resumable_upload', upload_id=meta['id'])
+    return jsonify(resumable_uploads.describe(meta, complete_url)), 201
+
+@bp.route('/student/upload_document/resumable/<upload_id>/complete', methods=['POST'])
+@login_required
+@limiter.exempt
+def complete_resumable_upload(upload_id):
+    """Turn a fully received upload session into a document"""
+    if current_user.role != 'student':
+        return jsonify(error='Students only'), 403
+    
+    try:
+        meta = resumable_uploads.get(upload_id, current_user.id)
+        faculty = faculty_directory.get(meta['target']['faculty_id'])
+        if not faculty:
+            raise UploadSessionError('Invalid faculty selection')
+        ingest = resumable_uploads.claim(meta)
+    except UploadSessionError as e:
+        return jsonify(error=str(e)), e.status
+    
+    try:
+        document = _store_document(FileStorage(stream=ingest, filename=meta['filename']), faculty)
+    except Exception as e:
+        logger.error(f"Error completing resumable upload {upload_id}: {str(e)}")
+        db.session.rollback()
+        ingest.close()
+        resumable_uploads.unclaim(meta)
+        return jsonify(error='Error uploading document'), 500
+    ingest.close()
+    resumable_uploads.discard(meta)
+    
+    flash('Document uploaded successfully', 'success')
+    return jsonify(document_id=document.id, redirect=url_for('student.dashboard')), 201
+
 @bp.route('/student/document/<int:id>')
 @login_required
+@read_only
 def view_document(id):
     if current_user.role != 'student':
         logger.warning(f"Non-student user {current_user.id} attempted to view document {id}")
@@ -1,59 +1,121 @@
 import asyncio
+import contextvars
 import os
-from functools import wraps
-from flask import current_app
+import threading
+import logging
 
-def async_route(f):
-    """Decorator to make async route handlers work with Flask"""
-    @wraps(f)
-    def wrapper(*args, **kwargs):
+logger = logging.getLogger(__name__)
+
+class BackgroundLoop:
+    """Long-lived event loop running in its own daemon thread.
+
+    Synchronous code submits coroutines with run() and blocks only the
+    calling thread or greenlet, so concurrent requests share the loop and
+    their I/O overlaps instead of each driving a private loop. The loop is
+    started lazily and restarted after a fork, so gunicorn workers each get
+    their own.
+    """
+
+    def __init__(self, loop_factory=None):
+        self.loop_factory = loop_factory or asyncio.new_event_loop
+        self._loop = None
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    @property
+    def loop(self):
+        """Return the running background loop, starting it if needed"""
+        if self._loop is None or self._pid != os.getpid() or not self._thread.is_alive():
+            with self._lock:
+                if self._loop is None or self._pid != os.getpid() or not self._thread.is_alive():
+                    self._start()
+        return self._loop
+
+    def _start(self):
+        loop = self.loop_factory()
+        ready = threading.Event()
+        thread = threading.Thread(target=self._run, args=(loop, ready),
+                                  name='edusync-async-loop', daemon=True)
+        thread.start()
+        ready.wait()
+        self._loop, self._thread, self._pid = loop, thread, os.getpid()
+        logger.debug(f"Background event loop started in process {self._pid}")
+
+    @staticmethod
+    def _run(loop, ready):
+        asyncio.set_event_loop(loop)
+        loop.call_soon(ready.set)
+        try:
+            loop.run_forever()
+        finally:
+            loop.close()
+
+    def in_loop_thread(self):
+        """Check whether the caller is running on the background loop"""
+        return self._thread is not None and threading.current_thread() is self._thread
+
+    def submit(self, coro):
+        """Schedule a coroutine on the loop and return a concurrent Future.
+
+        The caller's context variables (Flask app/request context) are
+        copied into the task.
+        """
+        context = contextvars.copy_context()
+        return asyncio.run_coroutine_threadsafe(self._in_context(coro, context), self.loop)
+
+    @staticmethod
+    async def _in_context(coro, context):
+        # A task runs in a copy of the context it is created in; cancelling
+        # the wrapper cancels the awaited task too
+        return await context.run(asyncio.ensure_future, coro)
+
+    def run(self, coro, timeout=None):
+        """Run a coroutine on the loop and block until it finishes"""
+        if self.in_loop_thread():
+            coro.close()
+            raise RuntimeError("Cannot block on the background loop from inside it; await instead")
+        future = self.submit(coro)
         try:
-            # First try to get existing loop
-            try:
-                loop = asyncio.get_event_loop()
-                if loop.is_closed():
-                    raise RuntimeError("Loop is closed")
-            except RuntimeError:
-                # If there's no loop or it's closed, create a new one
-                loop = asyncio.new_event_loop()
-                asyncio.set_event_loop(loop)
-            
-            # Run the async function in the event loop
-            with current_app.app_context():
-                result = loop.run_until_complete(f(*args, **kwargs))
-                
-            return result
-        
-        except Exception as e:
-            current_app.logger.error(f"Error in async route: {str(e)}", exc_info=True)
+            return future.result(timeout)
+        except TimeoutError:
+            future.cancel()
             raise
-        
-    return wrapper
+
+    async def run_async(self, coro, timeout=None):
+        """Await a coroutine on the loop from another event loop (the ASGI server's)"""
+        return await asyncio.wait_for(asyncio.wrap_future(self.submit(coro)), timeout)
+
+    def stop(self):
+        """Stop the loop and wait for its thread to exit"""
+        with self._lock:
+            if self._loop is not None and self._pid == os.getpid() and self._thread.is_alive():
+                self._loop.call_soon_threadsafe(self._loop.stop)
+                self._thread.join(timeout=5)
+            self._loop = self._thread = self._pid = None
+
+# One loop per worker process
+background_loop = BackgroundLoop()
+
+def run_sync(coro, timeout=None):
+    """Run a coroutine on the worker's background loop and return its result"""
+    return background_loop.run(coro, timeout=timeout)
 
 def setup_async(app=None):
     """Setup async environment based on FLASK_ENV"""
     env = os.getenv('FLASK_ENV', 'production')
-    
-    try:
-        if env == 'production':
-            # Use default event loop policy for production
-            policy = asyncio.get_event_loop_policy()
-            loop = policy.new_event_loop()
-            asyncio.set_event_loop(loop)
-        else:
-            # Use uvloop in development if available
-            try:
-                import uvloop
-                uvloop.install()
-            except ImportError:
-                pass
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-    except Exception as e:
-        if app:
-            app.logger.error(f"Error setting up async environment: {str(e)}")
-        # Fallback to default event loop
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-    
-    return loop
+
+    # No loop is created here: the background loop starts on first use in
+    # each worker, after gunicorn has forked and gevent has patched threading
+    if env != 'production':
+        # Use uvloop in development if available
+        try:
+            import uvloop
+            background_loop.loop_factory = uvloop.new_event_loop
+        except ImportError:
+            pass
+
+    if app:
+        app.extensions['background_loop'] = background_loop
+
+    return background_loop
@@ -0,0 +1,279 @@
+import hashlib
+import logging
+import os
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import func, insert, or_, select, update
+from sqlalchemy.exc import IntegrityError
+from werkzeug.security import safe_join
+from app.utils.file_utils import COPY_CHUNK_SIZE, INCOMING_DIR, IngestFile, upload_root
+from app.utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Document columns holding a logical path, and the digest of the blob behind it
+FILE_COLUMNS = (
+    ('file_path', 'sha256'),
+    ('review_file1_path', 'review_file1_sha256'),
+    ('review_file2_path', 'review_file2_sha256'),
+)
+
+def file_sha256(path):
+    """Hex SHA-256 of a file, read in chunks"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(COPY_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+class BlobStore:
+    """Content-addressed storage for uploaded files.
+
+    Each distinct content is stored once, as UPLOAD_FOLDER/blobs/ab/cd/<sha256>.
+    Documents keep their logical paths (student_<id>/..., reviews/document_<id>/...)
+    and name the blob behind each one by digest; Blob.ref_count counts those
+    references. Files uploaded before the store existed keep being served
+    from their logical path until migrate_legacy() moves them.
+
+    Counts can be low for files uploaded before the store existed (see
+    migrate_legacy), so collect_garbage() recounts the actual references
+    under a row lock before deleting anything.
+    """
+
+    DIRECTORY = 'blobs'
+
+    def __init__(self, gc_grace=3600):
+        self.gc_grace = float(gc_grace)
+
+    def init_app(self, app):
+        self.gc_grace = float(app.config.get('BLOB_GC_GRACE_SECONDS', 3600))
+        app.extensions['blob_store'] = self
+
+    def root(self):
+        return os.path.join(upload_root(), self.DIRECTORY)
+
+    def path(self, sha256):
+        """Absolute path of the blob with this digest"""
+        return os.path.join(self.root(), sha256[:2], sha256[2:4], sha256)
+
+    def exists(self, sha256):
+        return os.path.isfile(self.path(sha256))
+
+    def locate(self, logical_path, sha256=None):
+        """File to serve for a logical path: its blob, else the pre-blob-store file"""
+        if sha256 and self.exists(sha256):
+            return self.path(sha256)
+        return safe_join(upload_root(), logical_path)
+
+    def add_ref(self, sha256, size):
+        """Count one more reference to a blob, creating its row if needed.
+
+        Runs in the caller's transaction; the row stays locked until it ends,
+        which keeps collect_garbage() away from the blob meanwhile.
+        """
+        from app import db
+        from app.models import Blob
+        increment = update(Blob).where(Blob.sha256 == sha256).values(
+            ref_count=Blob.ref_count + 1, released_at=None
+        ).execution_options(synchronize_session=False)
+        if db.session.execute(increment).rowcount:
+            return
+        try:
+            with db.session.begin_nested():
+                db.session.execute(insert(Blob).values(
+                    sha256=sha256, size=size, ref_count=1, created_at=datetime.utcnow()
+                ))
+        except IntegrityError:
+            # Another request created the row first
+            db.session.execute(increment)
+
+    def release(self, sha256):
+        """Drop one reference; unreferenced blobs are deleted by collect_garbage()"""
+        from app import db
+        from app.models import Blob
+        db.session.execute(update(Blob).where(Blob.sha256 == sha256, Blob.ref_count > 0).values(
+            ref_count=Blob.ref_count - 1
+        ).execution_options(synchronize_session=False))
+        db.session.execute(update(Blob).where(Blob.sha256 == sha256, Blob.ref_count == 0).values(
+            released_at=datetime.utcnow()
+        ).execution_options(synchronize_session=False))
+
+    def store(self, ingest):
+        """Reference the content of an IngestFile, writing it only if it is new.
+
+        Returns True when the content was already stored, in which case the
+        temporary file is left for its owner to close (and delete).
+        """
+        sha256 = ingest.sha256
+        self.add_ref(sha256, ingest.size)
+        path = self.path(sha256)
+        if os.path.isfile(path):
+            metrics.incr('blobs.deduplicated')
+            return True
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        ingest.commit(path)
+        metrics.incr('blobs.stored')
+        return False
+
+    def _adopt(self, legacy_path, sha256):
+        """Put an existing file's content into the store without copying if possible"""
+        path = self.path(sha256)
+        if os.path.isfile(path):
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        try:
+            os.link(legacy_path, path)
+            return
+        except FileExistsError:
+            return
+        except OSError:
+            pass  # No hard links on this filesystem
+        ingest = IngestFile(os.path.join(upload_root(), INCOMING_DIR))
+        try:
+            with open(legacy_path, 'rb') as f:
+                for chunk in iter(lambda: f.read(COPY_CHUNK_SIZE), b''):
+                    ingest.write(chunk)
+            ingest.commit(path)
+        finally:
+            ingest.close()
+
+    def migrate_legacy(self, batch_size=100):
+        """Move files stored at their logical path into the store, online.
+
+        Each file is linked into the store and its document updated in one
+        commit; the old file is removed only once the read replica (if any)
+        shows the new digest too, so readers find the content at every step.
+        Safe to interrupt and re-run. Returns the number of files moved.
+        """
+        from app import db
+        from app.models import Document
+        migrated = 0
+        last_id = 0
+        while True:
+            documents = Document.query.filter(Document.id > last_id).order_by(Document.id).limit(batch_size).all()
+            if not documents:
+                return migrated
+            last_id = documents[-1].id
+            # Legacy file -> the (document id, digest column, digest) references now pointing at its blob;
+            # one file can back several columns, e.g. the same review file in both slots
+            moved = {}
+            for document in documents:
+                for path_column, sha_column in FILE_COLUMNS:
+                    logical_path = getattr(document, path_column)
+                    legacy_path = logical_path and safe_join(upload_root(), logical_path)
+                    if not legacy_path or not os.path.isfile(legacy_path):
+                        continue
+                    known = getattr(document, sha_column)
+                    if known and self.exists(known):
+                        # Moved by an interrupted run, or uploaded when hashes were recorded
+                        # but blobs were not: the reference may already be counted, and an
+                        # undercount is corrected by collect_garbage()
+                        moved.setdefault(legacy_path, []).append((document.id, sha_column, known))
+                        continue
+                    sha256 = file_sha256(legacy_path)
+                    self._adopt(legacy_path, sha256)
+                    self.add_ref(sha256, os.path.getsize(legacy_path))
+                    setattr(document, sha_column, sha256)
+                    moved.setdefault(legacy_path, []).append((document.id, sha_column, sha256))
+                db.session.commit()
+            for legacy_path in self._replicated(moved):
+                try:
+                    os.unlink(legacy_path)
+                except FileNotFoundError:
+                    continue
+                migrated += 1
+                metrics.incr('blobs.migrated')
+            db.session.expunge_all()
+
+    def _replicated(self, moved):
+        """The legacy files of moved whose new digests the read replica already shows.
+
+        Waits up to REPLICA_MAX_LAG_SECONDS; files still unconfirmed then are
+        kept, and removed by the next run.
+        """
+        from app.models import Document
+        from app.utils.db_routing import replica_router
+        if not moved or not replica_router.enabled:
+            return list(moved)
+        table = Document.__table__
+        columns = [table.c.id] + [table.c[sha_column] for _, sha_column in FILE_COLUMNS]
+        ids = {document_id for references in moved.values() for document_id, _, _ in references}
+        deadline = time.monotonic() + replica_router.max_lag
+        while True:
+            with replica_router.engine.connect() as conn:
+                rows = {row.id: row for row in conn.execute(select(*columns).where(table.c.id.in_(ids)))}
+            seen = [legacy_path for legacy_path, references in moved.items()
+                    if all(document_id in rows and getattr(rows[document_id], sha_column) == sha256
+                           for document_id, sha_column, sha256 in references)]
+            if len(seen) == len(moved) or time.monotonic() >= deadline:
+                if len(seen) < len(moved):
+                    logger.warning(f"Replica has not caught up; keeping {len(moved) - len(seen)} legacy files for the next run")
+                return seen
+            time.sleep(0.5)
+
+    def _reference_count(self, sha256):
+        from app import db
+        from app.models import Document
+        return db.session.scalar(select(func.count()).select_from(Document).where(or_(
+            Document.sha256 == sha256,
+            Document.review_file1_sha256 == sha256,
+            Document.review_file2_sha256 == sha256,
+        )))
+
+    def collect_garbage(self, grace=None):
+        """Delete blobs unreferenced for longer than grace seconds, and orphaned files.
+
+        Returns the number of files deleted.
+        """
+        from app import db
+        from app.models import Blob
+        grace = self.gc_grace if grace is None else float(grace)
+        cutoff = datetime.utcnow() - timedelta(seconds=grace)
+        deleted = 0
+
+        candidates = db.session.scalars(select(Blob.sha256).where(
+            Blob.ref_count <= 0, func.coalesce(Blob.released_at, Blob.created_at) < cutoff
+        )).all()
+        for sha256 in candidates:
+            blob = db.session.scalar(select(Blob).where(Blob.sha256 == sha256).with_for_update())
+            if blob is None or blob.ref_count > 0:
+                db.session.rollback()
+                continue
+            references = self._reference_count(sha256)
+            if references:
+                blob.ref_count = references
+                blob.released_at = None
+                logger.warning(f"Blob {sha256} had {references} uncounted references")
+            else:
+                # Gone from disk before the row, so an upload waiting on the lock writes it again
+                try:
+                    os.unlink(self.path(sha256))
+                    deleted += 1
+                except FileNotFoundError:
+                    pass
+                db.session.delete(blob)
+            db.session.commit()
+
+        # Files whose row never committed (failed uploads); recent ones may still be committing
+        old_files = []
+        file_cutoff = time.time() - grace
+        for directory, _, files in os.walk(self.root()):
+            for name in files:
+                path = os.path.join(directory, name)
+                try:
+                    if os.path.getmtime(path) < file_cutoff:
+                        old_files.append((name, path))
+                except FileNotFoundError:
+                    pass
+        for start in range(0, len(old_files), 500):
+            chunk = old_files[start:start + 500]
+            known = set(db.session.scalars(select(Blob.sha256).where(Blob.sha256.in_([name for name, _ in chunk]))))
+            for name, path in chunk:
+                if name not in known:
+                    os.unlink(path)
+                    deleted += 1
+        metrics.incr('blobs.collected', deleted)
+        return deleted
+
+# One store per worker process
+blob_store = BlobStore()
@@ -0,0 +1,164 @@
+import logging
+import threading
+import time
+from flask import current_app, g, has_request_context, request, session
+from flask_sqlalchemy.session import Session as FlaskSession
+from sqlalchemy import event, text
+from sqlalchemy.orm import Session
+from sqlalchemy.sql import Select
+from app.utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# SQLALCHEMY_BINDS key of the read replica engine
+REPLICA_BIND = 'replica'
+# Session key holding when the user's last write was committed (epoch seconds)
+WRITE_KEY = '_db_write_at'
+
+# Seconds the replica is behind; zero when it has replayed everything it received,
+# since the last replay timestamp stops moving while the primary is idle
+LAG_SQL = text("""
+    SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+                ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+           END
+""")
+
+def read_only(f):
+    """Decorator to let a view's queries be served by the read replica.
+
+    Only GET and HEAD requests are routed, and only while the user has not
+    written recently. Wrappers built with functools.wraps copy the
+    attribute, so the decorator can go anywhere below @route.
+    """
+    f.read_only = True
+    return f
+
+class RoutingSession(FlaskSession):
+    """db.session class that sends the SELECTs of read-only requests to the replica.
+
+    Flushes, other statements, locking reads, and every query after the
+    request has flushed go to the primary, as does anything outside a
+    request routed by ReplicaRouter.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if (bind is None and not self._flushing and isinstance(clause, Select)
+                and clause._for_update_arg is None
+                and has_request_context() and g.get('_db_replica')):
+            engine = self._db.engines.get(REPLICA_BIND)
+            if engine is not None:
+                metrics.incr('db.replica_reads')
+                return engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+class ReplicaRouter:
+    """Decides per request whether @read_only views may read from the replica.
+
+    A request stays on the primary when the replica lags more than
+    max_lag, when its lag cannot be measured, or when the user committed a
+    write less than read_your_writes seconds ago (or the measured lag, if
+    longer), so nobody sees their own upload disappear. The write time is
+    kept in the user's session, and the lag is measured per worker at most
+    every check_interval seconds.
+    """
+
+    def __init__(self, read_your_writes=5, max_lag=30, check_interval=5):
+        self.read_your_writes = float(read_your_writes)
+        self.max_lag = float(max_lag)
+        self.check_interval = float(check_interval)
+        self.enabled = False
+        self.engine = None
+        self._lag = None
+        self._checked_at = None
+        self._lock = threading.Lock()
+
+    def init_app(self, app, db):
+        self.read_your_writes = float(app.config.get('REPLICA_READ_YOUR_WRITES_SECONDS', 5))
+        self.max_lag = float(app.config.get('REPLICA_MAX_LAG_SECONDS', 30))
+        self.check_interval = float(app.config.get('REPLICA_LAG_CHECK_INTERVAL', 5))
+        self._lag = None
+        self._checked_at = None
+        app.extensions['replica_router'] = self
+        with app.app_context():
+            self.engine = db.engines.get(REPLICA_BIND)
+        self.enabled = self.engine is not None
+        if not self.enabled:
+            return
+        _track_writes()
+        app.before_request(self._route_request)
+        app.after_request(self._remember_write)
+        app.logger.info("Read replica routing enabled for @read_only views")
+
+    def _measure(self):
+        if self.engine.dialect.name != 'postgresql':
+            return 0.0
+        with self.engine.connect() as conn:
+            return float(conn.execute(LAG_SQL).scalar() or 0)
+
+    def lag(self):
+        """Replica lag in seconds, or None while the replica is unreachable"""
+        now = time.monotonic()
+        if self._checked_at is not None and now - self._checked_at < self.check_interval:
+            return self._lag
+        # One request per worker re-measures, the others use the previous value
+        if not self._lock.acquire(blocking=False):
+            return self._lag
+        try:
+            try:
+                self._lag = self._measure()
+            except Exception as e:
+                logger.warning(f"Replica lag check failed, reading from the primary: {str(e)}")
+                self._lag = None
+            self._checked_at = time.monotonic()
+            return self._lag
+        finally:
+            self._lock.release()
+
+    def _use_replica(self):
+        if request.method not in ('GET', 'HEAD'):
+            return False
+        view = current_app.view_functions.get(request.endpoint)
+        if not getattr(view, 'read_only', False):
+            return False
+        lag = self.lag()
+        if lag is None or lag > self.max_lag:
+            metrics.incr('db.replica_bypassed')
+            return False
+        wrote_at = session.get(WRITE_KEY)
+        if wrote_at is not None and time.time() - wrote_at < max(self.read_your_writes, lag):
+            metrics.incr('db.read_your_writes')
+            return False
+        return True
+
+    def _route_request(self):
+        g._db_replica = self._use_replica()
+
+    def _remember_write(self, response):
+        wrote_at = g.pop('_db_write_at', None)
+        if wrote_at is not None:
+            session[WRITE_KEY] = round(wrote_at, 2)
+        return response
+
+# One router per worker process
+replica_router = ReplicaRouter()
+
+_WROTE_KEY = 'replica_router_wrote'
+
+def _record_flush(session, flush_context):
+    session.info[_WROTE_KEY] = True
+    if has_request_context():
+        g._db_replica = False  # The rest of the request reads its own writes from the primary
+
+def _record_commit(session):
+    if session.info.pop(_WROTE_KEY, False) and has_request_context():
+        g._db_write_at = time.time()
+
+def _discard_rolled_back(session):
+    session.info.pop(_WROTE_KEY, None)
+
+def _track_writes():
+    """Note committed writes so the user's next reads stay on the primary"""
+    if not event.contains(Session, 'after_flush', _record_flush):
+        event.listen(Session, 'after_flush', _record_flush)
+        event.listen(Session, 'after_commit', _record_commit)
+        event.listen(Session, 'after_rollback', _discard_rolled_back)
@@ -0,0 +1,78 @@
+import logging
+import time
+from collections import namedtuple
+from flask import current_app, url_for
+from flask_login import current_user
+from itsdangerous import URLSafeSerializer, BadSignature
+from app.utils.blob_store import FILE_COLUMNS
+from app.utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Query parameter carrying the signed grant
+TOKEN_ARG = 'token'
+
+# What a valid token lets its viewer download
+DownloadGrant = namedtuple('DownloadGrant', 'document_id viewer_id expires sha256')
+
+def _serializer(filename):
+    # The logical path is part of the salt, so a token only works for the file it was issued for
+    return URLSafeSerializer(current_app.secret_key, salt=f'download-url:{filename}')
+
+def _may_view(document, user):
+    # Same rules uploaded_file applies with its database check
+    if user.role == 'student':
+        return document.uploader_id == user.id
+    return document.assigned_faculty_id == user.id
+
+def _expiry(now=None):
+    """Expiry for tokens issued now, between one and two DOWNLOAD_URL_TTL ahead.
+
+    Rounded to the TTL so the URL of a file stays the same for a while and
+    browsers can reuse (and revalidate) their cached copy.
+    """
+    ttl = int(current_app.config.get('DOWNLOAD_URL_TTL', 900))
+    now = time.time() if now is None else now
+    return (int(now) // ttl + 2) * ttl
+
+def download_url(document, column='file_path'):
+    """URL of one of a document's files, signed for the logged-in viewer.
+
+    column is the path column (file_path, review_file1_path or
+    review_file2_path). Links for viewers the document is not visible to,
+    or with DOWNLOAD_URL_TTL set to 0, are left unsigned and get the full
+    check in uploaded_file.
+    """
+    filename = getattr(document, column)
+    if not filename:
+        return None
+    sha_column = dict(FILE_COLUMNS)[column]
+    if (not current_app.config.get('DOWNLOAD_URL_TTL') or not current_user.is_authenticated
+            or not _may_view(document, current_user)):
+        return url_for('main.uploaded_file', filename=filename)
+    token = _serializer(filename).dumps(
+        [document.id, current_user.id, _expiry(), getattr(document, sha_column)]
+    )
+    return url_for('main.uploaded_file', filename=filename, **{TOKEN_ARG: token})
+
+def verify_download(filename, token, user_id):
+    """The DownloadGrant in token if it is valid for filename and user_id, else None.
+
+    Only CPU work: the signature, the viewer and the expiry are checked
+    without touching the database. Expired or foreign tokens return None,
+    leaving the caller to authorize the request the slow way.
+    """
+    if not token:
+        return None
+    try:
+        grant = DownloadGrant(*_serializer(filename).loads(token))
+    except (BadSignature, TypeError, ValueError):
+        metrics.incr('downloads.bad_token')
+        return None
+    if grant.viewer_id != user_id:
+        metrics.incr('downloads.bad_token')
+        return None
+    if grant.expires < time.time():
+        metrics.incr('downloads.expired_token')
+        return None
+    return grant
@@ -0,0 +1,130 @@
+import json
+import logging
+import threading
+import time
+from app.utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+def _entry(user):
+    return {'id': user.id, 'first_name': user.first_name, 'last_name': user.last_name, 'email': user.email}
+
+class FacultyDirectory:
+    """Versioned cache of the faculty list shown on the upload form.
+
+    The list is stored in Redis under a key that includes a version
+    number; invalidate() bumps the version, so every worker picks up the
+    new list the next time it checks the version (at most every
+    check_interval seconds). Each worker keeps its own copy in between,
+    so most requests touch neither Redis nor the database. Without Redis
+    the copy is simply reloaded after check_interval.
+    """
+
+    VERSION_KEY = 'faculty_directory:version'
+
+    def __init__(self, redis=None, check_interval=30, ttl=3600):
+        self.redis = redis
+        self.check_interval = float(check_interval)
+        self.ttl = int(ttl)
+        self._version = None
+        self._entries = None
+        self._by_id = {}
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def init_app(self, app, redis=None):
+        self.redis = redis
+        self.check_interval = float(app.config.get('FACULTY_DIRECTORY_CHECK_INTERVAL', 30))
+        self.ttl = int(app.config.get('FACULTY_DIRECTORY_TTL', 3600))
+        self._reset()
+        app.extensions['faculty_directory'] = self
+
+    def _reset(self):
+        with self._lock:
+            self._version = None
+            self._entries = None
+            self._by_id = {}
+            self._checked_at = 0.0
+
+    @staticmethod
+    def _query():
+        from app.models import User
+        metrics.incr('faculty_directory.db_loads')
+        faculty = User.query.filter_by(role='faculty').order_by(User.first_name).all()
+        return [_entry(user) for user in faculty]
+
+    def _store(self, version, entries):
+        with self._lock:
+            self._version = version
+            self._entries = entries
+            self._by_id = {entry['id']: entry for entry in entries}
+            self._checked_at = time.monotonic()
+        return entries
+
+    def _load(self):
+        """Bring the local copy up to the current version and return it"""
+        if self.redis is None:
+            return self._store(None, self._query())
+
+        try:
+            version = int(self.redis.sync.get(self.VERSION_KEY) or 0)
+            with self._lock:
+                if version == self._version and self._entries is not None:
+                    self._checked_at = time.monotonic()
+                    return self._entries
+            data_key = f'faculty_directory:v{version}'
+            value = self.redis.sync.get(data_key)
+            if value is not None:
+                metrics.incr('faculty_directory.redis_loads')
+                return self._store(version, json.loads(value))
+        except Exception as e:
+            logger.warning(f"Faculty directory Redis read failed: {str(e)}")
+            return self._store(None, self._query())
+
+        entries = self._query()
+        try:
+            self.redis.sync.set(data_key, json.dumps(entries), ex=self.ttl)
+        except Exception as e:
+            logger.warning(f"Faculty directory Redis write failed: {str(e)}")
+        return self._store(version, entries)
+
+    def all(self):
+        """Return the faculty list ordered by first name"""
+        entries = self._entries
+        if entries is None or time.monotonic() - self._checked_at >= self.check_interval:
+            return self._load()
+        metrics.incr('faculty_directory.hits')
+        return entries
+
+    def get(self, faculty_id):
+        """Return the directory entry for a faculty id, or None.
+
+        Ids missing from the cached copy are looked up in the database once,
+        so a faculty member who signed up moments ago is not rejected.
+        """
+        try:
+            faculty_id = int(faculty_id)
+        except (TypeError, ValueError):
+            return None
+        self.all()
+        entry = self._by_id.get(faculty_id)
+        if entry is None:
+            from app.models import User
+            user = User.query.filter_by(id=faculty_id, role='faculty').first()
+            if user is not None:
+                entry = _entry(user)
+        return entry
+
+    def invalidate(self):
+        """Publish a new directory version, e.g. after a faculty account is created"""
+        self._reset()
+        metrics.incr('faculty_directory.invalidations')
+        if self.redis is None:
+            return
+        try:
+            self.redis.sync.increment(self.VERSION_KEY)
+        except Exception as e:
+            logger.error(f"Faculty directory invalidation failed: {str(e)}")
+
+# One copy per worker process
+faculty_directory = FacultyDirectory()
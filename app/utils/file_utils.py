@@ -1,11 +1,103 @@
+import hashlib
 import os
+import secrets
+import shutil
+import tempfile
+from collections import namedtuple
 from datetime import datetime
 from werkzeug.utils import secure_filename
-from flask import current_app
+from flask import current_app, Request
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Uploads in progress live here, on the same filesystem as their final location
+INCOMING_DIR = '.incoming'
+COPY_CHUNK_SIZE = 64 * 1024
+
+# What save_file stored: the new filename and the checksum and size of its content
+SavedFile = namedtuple('SavedFile', 'filename sha256 size')
+
+def upload_root():
+    """Absolute path of UPLOAD_FOLDER"""
+    upload_path = current_app.config['UPLOAD_FOLDER']
+    if not os.path.isabs(upload_path):
+        upload_path = os.path.abspath(upload_path)
+    return upload_path
+
+class IngestFile:
+    """Temporary upload file that hashes and counts bytes as they are written.
+
+    commit() moves it to its final name with a rename, so an upload is
+    written to disk once and never read back for its checksum. Closing an
+    uncommitted temporary file deletes it.
+    """
+
+    def __init__(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        fd, path = tempfile.mkstemp(dir=directory, prefix='upload-', suffix='.part')
+        self._attach(path, os.fdopen(fd, 'w+b'), delete_on_close=True)
+
+    def _attach(self, path, file, delete_on_close):
+        self.path = path
+        self._file = file
+        self._sha256 = hashlib.sha256()
+        self.size = 0
+        self.committed = False
+        self.delete_on_close = delete_on_close
+
+    @classmethod
+    def from_path(cls, path):
+        """Take over a file written by other means, hashing it in one read pass.
+
+        The file is left in place if it is closed without being committed.
+        """
+        ingest = cls.__new__(cls)
+        ingest._attach(path, open(path, 'r+b'), delete_on_close=False)
+        for chunk in iter(lambda: ingest._file.read(COPY_CHUNK_SIZE), b''):
+            ingest._sha256.update(chunk)
+            ingest.size += len(chunk)
+        ingest._file.seek(0)
+        return ingest
+
+    def write(self, data):
+        self._sha256.update(data)
+        self.size += len(data)
+        return self._file.write(data)
+
+    @property
+    def sha256(self):
+        return self._sha256.hexdigest()
+
+    def commit(self, destination):
+        """Durably move the file to destination"""
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        os.replace(self.path, destination)
+        self.path = destination
+        self.committed = True
+
+    def close(self):
+        self._file.close()
+        if self.delete_on_close and not self.committed:
+            try:
+                os.unlink(self.path)
+            except FileNotFoundError:
+                pass
+
+    def __getattr__(self, name):
+        return getattr(self._file, name)
+
+class UploadRequest(Request):
+    """Request whose multipart files stream into IngestFiles in the upload folder.
+
+    Werkzeug would otherwise spool every file to a temporary file first,
+    only for save_file to copy it again.
+    """
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return IngestFile(os.path.join(upload_root(), INCOMING_DIR))
+
 def allowed_file(filename):
     """Check if file extension is allowed"""
     if '.' not in filename:
@@ -16,27 +108,41 @@ def allowed_file(filename):
         return False
     return True
 
-def save_file(file, directory):
-    """Save file with secure filename in specified directory"""
-    filename = secure_filename(file.filename)
-    # Add timestamp to filename to prevent overwriting
-    name, ext = os.path.splitext(filename)
+def unique_filename(filename):
+    """Secure logical name for an upload: name_<timestamp>_<random>.ext.
+
+    Document.file_path is unique, so the random part keeps uploads of the
+    same name in the same second apart.
+    """
+    name, ext = os.path.splitext(secure_filename(filename))
     timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-    filename = f"{name}_{timestamp}{ext}"
-    
-    upload_path = current_app.config['UPLOAD_FOLDER']
-    if not os.path.isabs(upload_path):
-        upload_path = os.path.abspath(upload_path)
-    path = os.path.join(upload_path, directory)
-    
+    return f"{name}_{timestamp}_{secrets.token_hex(4)}{ext}"
+
+def save_file(file, directory):
+    """Save file under a unique, timestamped logical name in directory.
+
+    The content goes to the blob store, where identical bytes are stored
+    once; files parsed by UploadRequest are already on disk and are only
+    renamed, or dropped when the content is known. Returns a SavedFile
+    whose sha256 the caller records next to the logical path.
+    """
+    from app.utils.blob_store import blob_store
+    filename = unique_filename(file.filename)
+
     try:
-        # Create directory if it doesn't exist (only once)
-        os.makedirs(path, exist_ok=True)
-        
-        file_path = os.path.join(path, filename)
-        file.save(file_path)
-        logger.info(f"File saved successfully at: {file_path}")
-        return filename
+        stream = file.stream
+        if not isinstance(stream, IngestFile):
+            stream = IngestFile(os.path.join(upload_root(), INCOMING_DIR))
+            try:
+                shutil.copyfileobj(file.stream, stream, COPY_CHUNK_SIZE)
+                deduplicated = blob_store.store(stream)
+            finally:
+                stream.close()
+        else:
+            deduplicated = blob_store.store(stream)
+        logger.info(f"File saved successfully as {directory}/{filename} "
+                    f"({stream.size} bytes, {'deduplicated' if deduplicated else 'new'} blob {stream.sha256})")
+        return SavedFile(filename, stream.sha256, stream.size)
     except Exception as e:
         logger.error(f"Error saving file {filename}: {str(e)}")
         raise
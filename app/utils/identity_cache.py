@@ -0,0 +1,230 @@
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from flask_login import UserMixin
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
+from app.utils.async_utils import background_loop
+from app.utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Cache an identity unless it was invalidated recently (KEYS[2] is the tombstone)
+PUT_IDENTITY_SCRIPT = """
+if redis.call('EXISTS', KEYS[2]) == 1 then
+    return 0
+end
+redis.call('SET', KEYS[1], ARGV[1], 'EX', ARGV[2])
+return 1
+"""
+
+class CachedUser(UserMixin):
+    """Detached, read-only copy of the User fields views use through current_user.
+
+    Load the User model by id for anything else (relationships, updates).
+    """
+
+    FIELDS = ('id', 'email', 'role', 'first_name', 'last_name')
+
+    def __init__(self, id, email, role, first_name, last_name):
+        self.id = id
+        self.email = email
+        self.role = role
+        self.first_name = first_name
+        self.last_name = last_name
+
+    @classmethod
+    def from_user(cls, user):
+        return cls(**{field: getattr(user, field) for field in cls.FIELDS})
+
+    def to_dict(self):
+        return {field: getattr(self, field) for field in self.FIELDS}
+
+    def __repr__(self):
+        return f'<User {self.email}>'
+
+class IdentityCache:
+    """Read-through cache of user identities for login_manager.user_loader.
+
+    A per-worker LRU with a short TTL sits in front of an optional Redis
+    layer shared by all workers. Updates and deletes of a User row drop the
+    entry locally and in Redis once the transaction commits; other workers'
+    local copies expire within the local TTL.
+
+    An invalidation also leaves a tombstone for one local TTL, locally and
+    in Redis, during which put() is ignored: a request that loaded the row
+    before the update cannot cache the old fields after it.
+    """
+
+    def __init__(self, max_entries=1024, ttl=60, redis=None, redis_ttl=600, key_prefix='identity:'):
+        self.max_entries = max(1, int(max_entries))
+        self.ttl = float(ttl)
+        self.redis = redis
+        self.redis_ttl = int(redis_ttl)
+        self.key_prefix = key_prefix
+        self.enabled = True
+        self._entries = OrderedDict()
+        self._tombstones = {}  # key -> monotonic time until which put() is ignored
+        self._lock = threading.Lock()
+
+    def init_app(self, app, redis=None):
+        """Configure the cache from app settings and start tracking User changes"""
+        self.enabled = app.config.get('IDENTITY_CACHE_ENABLED', True)
+        self.max_entries = max(1, int(app.config.get('IDENTITY_CACHE_MAX_ENTRIES', 1024)))
+        self.ttl = float(app.config.get('IDENTITY_CACHE_TTL', 60))
+        self.redis_ttl = int(app.config.get('IDENTITY_CACHE_REDIS_TTL', 600))
+        self.redis = redis if app.config.get('IDENTITY_CACHE_REDIS', True) else None
+        self.clear()
+        _track_user_changes()
+        app.extensions['identity_cache'] = self
+
+    def get(self, user_id):
+        """Return the cached identity fields for user_id, or None"""
+        if not self.enabled:
+            return None
+        key = str(user_id)
+        fields = self._get_local(key)
+        if fields is not None:
+            return fields
+
+        if self.redis is not None:
+            try:
+                value = self.redis.sync.get(self.key_prefix + key)
+            except Exception as e:
+                logger.warning(f"Identity cache Redis read failed: {str(e)}")
+                value = None
+            if value is not None:
+                return self._redis_hit(key, value)
+
+        metrics.incr('identity_cache.misses')
+        return None
+
+    async def get_async(self, user_id):
+        """get() for code running on an event loop other than the background one (the ASGI app)"""
+        if not self.enabled:
+            return None
+        key = str(user_id)
+        fields = self._get_local(key)
+        if fields is not None:
+            return fields
+
+        if self.redis is not None:
+            try:
+                value = await background_loop.run_async(self.redis.get(self.key_prefix + key),
+                                                        timeout=self.redis.command_timeout)
+            except Exception as e:
+                logger.warning(f"Identity cache Redis read failed: {str(e)}")
+                value = None
+            if value is not None:
+                return self._redis_hit(key, value)
+
+        metrics.incr('identity_cache.misses')
+        return None
+
+    def _get_local(self, key):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[1] > now:
+                    self._entries.move_to_end(key)
+                    metrics.incr('identity_cache.hits')
+                    return dict(entry[0])
+                del self._entries[key]
+        return None
+
+    def _redis_hit(self, key, value):
+        fields = json.loads(value)
+        self._put_local(key, fields)
+        metrics.incr('identity_cache.redis_hits')
+        return dict(fields)
+
+    def _put_local(self, key, fields):
+        with self._lock:
+            self._entries[key] = (dict(fields), time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _tombstoned(self, key):
+        now = time.monotonic()
+        with self._lock:
+            until = self._tombstones.get(key)
+            if until is not None and until <= now:
+                del self._tombstones[key]
+                until = None
+        return until is not None
+
+    def put(self, user_id, fields):
+        """Cache identity fields loaded from the database"""
+        if not self.enabled:
+            return
+        key = str(user_id)
+        if self._tombstoned(key):
+            metrics.incr('identity_cache.puts_skipped')
+            return
+        self._put_local(key, fields)
+        if self.redis is not None:
+            try:
+                self.redis.sync.run_script(PUT_IDENTITY_SCRIPT,
+                                           keys=[self.key_prefix + key, self._tombstone_key(key)],
+                                           args=[json.dumps(fields), self.redis_ttl])
+            except Exception as e:
+                logger.warning(f"Identity cache Redis write failed: {str(e)}")
+
+    def _tombstone_key(self, key):
+        return f"{self.key_prefix}{key}:invalidated"
+
+    def invalidate(self, user_id):
+        """Drop a user's identity from this worker and from Redis"""
+        key = str(user_id)
+        now = time.monotonic()
+        with self._lock:
+            self._entries.pop(key, None)
+            self._tombstones = {k: until for k, until in self._tombstones.items() if until > now}
+            self._tombstones[key] = now + self.ttl
+        metrics.incr('identity_cache.invalidations')
+        if self.redis is None:
+            return
+        try:
+            self.redis.sync.execute_pipeline([
+                ['SET', self._tombstone_key(key), '1', 'EX', max(1, int(self.ttl))],
+                ['DEL', self.key_prefix + key],
+            ], transaction=True)
+        except Exception as e:
+            logger.error(f"Identity cache Redis invalidation failed for user {key}: {str(e)}")
+
+    def clear(self):
+        """Drop all identities cached by this worker"""
+        with self._lock:
+            self._entries.clear()
+            self._tombstones.clear()
+
+# One cache per worker process
+identity_cache = IdentityCache()
+
+_PENDING_KEY = 'identity_cache_pending'
+
+def _record_user_change(mapper, connection, target):
+    session = object_session(target)
+    if session is not None:
+        session.info.setdefault(_PENDING_KEY, set()).add(target.id)
+
+def _invalidate_committed(session):
+    for user_id in session.info.pop(_PENDING_KEY, ()):
+        identity_cache.invalidate(user_id)
+
+def _discard_rolled_back(session):
+    session.info.pop(_PENDING_KEY, None)
+
+def _track_user_changes():
+    """Invalidate cached identities when User rows are updated or deleted"""
+    from app.models import User
+    for name, listener in (('after_update', _record_user_change), ('after_delete', _record_user_change)):
+        if not event.contains(User, name, listener):
+            event.listen(User, name, listener)
+    if not event.contains(Session, 'after_commit', _invalidate_committed):
+        event.listen(Session, 'after_commit', _invalidate_committed)
+        event.listen(Session, 'after_rollback', _discard_rolled_back)
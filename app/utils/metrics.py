@@ -0,0 +1,40 @@
+import threading
+from collections import defaultdict
+
+
+class Counters:
+    """Thread-safe named counters shared by the components of a worker"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._values = defaultdict(int)
+
+    def incr(self, name, amount=1):
+        """Increment a counter and return its new value"""
+        with self._lock:
+            self._values[name] += amount
+            return self._values[name]
+
+    def get(self, name):
+        """Return the current value of a counter"""
+        with self._lock:
+            return self._values.get(name, 0)
+
+    def snapshot(self, prefix=None):
+        """Return a copy of all counters, optionally filtered by name prefix"""
+        with self._lock:
+            return {
+                name: value for name, value in self._values.items()
+                if prefix is None or name.startswith(prefix)
+            }
+
+    def reset(self, prefix=None):
+        """Reset counters, optionally only those matching a prefix"""
+        with self._lock:
+            for name in list(self._values):
+                if prefix is None or name.startswith(prefix):
+                    del self._values[name]
+
+
+# Per-worker counters
+metrics = Counters()
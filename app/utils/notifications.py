@@ -0,0 +1,166 @@
+import logging
+from datetime import datetime, timedelta
+from flask import current_app, has_request_context, render_template
+from sqlalchemy import delete, func, select
+from sqlalchemy.orm import joinedload
+from app.utils.metrics import metrics
+from app.utils.outbox import email_outbox
+
+logger = logging.getLogger(__name__)
+
+REVIEW = 'review'  # A student's document was reviewed; notifies the student
+SUBMISSION = 'submission'  # A document was assigned to a faculty member; notifies them
+
+def review_email(document, student, reviewer):
+    """Subject, text and HTML of the email about one reviewed document"""
+    html = render_template('email/review_notification.html',
+                           student=student, document=document, reviewer=reviewer)
+    body = f"""
+Dear {student.first_name} {student.last_name},
+
+Your document "{document.original_filename}" has been reviewed by {reviewer.first_name} {reviewer.last_name}.
+
+You can log in to your dashboard to view the feedback.
+
+Best regards,
+University Document System
+    """
+    return f'Your document has been reviewed - {document.original_filename}', body, html
+
+def review_digest_email(student, documents):
+    """Subject, text and HTML of the email about several reviewed documents"""
+    html = render_template('email/review_digest.html', student=student, documents=documents)
+    listing = '\n'.join(
+        f'  - "{d.original_filename}", reviewed by {d.reviewer.first_name} {d.reviewer.last_name}'
+        for d in documents
+    )
+    body = f"""
+Dear {student.first_name} {student.last_name},
+
+{len(documents)} of your documents have been reviewed:
+
+{listing}
+
+You can log in to your dashboard to view the feedback.
+
+Best regards,
+University Document System
+    """
+    return f'{len(documents)} of your documents have been reviewed', body, html
+
+def submission_digest_email(faculty, documents):
+    """Subject, text and HTML of the email listing new submissions for a faculty member"""
+    html = render_template('email/submission_digest.html', faculty=faculty, documents=documents)
+    listing = '\n'.join(
+        f'  - "{d.original_filename}" from {d.uploader.first_name} {d.uploader.last_name}'
+        for d in documents
+    )
+    noun = 'submission' if len(documents) == 1 else 'submissions'
+    body = f"""
+Dear {faculty.first_name} {faculty.last_name},
+
+{len(documents)} new {noun} waiting for your review:
+
+{listing}
+
+Best regards,
+University Document System
+    """
+    return f'{len(documents)} new {noun} to review', body, html
+
+class NotificationDigests:
+    """Coalesces notifications per recipient into one email per window.
+
+    With a window of more than zero seconds, record() stores an event in
+    the caller's transaction instead of queueing an email. flush(), run by
+    `flask send-email` on every poll, collects the events of each recipient
+    whose oldest event is at least window seconds old and queues one
+    message listing all their documents in the email outbox. A digest of a
+    single review is sent as the ordinary review notification.
+    """
+
+    def __init__(self, window=0):
+        self.window = float(window)
+
+    def init_app(self, app):
+        self.window = float(app.config.get('NOTIFICATION_DIGEST_SECONDS', 0))
+        app.extensions['notification_digests'] = self
+
+    @property
+    def enabled(self):
+        return self.window > 0
+
+    def record(self, recipient_id, kind, document):
+        """Add an event about document for recipient_id to the current transaction"""
+        from app import db
+        from app.models import NotificationEvent
+        db.session.add(NotificationEvent(recipient_id=recipient_id, kind=kind, document=document))
+        metrics.incr('digests.events')
+
+    def _compose(self, kind, recipient, documents):
+        if kind == SUBMISSION:
+            return submission_digest_email(recipient, documents)
+        if len(documents) == 1:
+            return review_email(documents[0], recipient, documents[0].reviewer)
+        return review_digest_email(recipient, documents)
+
+    def flush(self):
+        """Queue the digests that are due; returns how many were queued"""
+        from app import db
+        from app.models import Document, NotificationEvent, User
+        cutoff = datetime.utcnow() - timedelta(seconds=self.window)
+        groups = db.session.execute(
+            select(NotificationEvent.recipient_id, NotificationEvent.kind)
+            .group_by(NotificationEvent.recipient_id, NotificationEvent.kind)
+            .having(func.min(NotificationEvent.created_at) <= cutoff)
+        ).all()
+        db.session.rollback()
+        if not groups:
+            return 0
+
+        queued = 0
+        # The worker has no request; links in the emails are built against MAIL_LINK_BASE_URL
+        context = None
+        if not has_request_context():
+            context = current_app.test_request_context(base_url=current_app.config.get('MAIL_LINK_BASE_URL'))
+            context.push()
+        try:
+            for recipient_id, kind in groups:
+                # Locked, so a second sender process skips this recipient instead of sending it twice
+                events = db.session.scalars(
+                    select(NotificationEvent)
+                    .where(NotificationEvent.recipient_id == recipient_id, NotificationEvent.kind == kind)
+                    .order_by(NotificationEvent.id)
+                    .with_for_update(skip_locked=True)
+                ).all()
+                if not events:
+                    db.session.rollback()
+                    continue
+                document_ids = list(dict.fromkeys(event.document_id for event in events))
+                loaded = {d.id: d for d in db.session.scalars(
+                    select(Document)
+                    .options(joinedload(Document.uploader), joinedload(Document.reviewer))
+                    .where(Document.id.in_(document_ids))
+                )}
+                documents = [loaded[i] for i in document_ids if i in loaded]
+                recipient = db.session.get(User, recipient_id)
+                if recipient is not None and recipient.email and documents:
+                    subject, body, html = self._compose(kind, recipient, documents)
+                    email_outbox.enqueue(f"digest-{kind}-{recipient_id}-{events[-1].id}",
+                                         recipient.email, subject, body, html=html)
+                    queued += 1
+                    metrics.incr('digests.queued')
+                    metrics.incr('digests.coalesced', len(events))
+                db.session.execute(delete(NotificationEvent).where(
+                    NotificationEvent.id.in_([event.id for event in events])
+                ))
+                db.session.commit()
+        finally:
+            if context is not None:
+                context.pop()
+        if queued:
+            logger.info(f"Queued {queued} digest emails")
+        return queued
+
+# One instance per process
+notification_digests = NotificationDigests()
@@ -0,0 +1,198 @@
+import logging
+import random
+import smtplib
+import time
+from datetime import datetime, timedelta
+from flask import current_app
+from flask_mail import Message
+from sqlalchemy import insert, select
+from sqlalchemy.exc import IntegrityError
+from app.utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Errors that mean the connection is unusable, not that one message was refused
+CONNECTION_ERRORS = (smtplib.SMTPServerDisconnected, smtplib.SMTPConnectError, OSError)
+
+class EmailOutbox:
+    """Email written to the database in the transaction that causes it, sent later.
+
+    enqueue() adds a row to the caller's session, so a notification exists
+    exactly when the change it announces was committed. A sender process
+    (`flask send-email`) drains due rows in batches over one SMTP
+    connection, kept open while there is work. A message that fails is
+    retried with exponential backoff until max_attempts; SMTP 5xx refusals
+    and messages that cannot be built are not retried. Each message has an
+    idempotency key: enqueueing the same key twice keeps one row, and the
+    key is the Message-ID, so a message re-sent after a crash between
+    sending and committing can be recognized as a duplicate.
+    """
+
+    def __init__(self, batch_size=50, max_attempts=8, retry_base=30, retry_max=3600, poll_interval=5):
+        self.batch_size = int(batch_size)
+        self.max_attempts = int(max_attempts)
+        self.retry_base = float(retry_base)
+        self.retry_max = float(retry_max)
+        self.poll_interval = float(poll_interval)
+
+    def init_app(self, app):
+        self.batch_size = int(app.config.get('OUTBOX_BATCH_SIZE', 50))
+        self.max_attempts = int(app.config.get('OUTBOX_MAX_ATTEMPTS', 8))
+        self.retry_base = float(app.config.get('OUTBOX_RETRY_BASE_SECONDS', 30))
+        self.retry_max = float(app.config.get('OUTBOX_RETRY_MAX_SECONDS', 3600))
+        self.poll_interval = float(app.config.get('OUTBOX_POLL_INTERVAL', 5))
+        app.extensions['email_outbox'] = self
+
+    def enqueue(self, key, recipient, subject, body, html=None, sender=None):
+        """Add a message to the current transaction; returns False if key was already queued"""
+        from app import db
+        from app.models import OutboxEmail
+        now = datetime.utcnow()
+        try:
+            with db.session.begin_nested():
+                db.session.execute(insert(OutboxEmail).values(
+                    idempotency_key=key,
+                    sender=sender or current_app.config.get('MAIL_DEFAULT_SENDER'),
+                    recipient=recipient,
+                    subject=subject,
+                    body=body,
+                    html=html,
+                    status='pending',
+                    attempts=0,
+                    next_attempt_at=now,
+                    created_at=now,
+                ))
+        except IntegrityError:
+            metrics.incr('outbox.duplicates')
+            return False
+        metrics.incr('outbox.queued')
+        return True
+
+    def _backoff(self, attempts):
+        # Full jitter, so messages that failed together do not retry together
+        return random.uniform(0.5, 1.0) * min(self.retry_max, self.retry_base * 2 ** (attempts - 1))
+
+    def _message(self, row):
+        domain = row.sender.rpartition('@')[2] or 'localhost'
+        message = Message(
+            subject=row.subject,
+            sender=row.sender,
+            recipients=[row.recipient],
+            body=row.body,
+            html=row.html,
+        )
+        message.msgId = f'<{row.idempotency_key}@{domain}>'
+        return message
+
+    def _failed(self, row, error, permanent=False):
+        row.attempts += 1
+        row.last_error = (str(error) or type(error).__name__)[:1000]
+        if permanent or row.attempts >= self.max_attempts:
+            row.status = 'failed'
+            metrics.incr('outbox.dead')
+            logger.error(f"Giving up on email {row.id} to {row.recipient}: {error}")
+        else:
+            row.next_attempt_at = datetime.utcnow() + timedelta(seconds=self._backoff(row.attempts))
+            metrics.incr('outbox.retries')
+            logger.warning(f"Email {row.id} failed (attempt {row.attempts}), retrying: {error}")
+
+    def send_batch(self, connection):
+        """Send up to batch_size due messages over an open flask_mail connection.
+
+        Returns the number of rows processed. Rows are locked (and skipped
+        by other senders) until the batch commits. A connection error
+        reschedules the message and is re-raised after the commit, so the
+        caller reconnects.
+        """
+        from app import db
+        from app.models import OutboxEmail
+        rows = db.session.scalars(
+            select(OutboxEmail)
+            .where(*self._due())
+            .order_by(OutboxEmail.next_attempt_at, OutboxEmail.id)
+            .limit(self.batch_size)
+            .with_for_update(skip_locked=True)
+        ).all()
+        broken = None
+        processed = 0
+        for row in rows:
+            # smtplib errors are OSErrors too, so the refusals of this one message come first
+            try:
+                connection.send(self._message(row))
+            except smtplib.SMTPRecipientsRefused as e:
+                codes = [code for code, _ in e.recipients.values()]
+                self._failed(row, e, permanent=all(code >= 500 for code in codes))
+            except smtplib.SMTPResponseException as e:
+                self._failed(row, e, permanent=e.smtp_code >= 500)
+            except CONNECTION_ERRORS as e:
+                self._failed(row, e)
+                broken = e
+                processed += 1
+                break
+            except Exception as e:
+                # The message itself cannot be built or encoded (bad header, template error);
+                # retrying would fail the same way and block the rows behind it
+                self._failed(row, e, permanent=True)
+            else:
+                row.status = 'sent'
+                row.attempts += 1
+                row.sent_at = datetime.utcnow()
+                row.last_error = None
+                metrics.incr('outbox.sent')
+            processed += 1
+        db.session.commit()
+        if rows:
+            metrics.incr('outbox.batches')
+        if broken is not None:
+            raise broken
+        return processed
+
+    def _due(self):
+        from app.models import OutboxEmail
+        return (OutboxEmail.status == 'pending', OutboxEmail.next_attempt_at <= datetime.utcnow())
+
+    def has_due(self):
+        """Whether any message is waiting to be sent"""
+        from app import db
+        from app.models import OutboxEmail
+        due = db.session.scalar(select(OutboxEmail.id).where(*self._due()).limit(1)) is not None
+        db.session.rollback()  # Do not hold the snapshot while idle
+        return due
+
+    def run(self, once=False, should_stop=None, on_poll=None):
+        """Send due messages until stopped; with once, until nothing is due.
+
+        An SMTP connection is opened only when messages are due and stays
+        open across batches until the outbox runs dry. on_poll is called
+        before every check, to queue messages first. Returns the number of
+        rows processed.
+        """
+        from app import db, mail
+        should_stop = should_stop or (lambda: False)
+        total = 0
+        while not should_stop():
+            if on_poll is not None:
+                on_poll()
+            if not self.has_due():
+                if once:
+                    break
+                time.sleep(self.poll_interval)
+                continue
+            try:
+                with mail.connect() as connection:
+                    while not should_stop():
+                        processed = self.send_batch(connection)
+                        total += processed
+                        if processed < self.batch_size:
+                            break
+            except CONNECTION_ERRORS as e:
+                db.session.rollback()
+                metrics.incr('outbox.connection_errors')
+                logger.warning(f"SMTP connection failed: {e}")
+                if once:
+                    break
+                time.sleep(self.poll_interval)
+        return total
+
+# One outbox per process
+email_outbox = EmailOutbox()
@@ -0,0 +1,82 @@
+import logging
+from datetime import datetime
+from flask import current_app
+from itsdangerous import URLSafeSerializer, BadSignature
+from sqlalchemy import tuple_
+
+logger = logging.getLogger(__name__)
+
+class InvalidCursor(ValueError):
+    """Raised when a page cursor was tampered with or is malformed"""
+
+class Page:
+    """One page of a keyset-paginated query"""
+
+    def __init__(self, items, cursor=None, next_cursor=None):
+        self.items = items
+        self.cursor = cursor  # Cursor this page was loaded from, None for the first page
+        self.next_cursor = next_cursor  # Cursor for the following page, None on the last one
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+def _serializer():
+    return URLSafeSerializer(current_app.secret_key, salt='page-cursor')
+
+def encode_cursor(value, row_id):
+    """Opaque, signed cursor pointing just past the row (value, row_id)"""
+    if isinstance(value, datetime):
+        value = value.isoformat()
+    return _serializer().dumps([value, row_id])
+
+def decode_cursor(cursor):
+    """Return the (value, row_id) a cursor points past"""
+    try:
+        value, row_id = _serializer().loads(cursor)
+        return datetime.fromisoformat(value), int(row_id)
+    except (BadSignature, TypeError, ValueError) as e:
+        raise InvalidCursor(str(e))
+
+def _keyset(query, column, cursor, per_page):
+    """query narrowed to the rows after cursor, ordered, with one extra row to tell whether there is a next page"""
+    id_column = column.class_.id
+    if cursor:
+        value, row_id = decode_cursor(cursor)
+        query = query.filter(tuple_(column, id_column) < tuple_(value, row_id))
+    return query.order_by(column.desc(), id_column.desc()).limit(per_page + 1)
+
+def _page(rows, column, cursor, per_page):
+    next_cursor = None
+    if len(rows) > per_page:
+        rows = rows[:per_page]
+        last = rows[-1]
+        next_cursor = encode_cursor(getattr(last, column.key), last.id)
+    return Page(rows, cursor=cursor, next_cursor=next_cursor)
+
+def paginate_keyset(query, column, cursor=None, per_page=20):
+    """Return the page of query after cursor, newest first by (column, id).
+
+    Each page is a range scan that starts where the previous one ended, so
+    a deep page costs the same as the first one, and rows inserted
+    meanwhile do not shift later pages. column must be a non-null datetime
+    on the queried model; the model's id breaks ties. The query must not
+    be ordered already.
+    """
+    rows = _keyset(query, column, cursor, per_page).all()
+    return _page(rows, column, cursor, per_page)
+
+async def paginate_keyset_async(session, statement, column, cursor=None, per_page=20):
+    """paginate_keyset for a select() of one model on an AsyncSession.
+
+    Relationships the caller reads afterwards must be loaded eagerly by
+    the statement's options; lazy loads cannot run on the event loop.
+    """
+    rows = (await session.scalars(_keyset(statement, column, cursor, per_page))).unique().all()
+    return _page(list(rows), column, cursor, per_page)
@@ -0,0 +1,109 @@
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from app.utils.async_utils import background_loop
+from app.utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+class PasswordHasherBusy(RuntimeError):
+    """Raised when a worker already has max_pending hashes queued or running"""
+
+def _native_executor(workers):
+    """Thread pool on OS threads, even when gevent has patched threading"""
+    try:
+        from gevent import monkey
+        if monkey.is_module_patched('threading'):
+            from gevent.threadpool import ThreadPoolExecutor as GeventThreadPoolExecutor
+            return GeventThreadPoolExecutor(workers)
+    except ImportError:
+        pass
+    return ThreadPoolExecutor(workers, thread_name_prefix='edusync-bcrypt')
+
+def hash_cost(pw_hash):
+    """Work factor of a bcrypt hash ($2b$<cost>$...), None if unreadable"""
+    if isinstance(pw_hash, bytes):
+        pw_hash = pw_hash.decode('utf-8', 'replace')
+    try:
+        return int(pw_hash.split('$')[2])
+    except (AttributeError, IndexError, ValueError):
+        return None
+
+class PasswordHasher:
+    """Runs bcrypt for a worker on a small pool of OS threads.
+
+    bcrypt releases the GIL while it works, so hashing on native threads
+    keeps the worker's other greenlets serving requests during a burst of
+    logins. The caller's greenlet waits cooperatively. Each call that would
+    exceed max_pending queued or running hashes fails at once with
+    PasswordHasherBusy instead of queueing. With workers set to 0 hashing
+    runs inline, as before.
+    """
+
+    def __init__(self, bcrypt=None, rounds=12, workers=2, max_pending=32):
+        self.bcrypt = bcrypt
+        self.rounds = int(rounds)
+        self.workers = int(workers)
+        self.max_pending = max(1, int(max_pending))
+        self._executor = None
+        self._pid = None
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    def init_app(self, app, bcrypt):
+        self.bcrypt = bcrypt
+        self.rounds = int(app.config.get('BCRYPT_LOG_ROUNDS', 12))
+        self.workers = int(app.config.get('PASSWORD_HASH_WORKERS', 2))
+        self.max_pending = max(1, int(app.config.get('PASSWORD_HASH_MAX_PENDING', 32)))
+        app.extensions['password_hasher'] = self
+
+    def _get_executor(self):
+        # Created on first use so each gunicorn worker starts its own threads after the fork
+        if self._executor is None or self._pid != os.getpid():
+            with self._lock:
+                if self._executor is None or self._pid != os.getpid():
+                    self._executor = _native_executor(self.workers)
+                    self._pid = os.getpid()
+                    self._pending = 0
+        return self._executor
+
+    def _release(self, future):
+        with self._lock:
+            self._pending -= 1
+
+    def _run(self, fn, *args):
+        if self.workers <= 0:
+            return fn(*args)
+        if background_loop.in_loop_thread():
+            raise RuntimeError("Password hashing would block the event loop; call it from a sync view")
+        executor = self._get_executor()
+        with self._lock:
+            if self._pending >= self.max_pending:
+                metrics.incr('passwords.rejected')
+                raise PasswordHasherBusy(f"{self._pending} password hashes already pending")
+            self._pending += 1
+        try:
+            future = executor.submit(fn, *args)
+        except Exception:
+            self._release(None)
+            raise
+        future.add_done_callback(self._release)
+        return future.result()
+
+    def hash(self, password):
+        """Hash a password at the configured work factor"""
+        metrics.incr('passwords.hashes')
+        return self._run(self.bcrypt.generate_password_hash, password, self.rounds).decode('utf-8')
+
+    def check(self, pw_hash, password):
+        """Check a password against a stored hash"""
+        metrics.incr('passwords.checks')
+        return self._run(self.bcrypt.check_password_hash, pw_hash, password)
+
+    def needs_rehash(self, pw_hash):
+        """Whether a hash was made at a different work factor than the configured one"""
+        return hash_cost(pw_hash) != self.rounds
+
+# One pool per worker process
+password_hasher = PasswordHasher()
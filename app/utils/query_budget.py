@@ -0,0 +1,59 @@
+import logging
+from flask import current_app, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from app.utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+class QueryBudgetExceeded(RuntimeError):
+    """Raised in strict mode when a request runs more queries than its budget"""
+
+def query_budget(limit):
+    """Decorator to give a view its own query budget instead of QUERY_BUDGET.
+
+    Wrappers built with functools.wraps (login_required, limiter.limit)
+    copy the attribute, so the decorator can go anywhere below @route.
+    """
+    def decorator(f):
+        f.query_budget = limit
+        return f
+    return decorator
+
+def _count_query(conn, cursor, statement, parameters, context, executemany):
+    if not has_request_context() or '_query_count' not in g:
+        return
+    g._query_count += 1
+    budget = g._query_budget
+    if budget and g._query_count > budget and current_app.config.get('QUERY_BUDGET_STRICT'):
+        raise QueryBudgetExceeded(
+            f"{request.endpoint} ran more than {budget} queries, latest: {statement[:200]}"
+        )
+
+def _start_counting():
+    g._query_count = 0
+    view = current_app.view_functions.get(request.endpoint)
+    g._query_budget = getattr(view, 'query_budget', current_app.config.get('QUERY_BUDGET'))
+
+def _check_budget(response):
+    count = g.pop('_query_count', None)
+    if count is None:
+        return response
+    metrics.incr('db.queries', count)
+    budget = g.pop('_query_budget', None)
+    if budget and count > budget:
+        metrics.incr('db.query_budget_exceeded')
+        logger.warning(f"Query budget exceeded: {request.endpoint} ran {count} queries (budget {budget})")
+    return response
+
+def setup_query_budget(app):
+    """Count SQL queries per request and flag endpoints that exceed their budget.
+
+    Over-budget requests are logged; with QUERY_BUDGET_STRICT (meant for
+    tests) the query that crosses the budget raises QueryBudgetExceeded, so
+    an N+1 regression fails loudly at the offending query.
+    """
+    if not event.contains(Engine, 'before_cursor_execute', _count_query):
+        event.listen(Engine, 'before_cursor_execute', _count_query)
+    app.before_request(_start_counting)
+    app.after_request(_check_budget)
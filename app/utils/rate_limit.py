@@ -0,0 +1,165 @@
+import asyncio
+import logging
+import threading
+import time
+from uuid import uuid4
+from aiohttp import ClientError
+from limits.storage import Storage, MovingWindowSupport
+from upstash_redis.errors import UpstashError
+from app.utils.metrics import metrics
+from app.utils.redis_backends import RedisBackendError
+
+logger = logging.getLogger(__name__)
+
+# Sliding-window log: drop entries older than the window, admit the request if
+# there is room and record it. Returns {1} when admitted, otherwise {0, oldest}
+# where oldest is the timestamp of the oldest entry still in the window.
+ACQUIRE_ENTRY_SCRIPT = """
+local now = tonumber(ARGV[1])
+local expiry = tonumber(ARGV[2])
+local limit = tonumber(ARGV[3])
+local amount = tonumber(ARGV[4])
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', now - expiry)
+if redis.call('ZCARD', KEYS[1]) + amount > limit then
+    local oldest = redis.call('ZRANGE', KEYS[1], 0, 0, 'WITHSCORES')
+    return {0, oldest[2] or ARGV[1]}
+end
+for i = 1, amount do
+    redis.call('ZADD', KEYS[1], now, ARGV[5] .. ':' .. i)
+end
+redis.call('EXPIRE', KEYS[1], math.ceil(expiry))
+return {1}
+"""
+
+# Number of entries in the window and the timestamp of the oldest one
+MOVING_WINDOW_SCRIPT = """
+local entries = redis.call('ZRANGEBYSCORE', KEYS[1], ARGV[1], '+inf', 'WITHSCORES', 'LIMIT', 0, 1)
+if #entries == 0 then
+    return {0}
+end
+return {redis.call('ZCOUNT', KEYS[1], ARGV[1], '+inf'), entries[2]}
+"""
+
+# Fixed window: count the hit and start the window on the first one
+INCR_SCRIPT = """
+local value = redis.call('INCRBY', KEYS[1], ARGV[2])
+if value == tonumber(ARGV[2]) then
+    redis.call('EXPIRE', KEYS[1], ARGV[1])
+end
+return value
+"""
+
+
+class RedisManagerStorage(Storage, MovingWindowSupport):
+    """Flask-Limiter storage shared by all workers through RedisManager.
+
+    The moving-window strategy keeps a sorted set of request timestamps per
+    limit and admits or rejects with one atomic script call. When a key is
+    rejected the worker remembers until when, so further requests from the
+    same client are refused locally without a Redis call; the local block
+    is capped at local_block_seconds so a reset elsewhere is seen quickly.
+
+    Fixed-window limits (incr/get) are also supported, with one script call
+    per hit. The methods follow the Storage API of the limits version
+    pinned in requirements.txt.
+    """
+
+    STORAGE_SCHEME = ['redismanager']
+
+    def __init__(self, uri=None, wrap_exceptions=False, redis_manager=None,
+                 local_block_seconds=5, local_block_max_entries=10000, **options):
+        super().__init__(uri, wrap_exceptions=wrap_exceptions, **options)
+        if redis_manager is None:
+            raise ValueError("redismanager:// storage needs the redis_manager storage option")
+        self.redis = redis_manager.sync
+        self.local_block_seconds = local_block_seconds
+        self.local_block_max_entries = local_block_max_entries
+        self._blocked = {}
+        self._lock = threading.Lock()
+
+    @property
+    def base_exceptions(self):
+        return (UpstashError, RedisBackendError, ClientError, ConnectionError,
+                asyncio.TimeoutError, TimeoutError)
+
+    def _blocked_locally(self, key):
+        """Check whether key was rejected recently enough to refuse without Redis"""
+        with self._lock:
+            until = self._blocked.get(key)
+            if until is None:
+                return False
+            if until <= time.monotonic():
+                del self._blocked[key]
+                return False
+        return True
+
+    def _block_locally(self, key, seconds):
+        seconds = min(seconds, self.local_block_seconds)
+        if seconds <= 0:
+            return
+        now = time.monotonic()
+        with self._lock:
+            if len(self._blocked) >= self.local_block_max_entries:
+                self._blocked = {k: until for k, until in self._blocked.items() if until > now}
+                if len(self._blocked) >= self.local_block_max_entries:
+                    return
+            self._blocked[key] = now + seconds
+
+    def _unblock_locally(self, key=None):
+        with self._lock:
+            if key is None:
+                self._blocked.clear()
+            else:
+                self._blocked.pop(key, None)
+
+    def acquire_entry(self, key, limit, expiry, amount=1):
+        if amount > limit:
+            return False
+        if self._blocked_locally(key):
+            metrics.incr('ratelimit.local_rejections')
+            return False
+
+        now = time.time()
+        result = self.redis.run_script(ACQUIRE_ENTRY_SCRIPT, keys=[key],
+                                       args=[f'{now:.6f}', expiry, limit, amount, uuid4().hex])
+        if int(result[0]) == 1:
+            return True
+
+        metrics.incr('ratelimit.rejections')
+        # The window has room again once its oldest entry ages out
+        self._block_locally(key, float(result[1]) + expiry - now)
+        return False
+
+    def get_moving_window(self, key, limit, expiry):
+        now = time.time()
+        result = self.redis.run_script(MOVING_WINDOW_SCRIPT, keys=[key], args=[f'{now - expiry:.6f}'])
+        if not int(result[0]):
+            return now, 0
+        return float(result[1]), int(result[0])
+
+    def incr(self, key, expiry, amount=1):
+        # Not retried (run_script never is): a hit counted twice would reject the client early
+        value = self.redis.run_script(INCR_SCRIPT, keys=[key], args=[int(expiry), amount])
+        return int(value)
+
+    def get(self, key):
+        value = self.redis.get(key)
+        return int(value) if value is not None else 0
+
+    def get_expiry(self, key):
+        return time.time() + max(self.redis.get_ttl(key), 0)
+
+    def check(self):
+        try:
+            return self.redis.ping()
+        except Exception:
+            return False
+
+    def reset(self):
+        # Keys are spread over the shared keyspace; only the local state is ours to drop
+        self._unblock_locally()
+        return None
+
+    def clear(self, key):
+        self._unblock_locally(key)
+        self.redis.delete(key)
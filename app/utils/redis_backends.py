@@ -0,0 +1,568 @@
+import asyncio
+import json
+import logging
+import os
+import select
+import socket
+import ssl
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from urllib.parse import urlparse, unquote
+import urllib3
+from upstash_redis.errors import UpstashError
+from upstash_redis.http import make_headers, decode, async_execute
+from aiohttp import ClientSession, ClientTimeout, TCPConnector
+
+logger = logging.getLogger(__name__)
+
+class RedisBackendError(Exception):
+    """Error reply returned by Redis for a command"""
+
+# Commands that can be sent again when it is unknown whether Redis ran them
+RESENDABLE_COMMANDS = frozenset(['PING', 'GET', 'EXISTS', 'TTL', 'SET', 'DEL', 'EXPIRE', 'MULTI', 'EXEC'])
+
+def resendable(commands):
+    """Check that running commands twice has the same effect as running them once"""
+    for command in commands:
+        name = str(command[0]).upper()
+        if name not in RESENDABLE_COMMANDS:
+            return False
+        if name == 'SET' and any(str(arg).upper() in ('NX', 'XX', 'GET') for arg in command[3:]):
+            return False
+    return True
+
+class RedisBackend(ABC):
+    """Transport used by RedisManager to talk to Redis.
+
+    Backends take commands as lists (['SET', key, value, 'EX', 60]) and
+    return raw replies: strings, integers, None or lists. In pipelines an
+    error reply is returned in place as an exception instance.
+    """
+
+    @abstractmethod
+    async def execute(self, command):
+        """Send one command and return its reply"""
+
+    @abstractmethod
+    async def execute_pipeline(self, commands, transaction=False):
+        """Send several commands in one round trip and return their replies"""
+
+    async def close(self):
+        pass
+
+class UpstashRestBackend(RedisBackend):
+    """Upstash REST API over a shared keep-alive HTTP session"""
+
+    def __init__(self, url, token, pool_size=20, timeout=10):
+        self.url = url.rstrip('/')
+        self.headers = make_headers(token, 'base64', True)
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self._http = None
+        self._http_loop = None
+
+    def _get_http_session(self):
+        """Shared keep-alive HTTP session, bound to the running loop"""
+        loop = asyncio.get_running_loop()
+        if self._http is None or self._http.closed or self._http_loop is not loop:
+            self._http_loop = loop
+            self._http = ClientSession(
+                connector=TCPConnector(limit=self.pool_size, keepalive_timeout=60),
+                timeout=ClientTimeout(total=self.timeout)
+            )
+        return self._http
+
+    async def execute(self, command):
+        return await async_execute(
+            session=self._get_http_session(),
+            url=self.url,
+            headers=self.headers,
+            encoding='base64',
+            retries=0,  # Retries are handled by RedisManager
+            retry_interval=0,
+            command=command
+        )
+
+    async def execute_pipeline(self, commands, transaction=False):
+        endpoint = 'multi-exec' if transaction else 'pipeline'
+        session = self._get_http_session()
+        async with session.post(f"{self.url}/{endpoint}", headers=self.headers, json=commands) as response:
+            response.raise_for_status()
+            body = await response.json()
+
+        # A failed transaction is reported for the whole batch
+        if isinstance(body, dict):
+            raise UpstashError(body.get('error', 'Invalid pipeline response'))
+        return [
+            UpstashError(item['error']) if item.get('error') else decode(item.get('result'))
+            for item in body
+        ]
+
+    async def close(self):
+        if self._http is not None and not self._http.closed:
+            await self._http.close()
+        self._http = None
+
+class RespConnection:
+    """Single RESP protocol connection to a Redis server"""
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+
+    @staticmethod
+    def encode(command):
+        """Encode a command as a RESP array of bulk strings"""
+        parts = [b'*%d\r\n' % len(command)]
+        for arg in command:
+            if isinstance(arg, bytes):
+                data = arg
+            elif isinstance(arg, str):
+                data = arg.encode('utf-8')
+            else:
+                data = str(arg).encode('utf-8')
+            parts.append(b'$%d\r\n%s\r\n' % (len(data), data))
+        return b''.join(parts)
+
+    async def read_reply(self):
+        """Read one reply; error replies are returned as RedisBackendError"""
+        line = await self.reader.readline()
+        if not line.endswith(b'\r\n'):
+            raise ConnectionError("Connection closed by Redis server")
+        prefix, payload = line[:1], line[1:-2]
+        if prefix == b'+':
+            return payload.decode('utf-8')
+        if prefix == b'-':
+            return RedisBackendError(payload.decode('utf-8'))
+        if prefix == b':':
+            return int(payload)
+        if prefix == b'$':
+            length = int(payload)
+            if length == -1:
+                return None
+            data = await self.reader.readexactly(length + 2)
+            return data[:-2].decode('utf-8')
+        if prefix == b'*':
+            length = int(payload)
+            if length == -1:
+                return None
+            return [await self.read_reply() for _ in range(length)]
+        raise ConnectionError(f"Unexpected RESP reply prefix: {prefix!r}")
+
+    async def send(self, commands):
+        """Write several commands in one go"""
+        self.writer.write(b''.join(self.encode(command) for command in commands))
+        await self.writer.drain()
+
+    def is_closed(self):
+        return self.reader.at_eof() or self.writer.is_closing()
+
+    def close(self):
+        self.writer.close()
+
+class RespBackend(RedisBackend):
+    """Native Redis protocol over a pool of keep-alive TCP connections"""
+
+    def __init__(self, url, pool_size=20, timeout=10):
+        parsed = urlparse(url)
+        self.host = parsed.hostname or 'localhost'
+        self.port = parsed.port or 6379
+        self.username = unquote(parsed.username) if parsed.username else None
+        self.password = unquote(parsed.password) if parsed.password else None
+        self.db = int(parsed.path.lstrip('/') or 0)
+        self.use_ssl = parsed.scheme == 'rediss'
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self._idle = []
+        self._slots = None
+        self._loop = None
+
+    def _get_slots(self):
+        # Pool state belongs to the loop that created it
+        loop = asyncio.get_running_loop()
+        if self._slots is None or self._loop is not loop:
+            self._loop = loop
+            self._idle = []
+            self._slots = asyncio.Semaphore(self.pool_size)
+        return self._slots
+
+    async def _connect(self):
+        reader, writer = await asyncio.open_connection(
+            self.host, self.port,
+            ssl=ssl.create_default_context() if self.use_ssl else None
+        )
+        sock = writer.get_extra_info('socket')
+        if sock is not None:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        connection = RespConnection(reader, writer)
+
+        setup = []
+        if self.password:
+            setup.append(['AUTH', self.username, self.password] if self.username else ['AUTH', self.password])
+        if self.db:
+            setup.append(['SELECT', self.db])
+        if setup:
+            await connection.send(setup)
+            for _ in setup:
+                reply = await connection.read_reply()
+                if isinstance(reply, RedisBackendError):
+                    connection.close()
+                    raise reply
+        logger.debug(f"Opened Redis connection to {self.host}:{self.port}/{self.db}")
+        return connection
+
+    def _take_idle(self):
+        """Reuse an idle connection, dropping any the server has closed meanwhile"""
+        while self._idle:
+            connection = self._idle.pop()
+            if not connection.is_closed():
+                return connection
+            connection.close()
+        return None
+
+    async def _round_trip(self, commands):
+        """Send commands on a pooled connection and read one reply per command"""
+        async with self._get_slots():
+            connection = self._take_idle()
+            reused = connection is not None
+            if connection is None:
+                connection = await self._connect()
+            while True:
+                replies = []
+                try:
+                    await connection.send(commands)
+                    for _ in commands:
+                        replies.append(await connection.read_reply())
+                except (ConnectionError, asyncio.IncompleteReadError):
+                    connection.close()
+                    # An idle connection may have been closed by the server (idle timeout); retry
+                    # once on a fresh one, unless Redis may have run a command that must not be
+                    # applied twice
+                    if reused and not replies and resendable(commands):
+                        reused = False
+                        connection = await self._connect()
+                        continue
+                    raise
+                except BaseException:
+                    # The stream position is unknown, never reuse this connection
+                    connection.close()
+                    raise
+                self._idle.append(connection)
+                return replies
+
+    async def execute(self, command):
+        reply, = await asyncio.wait_for(self._round_trip([command]), self.timeout)
+        if isinstance(reply, RedisBackendError):
+            raise reply
+        return reply
+
+    async def execute_pipeline(self, commands, transaction=False):
+        if not transaction:
+            return await asyncio.wait_for(self._round_trip(commands), self.timeout)
+
+        replies = await asyncio.wait_for(
+            self._round_trip([['MULTI'], *commands, ['EXEC']]), self.timeout
+        )
+        result = replies[-1]
+        if isinstance(result, RedisBackendError):
+            raise result
+        if result is None:
+            raise RedisBackendError("Transaction aborted")
+        return result
+
+    async def close(self):
+        while self._idle:
+            self._idle.pop().close()
+
+def gevent_patched():
+    """Whether gevent has monkey-patched sockets in this process (gunicorn's gevent worker)"""
+    try:
+        from gevent import monkey
+    except ImportError:
+        return False
+    return monkey.is_module_patched('socket')
+
+class GeventBackend(ABC):
+    """Blocking transport for gevent workers, with no event loop involved.
+
+    Same commands and replies as RedisBackend, but the methods block the
+    calling greenlet; sockets are gevent's, so the worker's other greenlets
+    keep running while it waits. Each call, including the wait for a pooled
+    connection, is bounded by timeout seconds.
+    """
+
+    def __init__(self, pool_size=20, timeout=10):
+        self.pool_size = max(1, int(pool_size))
+        self.timeout = timeout
+
+    @contextmanager
+    def _deadline(self):
+        # gevent.Timeout is a BaseException, so transport code cannot swallow it
+        # and always closes the connection it interrupts
+        from gevent import Timeout
+        deadline = Timeout(self.timeout)
+        deadline.start()
+        try:
+            yield
+        except Timeout as e:
+            if e is not deadline:
+                raise
+            raise TimeoutError(f"Redis call timed out after {self.timeout}s") from None
+        finally:
+            deadline.close()
+
+    @abstractmethod
+    def execute(self, command):
+        """Send one command and return its reply"""
+
+    @abstractmethod
+    def execute_pipeline(self, commands, transaction=False):
+        """Send several commands in one round trip and return their replies"""
+
+    def close(self):
+        pass
+
+class GeventRestBackend(GeventBackend):
+    """Upstash REST API over a keep-alive urllib3 pool shared by the worker's greenlets.
+
+    The pool holds at most pool_size connections; greenlets beyond that
+    wait for one to be returned instead of opening more.
+    """
+
+    def __init__(self, url, token, pool_size=20, timeout=10):
+        super().__init__(pool_size=pool_size, timeout=timeout)
+        self.url = url.rstrip('/')
+        self.path = urlparse(self.url).path
+        self.headers = {**make_headers(token, 'base64', True), 'Content-Type': 'application/json'}
+        self._pool = None
+        self._pid = None
+
+    def _get_pool(self):
+        # Sockets must not be shared with the parent across a gunicorn fork
+        if self._pool is None or self._pid != os.getpid():
+            self._pool = urllib3.connection_from_url(
+                self.url, maxsize=self.pool_size, block=True, headers=self.headers,
+                retries=False,  # Retries are handled by RedisManager
+                timeout=urllib3.Timeout(connect=self.timeout, read=self.timeout)
+            )
+            self._pid = os.getpid()
+        return self._pool
+
+    def _post(self, path, payload):
+        try:
+            with self._deadline():
+                response = self._get_pool().urlopen('POST', path, body=json.dumps(payload).encode('utf-8'))
+                return json.loads(response.data)
+        except (urllib3.exceptions.HTTPError, ValueError) as e:
+            # Surface transport failures as the builtin error the async backend raises
+            raise ConnectionError(f"Upstash request failed: {str(e)}") from e
+
+    def execute(self, command):
+        # Arguments are serialized as in upstash_redis: strings and numbers as is, the rest as JSON
+        command = [arg if isinstance(arg, (str, int, float)) else json.dumps(arg) for arg in command]
+        body = self._post(self.path or '/', command)
+        if body.get('error'):
+            raise UpstashError(body['error'])
+        return decode(body['result'])
+
+    def execute_pipeline(self, commands, transaction=False):
+        endpoint = 'multi-exec' if transaction else 'pipeline'
+        body = self._post(f"{self.path}/{endpoint}", commands)
+
+        # A failed transaction is reported for the whole batch
+        if isinstance(body, dict):
+            raise UpstashError(body.get('error', 'Invalid pipeline response'))
+        return [
+            UpstashError(item['error']) if item.get('error') else decode(item.get('result'))
+            for item in body
+        ]
+
+    def close(self):
+        if self._pool is not None and self._pid == os.getpid():
+            self._pool.close()
+        self._pool = None
+
+class BlockingRespConnection:
+    """Single RESP protocol connection on a (gevent) socket"""
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.file = sock.makefile('rb')
+
+    def read_reply(self):
+        """Read one reply; error replies are returned as RedisBackendError"""
+        line = self.file.readline()
+        if not line.endswith(b'\r\n'):
+            raise ConnectionError("Connection closed by Redis server")
+        prefix, payload = line[:1], line[1:-2]
+        if prefix == b'+':
+            return payload.decode('utf-8')
+        if prefix == b'-':
+            return RedisBackendError(payload.decode('utf-8'))
+        if prefix == b':':
+            return int(payload)
+        if prefix == b'$':
+            length = int(payload)
+            if length == -1:
+                return None
+            data = self.file.read(length + 2)
+            if len(data) != length + 2:
+                raise ConnectionError("Connection closed by Redis server")
+            return data[:-2].decode('utf-8')
+        if prefix == b'*':
+            length = int(payload)
+            if length == -1:
+                return None
+            return [self.read_reply() for _ in range(length)]
+        raise ConnectionError(f"Unexpected RESP reply prefix: {prefix!r}")
+
+    def is_closed(self):
+        """Check an idle connection: readable means EOF or stray data, unusable either way"""
+        if self.sock.fileno() == -1:
+            return True
+        try:
+            readable, _, _ = select.select([self.sock], [], [], 0)
+        except (OSError, ValueError):
+            return True
+        return bool(readable)
+
+    def send(self, commands):
+        """Write several commands in one go"""
+        self.sock.sendall(b''.join(RespConnection.encode(command) for command in commands))
+
+    def close(self):
+        self.file.close()
+        self.sock.close()
+
+class GeventRespBackend(GeventBackend):
+    """Native Redis protocol over a pool of keep-alive gevent sockets"""
+
+    def __init__(self, url, pool_size=20, timeout=10):
+        super().__init__(pool_size=pool_size, timeout=timeout)
+        parsed = urlparse(url)
+        self.host = parsed.hostname or 'localhost'
+        self.port = parsed.port or 6379
+        self.username = unquote(parsed.username) if parsed.username else None
+        self.password = unquote(parsed.password) if parsed.password else None
+        self.db = int(parsed.path.lstrip('/') or 0)
+        self.use_ssl = parsed.scheme == 'rediss'
+        self._idle = []
+        self._slots = None
+        self._pid = None
+
+    def _get_slots(self):
+        # Pool state belongs to the process that created it
+        if self._slots is None or self._pid != os.getpid():
+            from gevent.lock import BoundedSemaphore
+            self._idle = []
+            self._slots, self._pid = BoundedSemaphore(self.pool_size), os.getpid()
+        return self._slots
+
+    def _take_idle(self):
+        """Reuse an idle connection, dropping any the server has closed meanwhile"""
+        while self._idle:
+            connection = self._idle.pop()
+            if not connection.is_closed():
+                return connection
+            connection.close()
+        return None
+
+    def _connect(self):
+        sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        if self.use_ssl:
+            sock = ssl.create_default_context().wrap_socket(sock, server_hostname=self.host)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        connection = BlockingRespConnection(sock)
+
+        setup = []
+        if self.password:
+            setup.append(['AUTH', self.username, self.password] if self.username else ['AUTH', self.password])
+        if self.db:
+            setup.append(['SELECT', self.db])
+        if setup:
+            connection.send(setup)
+            for _ in setup:
+                reply = connection.read_reply()
+                if isinstance(reply, RedisBackendError):
+                    connection.close()
+                    raise reply
+        logger.debug(f"Opened Redis connection to {self.host}:{self.port}/{self.db}")
+        return connection
+
+    def _round_trip(self, commands):
+        """Send commands on a pooled connection and read one reply per command"""
+        with self._deadline(), self._get_slots():
+            connection = self._take_idle()
+            reused = connection is not None
+            if connection is None:
+                connection = self._connect()
+            while True:
+                replies = []
+                try:
+                    connection.send(commands)
+                    for _ in commands:
+                        replies.append(connection.read_reply())
+                except ConnectionError:
+                    connection.close()
+                    # A reused connection can still die between the check and the write; retry
+                    # once on a fresh one, unless Redis may have run a command (INCR, EVALSHA)
+                    # that must not be applied twice
+                    if reused and not replies and resendable(commands):
+                        reused = False
+                        connection = self._connect()
+                        continue
+                    raise
+                except BaseException:
+                    # The stream position is unknown (including a timeout), never reuse this connection
+                    connection.close()
+                    raise
+                self._idle.append(connection)
+                return replies
+
+    def execute(self, command):
+        reply, = self._round_trip([command])
+        if isinstance(reply, RedisBackendError):
+            raise reply
+        return reply
+
+    def execute_pipeline(self, commands, transaction=False):
+        if not transaction:
+            return self._round_trip(commands)
+
+        replies = self._round_trip([['MULTI'], *commands, ['EXEC']])
+        result = replies[-1]
+        if isinstance(result, RedisBackendError):
+            raise result
+        if result is None:
+            raise RedisBackendError("Transaction aborted")
+        return result
+
+    def close(self):
+        if self._pid == os.getpid():
+            while self._idle:
+                self._idle.pop().close()
+        self._idle = []
+
+def create_backend(url, token=None, pool_size=20, timeout=10):
+    """Pick a backend from the URL scheme: redis(s):// is native, http(s):// is Upstash REST"""
+    scheme = urlparse(url).scheme
+    if scheme in ('redis', 'rediss'):
+        return RespBackend(url, pool_size=pool_size, timeout=timeout)
+    if scheme in ('http', 'https'):
+        if not token:
+            raise ValueError("UPSTASH_REDIS_REST_TOKEN is required for a REST Redis URL")
+        return UpstashRestBackend(url, token, pool_size=pool_size, timeout=timeout)
+    raise ValueError(f"Unsupported Redis URL scheme: {scheme!r}")
+
+def create_gevent_backend(url, token=None, pool_size=20, timeout=10):
+    """Blocking counterpart of create_backend for gevent workers"""
+    scheme = urlparse(url).scheme
+    if scheme in ('redis', 'rediss'):
+        return GeventRespBackend(url, pool_size=pool_size, timeout=timeout)
+    if scheme in ('http', 'https'):
+        if not token:
+            raise ValueError("UPSTASH_REDIS_REST_TOKEN is required for a REST Redis URL")
+        return GeventRestBackend(url, token, pool_size=pool_size, timeout=timeout)
+    raise ValueError(f"Unsupported Redis URL scheme: {scheme!r}")
@@ -1,73 +1,169 @@
-from upstash_redis import Redis
+from upstash_redis.format import FORMATTERS
 import logging
+import os
 import time
 import asyncio
+import hashlib
 from flask import current_app
 from functools import wraps
+from app.utils.async_utils import run_sync
+from app.utils.redis_backends import create_backend, create_gevent_backend, gevent_patched, resendable
 
 logger = logging.getLogger(__name__)
 
-def retry_on_error(retries=3, delay=0.1):
-    """Decorator to retry Redis operations on failure"""
+# Move a session to a new key: SET NX on the new key, then delete the old one. Finding the
+# new key already holding this data means an earlier run succeeded, so a retry also returns 1
+RECREATE_SESSION_SCRIPT = """
+if redis.call('SET', KEYS[2], ARGV[1], 'NX', 'EX', ARGV[2]) or redis.call('GET', KEYS[2]) == ARGV[1] then
+    redis.call('DEL', KEYS[1])
+    return 1
+end
+return 0
+"""
+
+def retry_on_error(retries=3, delay=0.1, resend_safe=None):
+    """Decorator to retry Redis operations on failure.
+
+    A failed call may still have been applied by Redis (the reply was lost,
+    not the command), so only operations that can run twice are decorated.
+    resend_safe(*args, **kwargs) decides per call for operations whose
+    safety depends on their arguments, such as pipelines.
+    """
     def decorator(func):
         @wraps(func)
-        async def wrapper(*args, **kwargs):
+        async def wrapper(self, *args, **kwargs):
+            attempts = retries if resend_safe is None or resend_safe(*args, **kwargs) else 1
             last_error = None
-            for attempt in range(retries):
+            for attempt in range(attempts):
                 try:
-                    return await func(*args, **kwargs)
+                    return await func(self, *args, **kwargs)
                 except Exception as e:
                     last_error = e
-                    logger.warning(f"Redis operation failed (attempt {attempt + 1}/{retries}): {str(e)}")
-                    if attempt < retries - 1:
-                        await asyncio.sleep(delay * (2 ** attempt))  # Exponential backoff
-            logger.error(f"Redis operation failed after {retries} attempts: {str(last_error)}")
+                    logger.warning(f"Redis operation failed (attempt {attempt + 1}/{attempts}): {str(e)}")
+                    if attempt < attempts - 1:
+                        await self._sleep(delay * (2 ** attempt))  # Exponential backoff
+            logger.error(f"Redis operation failed after {attempts} attempts: {str(last_error)}")
             raise last_error
         return wrapper
     return decorator
 
+class SyncRedisManager:
+    """Blocking facade over RedisManager.
+
+    Coroutine methods are submitted to the worker's background event loop
+    and the caller waits for the result, so sync code such as the session
+    interface never creates or drives an event loop of its own. A manager
+    whose coroutines never suspend passes run=run_blocking instead.
+    """
+
+    def __init__(self, manager, run=None):
+        self._manager = manager
+        self._run = run or (lambda coro: run_sync(coro, timeout=manager.command_timeout))
+
+    def __getattr__(self, name):
+        attr = getattr(self._manager, name)
+        if not asyncio.iscoroutinefunction(attr):
+            return attr
+
+        @wraps(attr)
+        def call(*args, **kwargs):
+            return self._run(attr(*args, **kwargs))
+        return call
+
+def run_blocking(coro):
+    """Run a coroutine that never suspends to completion in the calling thread"""
+    try:
+        coro.send(None)
+    except StopIteration as stop:
+        return stop.value
+    coro.close()
+    raise RuntimeError("Coroutine suspended without an event loop")
+
 class RedisManager:
     _instance = None
-    _lock = asyncio.Lock()
 
     def __new__(cls):
         if cls._instance is None:
             cls._instance = super(RedisManager, cls).__new__(cls)
             cls._instance.initialized = False
-            cls._instance.client = None
         return cls._instance
 
     def __init__(self):
-        self.client = None
+        self.backend = None
+        self._script_shas = {}
+        self.sync = SyncRedisManager(self)
 
     def init_app(self, app):
         """Initialize Redis with Flask application context"""
         try:
-            self.client = Redis(
-                url=app.config['UPSTASH_REDIS_REST_URL'],
-                token=app.config['UPSTASH_REDIS_REST_TOKEN']
+            # REDIS_URL selects the transport by scheme; default to the Upstash REST endpoint
+            url = app.config.get('REDIS_URL') or app.config['UPSTASH_REDIS_REST_URL']
+            self.command_timeout = app.config.get('REDIS_COMMAND_TIMEOUT', 10)
+            self.backend = create_backend(
+                url,
+                token=app.config.get('UPSTASH_REDIS_REST_TOKEN'),
+                pool_size=app.config.get('REDIS_POOL_SIZE', 20),
+                timeout=self.command_timeout
             )
+            # Under gevent, sync callers (sessions, rate limits, caches) block their greenlet on
+            # a pooled gevent connection instead of waiting on the background event loop
+            if app.config.get('REDIS_GEVENT_TRANSPORT', True) and gevent_patched():
+                self.sync = GeventRedisManager(self, create_gevent_backend(
+                    url,
+                    token=app.config.get('UPSTASH_REDIS_REST_TOKEN'),
+                    pool_size=self._gevent_pool_size(app),
+                    timeout=self.command_timeout
+                )).sync
+            else:
+                self.sync = SyncRedisManager(self)
             self.initialized = True
-            logger.info("Redis client initialized successfully with connection pooling")
+            logger.info(f"Redis client initialized successfully with {type(self.backend).__name__}")
+            if self.sync.backend is not self.backend:
+                logger.info(f"Sync Redis calls use {type(self.sync.backend).__name__} "
+                            f"({self.sync.backend.pool_size} connections)")
         except Exception as e:
             logger.error(f"Failed to initialize Redis client: {str(e)}")
             raise
 
+    @staticmethod
+    def _gevent_pool_size(app):
+        """REDIS_GEVENT_POOL_SIZE, else one connection per greenlet the worker can run"""
+        size = int(app.config.get('REDIS_GEVENT_POOL_SIZE') or 0)
+        if size <= 0:
+            # Exported by the post_fork hook in gunicorn.conf.py
+            size = int(os.getenv('GUNICORN_WORKER_CONNECTIONS') or 0)
+        return size if size > 0 else app.config.get('REDIS_POOL_SIZE', 20)
+
+    def _script_sha(self, script):
+        sha = self._script_shas.get(script)
+        if sha is None:
+            sha = self._script_shas[script] = hashlib.sha1(script.encode('utf-8')).hexdigest()
+        return sha
+
     def _ensure_initialized(self):
         """Ensure Redis client is initialized"""
         if not self.initialized:
             raise RuntimeError("Redis client not initialized. Call init_app() first.")
 
-    async def _execute_redis_command(self, command, *args, **kwargs):
-        """Execute Redis command and handle non-coroutine results"""
+    async def _send(self, command):
+        return await self.backend.execute(command)
+
+    async def _send_pipeline(self, commands, transaction):
+        return await self.backend.execute_pipeline(commands, transaction=transaction)
+
+    async def _sleep(self, seconds):
+        await asyncio.sleep(seconds)
+
+    async def _execute_redis_command(self, *command):
+        """Execute a single Redis command on the configured backend"""
+        command_name = command[0]
         try:
-            command_name = command.__name__ if hasattr(command, '__name__') else str(command)
-            logger.debug(f"Executing Redis command: {command_name}, args: {args}, kwargs: {kwargs}")
-            
-            result = command(*args, **kwargs)
-            if asyncio.iscoroutine(result):
-                result = await result
-                
+            logger.debug(f"Executing Redis command: {command_name}, args: {command[1:]}")
+
+            result = await self._send(list(command))
+            if command_name in FORMATTERS:
+                result = FORMATTERS[command_name](result, list(command))
+
             logger.debug(f"Redis command result: {command_name} -> {result}")
             return result
         except Exception as e:
@@ -78,76 +174,148 @@ class RedisManager:
     async def ping(self):
         """Test Redis connection with retry"""
         self._ensure_initialized()
-        result = await self._execute_redis_command(self.client.ping)
+        result = await self._execute_redis_command('PING')
         return result == "PONG"
 
     @retry_on_error()
     async def get(self, key):
         """Get value for key with retry"""
         self._ensure_initialized()
-        return await self._execute_redis_command(self.client.get, key)
+        return await self._execute_redis_command('GET', key)
 
     @retry_on_error()
     async def set(self, key, value, ex=None):
         """Set key-value pair with retry"""
         self._ensure_initialized()
-        return await self._execute_redis_command(self.client.set, key, value, ex=ex)
+        command = ['SET', key, value]
+        if ex is not None:
+            command += ['EX', int(ex)]
+        return await self._execute_redis_command(*command)
 
     @retry_on_error()
-    async def delete(self, key):
-        """Delete a key with retry"""
+    async def delete(self, *keys):
+        """Delete one or more keys with retry"""
         self._ensure_initialized()
-        return await self._execute_redis_command(self.client.delete, key)
+        return await self._execute_redis_command('DEL', *keys)
 
     @retry_on_error()
     async def exists(self, key):
         """Check if key exists with retry"""
         self._ensure_initialized()
-        return await self._execute_redis_command(self.client.exists, key)
+        return await self._execute_redis_command('EXISTS', key)
 
-    @retry_on_error()
     async def increment(self, key):
-        """Increment value for key with retry"""
+        """Increment value for key, not retried since INCR must not be applied twice"""
         self._ensure_initialized()
-        return await self._execute_redis_command(self.client.incr, key)
+        return await self._execute_redis_command('INCR', key)
 
     @retry_on_error()
     async def set_expiry(self, key, seconds):
         """Set expiration for key with retry"""
         self._ensure_initialized()
-        return await self._execute_redis_command(self.client.expire, key, seconds)
+        return await self._execute_redis_command('EXPIRE', key, int(seconds))
 
     @retry_on_error()
+    async def get_ttl(self, key):
+        """Get remaining time to live of key in seconds (-2 if missing, -1 if none)"""
+        self._ensure_initialized()
+        return int(await self._execute_redis_command('TTL', key))
+
     async def acquire_lock(self, lock_key, expiry=10):
-        """Acquire a distributed lock"""
+        """Acquire a distributed lock (not retried: a lost reply would make it look taken)"""
         self._ensure_initialized()
         return await self._execute_redis_command(
-            self.client.set,
+            'SET',
             f"lock:{lock_key}",
             "1",
-            nx=True,
-            ex=expiry
+            'NX',
+            'EX',
+            int(expiry)
         )
 
     @retry_on_error()
     async def release_lock(self, lock_key):
         """Release a distributed lock"""
         self._ensure_initialized()
-        return await self._execute_redis_command(self.client.delete, f"lock:{lock_key}")
+        return await self._execute_redis_command('DEL', f"lock:{lock_key}")
 
-    async def recreate_session(self, old_sid, new_sid, data, expiry=86400):
-        """Atomically recreate a session with a new ID"""
+    @retry_on_error(resend_safe=lambda commands, *args, **kwargs: resendable(commands))
+    async def execute_pipeline(self, commands, transaction=False, raise_on_error=True):
+        """Execute a batch of commands in a single round trip, with retry if all are idempotent.
+
+        commands is a list of commands such as ['SET', key, value]; with
+        transaction=True the batch is applied atomically (the Upstash
+        multi-exec endpoint, or MULTI/EXEC on a native connection).
+        """
+        self._ensure_initialized()
+        logger.debug(f"Executing Redis {'transaction' if transaction else 'pipeline'}: "
+                     f"{[command[0] for command in commands]}")
+        results = await self._send_pipeline(commands, transaction)
+
+        if raise_on_error:
+            for command, result in zip(commands, results):
+                if isinstance(result, Exception):
+                    raise type(result)(f"{command[0]}: {result}")
+        return results
+
+    async def run_script(self, script, keys=(), args=()):
+        """Run a Lua script atomically, by SHA when the server already has it.
+
+        Not retried: scripts may have side effects that must not be applied
+        twice; callers with idempotent scripts can retry themselves.
+        """
         self._ensure_initialized()
+        sha = self._script_sha(script)
         try:
-            # Try to acquire lock
-            lock_acquired = await self.acquire_lock(f"session_recreate:{old_sid}")
-            if not lock_acquired:
-                return False
-
-            # Copy data to new session and delete old one
-            set_result = await self.set(new_sid, data, ex=expiry)
-            del_result = await self.delete(old_sid)
-            return set_result and del_result is not None
-        finally:
-            # Always release the lock
-            await self.release_lock(f"session_recreate:{old_sid}")
+            return await self._execute_redis_command('EVALSHA', sha, len(keys), *keys, *args)
+        except Exception as e:
+            if 'NOSCRIPT' not in str(e) and 'No matching script' not in str(e):
+                raise
+            return await self._execute_redis_command('EVAL', script, len(keys), *keys, *args)
+
+    @retry_on_error()
+    async def recreate_session(self, old_sid, new_sid, data, expiry=86400):
+        """Atomically move a session to a new ID in one round trip, with retry (the script is idempotent)"""
+        self._ensure_initialized()
+        result = await self.run_script(RECREATE_SESSION_SCRIPT, keys=[old_sid, new_sid], args=[data, int(expiry)])
+        return result == 1
+
+    async def close(self):
+        """Close backend connections"""
+        if self.sync._manager is not self:
+            await self.sync._manager.close()
+        if self.backend is not None:
+            await self.backend.close()
+
+class GeventRedisManager(RedisManager):
+    """RedisManager over a blocking gevent backend, for gevent workers.
+
+    Used behind RedisManager.sync when gevent has patched sockets: its
+    coroutines call the backend directly and never suspend, so they are run
+    to completion in the calling greenlet instead of being handed to the
+    background event loop thread and waited for. Commands, retries and
+    reply formatting are RedisManager's; only the transport differs.
+    """
+
+    def __new__(cls, manager, backend):
+        # One per RedisManager, not a process-wide singleton
+        return object.__new__(cls)
+
+    def __init__(self, manager, backend):
+        self.backend = backend
+        self.command_timeout = manager.command_timeout
+        self._script_shas = manager._script_shas
+        self.initialized = True
+        self.sync = SyncRedisManager(self, run=run_blocking)
+
+    async def _send(self, command):
+        return self.backend.execute(command)
+
+    async def _send_pipeline(self, commands, transaction):
+        return self.backend.execute_pipeline(commands, transaction=transaction)
+
+    async def _sleep(self, seconds):
+        time.sleep(seconds)  # Yields to other greenlets under gevent
+
+    async def close(self):
+        self.backend.close()
@@ -0,0 +1,234 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+import time
+import uuid
+from flask import url_for
+from app.utils.file_utils import COPY_CHUNK_SIZE, IngestFile, upload_root
+from app.utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+_fdatasync = getattr(os, 'fdatasync', os.fsync)
+
+class UploadSessionError(ValueError):
+    """Raised for requests that do not fit an upload session; status is the HTTP code to answer"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+class ResumableUploads:
+    """Upload sessions that receive a file in fixed-size chunks, in any order.
+
+    Each session is a directory under UPLOAD_FOLDER/.resumable holding its
+    metadata, the data file (preallocated to the full size, chunks are
+    written into place with positioned writes) and a one-byte-per-chunk
+    map of the chunks received so far. A client that lost its connection
+    asks for the offset, the end of the contiguous run of received chunks,
+    and carries on from there. Sessions not written to for longer than
+    ttl are removed by collect_garbage().
+    """
+
+    DIRECTORY = '.resumable'
+
+    def __init__(self, chunk_size=1024 * 1024, max_size=20 * 1024 * 1024, ttl=86400):
+        self.chunk_size = int(chunk_size)
+        self.max_size = int(max_size)
+        self.ttl = float(ttl)
+
+    def init_app(self, app):
+        self.chunk_size = int(app.config.get('RESUMABLE_CHUNK_SIZE', 1024 * 1024))
+        self.max_size = int(app.config.get('RESUMABLE_MAX_SIZE', app.config.get('MAX_CONTENT_LENGTH')))
+        self.ttl = float(app.config.get('RESUMABLE_UPLOAD_TTL', 86400))
+        app.extensions['resumable_uploads'] = self
+
+    def root(self):
+        return os.path.join(upload_root(), self.DIRECTORY)
+
+    def _directory(self, upload_id):
+        try:
+            upload_id = uuid.UUID(upload_id).hex
+        except (TypeError, ValueError):
+            raise UploadSessionError('Unknown upload', 404)
+        return os.path.join(self.root(), upload_id)
+
+    def create(self, user_id, filename, size, target):
+        """Start a session for a file of size bytes and return its metadata.
+
+        target records what the file becomes once complete, e.g.
+        {'faculty_id': 3} or {'document_id': 7, 'slot': 1}.
+        """
+        if not isinstance(size, int) or size <= 0:
+            raise UploadSessionError('Invalid file size')
+        if size > self.max_size:
+            raise UploadSessionError(f'File is larger than {self.max_size} bytes', 413)
+        upload_id = uuid.uuid4().hex
+        directory = os.path.join(self.root(), upload_id)
+        os.makedirs(directory)
+        chunk_count = -(-size // self.chunk_size)
+        meta = {
+            'id': upload_id,
+            'user_id': user_id,
+            'filename': filename,
+            'size': size,
+            'chunk_size': self.chunk_size,
+            'chunk_count': chunk_count,
+            'target': target,
+            'created_at': time.time(),
+        }
+        with open(os.path.join(directory, 'data'), 'wb') as f:
+            try:
+                os.posix_fallocate(f.fileno(), 0, size)
+            except (AttributeError, OSError):
+                f.truncate(size)  # Sparse file where fallocate is unavailable
+        with open(os.path.join(directory, 'chunks'), 'wb') as f:
+            f.write(bytes(chunk_count))
+        with open(os.path.join(directory, 'meta.json'), 'w') as f:
+            json.dump(meta, f)
+        metrics.incr('resumable.sessions')
+        return meta
+
+    def get(self, upload_id, user_id):
+        """Metadata of a session owned by user_id"""
+        try:
+            with open(os.path.join(self._directory(upload_id), 'meta.json')) as f:
+                meta = json.load(f)
+        except FileNotFoundError:
+            raise UploadSessionError('Unknown upload', 404)
+        if meta['user_id'] != user_id:
+            raise UploadSessionError('Unknown upload', 404)
+        return meta
+
+    def received(self, meta):
+        """Flags of the chunks received so far, one per chunk"""
+        with open(os.path.join(self.root(), meta['id'], 'chunks'), 'rb') as f:
+            return f.read()
+
+    def status(self, meta):
+        """Offset to resume from and the chunks still missing"""
+        received = self.received(meta)
+        missing = [index for index, flag in enumerate(received) if not flag]
+        offset = missing[0] * meta['chunk_size'] if missing else meta['size']
+        return {'offset': offset, 'missing': missing}
+
+    def write_chunk(self, meta, index, stream, length, sha256):
+        """Write chunk index from stream, verifying its length and SHA-256.
+
+        A chunk that fails verification is not marked as received; sending
+        it again overwrites it.
+        """
+        if not 0 <= index < meta['chunk_count']:
+            raise UploadSessionError('Chunk index out of range')
+        start = index * meta['chunk_size']
+        expected = min(meta['chunk_size'], meta['size'] - start)
+        if length != expected:
+            raise UploadSessionError(f'Chunk {index} must be {expected} bytes')
+        if not sha256:
+            raise UploadSessionError('Missing chunk checksum')
+
+        directory = os.path.join(self.root(), meta['id'])
+        digest = hashlib.sha256()
+        written = 0
+        fd = os.open(os.path.join(directory, 'data'), os.O_WRONLY)
+        try:
+            while written < expected:
+                piece = stream.read(min(COPY_CHUNK_SIZE, expected - written))
+                if not piece:
+                    break
+                os.pwrite(fd, piece, start + written)
+                digest.update(piece)
+                written += len(piece)
+            if written != expected:
+                raise UploadSessionError(f'Chunk {index} was cut short')
+            if digest.hexdigest() != sha256.lower():
+                metrics.incr('resumable.checksum_failures')
+                raise UploadSessionError(f'Chunk {index} checksum mismatch', 422)
+            # Only chunks that are on disk are reported as received
+            _fdatasync(fd)
+        finally:
+            os.close(fd)
+
+        fd = os.open(os.path.join(directory, 'chunks'), os.O_WRONLY)
+        try:
+            os.pwrite(fd, b'\x01', index)
+        finally:
+            os.close(fd)
+        metrics.incr('resumable.chunks')
+
+    def claim(self, meta):
+        """Take a complete session for finalization and return its data as an IngestFile.
+
+        The session directory is renamed first, so a duplicate completion
+        request cannot finalize the same upload twice. Afterwards call
+        discard() with the claimed meta, or unclaim() to allow a retry.
+        """
+        if not all(self.received(meta)):
+            raise UploadSessionError('Upload is incomplete', 409)
+        directory = os.path.join(self.root(), meta['id'])
+        claimed = directory + '.completing'
+        try:
+            os.rename(directory, claimed)
+        except FileNotFoundError:
+            raise UploadSessionError('Upload is already being completed', 409)
+        meta['claimed'] = claimed
+        return IngestFile.from_path(os.path.join(claimed, 'data'))
+
+    def unclaim(self, meta):
+        """Give a claimed session back after a failed finalization.
+
+        If its data already moved into the blob store, the session cannot be
+        completed again and is removed instead.
+        """
+        claimed = meta.get('claimed')
+        if not claimed:
+            return
+        if not os.path.isfile(os.path.join(claimed, 'data')):
+            self.discard(meta)
+            return
+        del meta['claimed']
+        os.rename(claimed, os.path.join(self.root(), meta['id']))
+
+    def describe(self, meta, complete_url):
+        """JSON body telling a client how to send the file and where to finish"""
+        return dict(
+            self.status(meta),
+            upload_id=meta['id'],
+            size=meta['size'],
+            chunk_size=meta['chunk_size'],
+            chunk_count=meta['chunk_count'],
+            upload_url=url_for('main.resumable_upload', upload_id=meta['id']),
+            complete_url=complete_url,
+        )
+
+    def discard(self, meta):
+        """Remove a session and whatever is left of its files"""
+        shutil.rmtree(meta.get('claimed') or os.path.join(self.root(), meta['id']), ignore_errors=True)
+
+    def collect_garbage(self, ttl=None):
+        """Remove sessions untouched for longer than ttl seconds; returns how many"""
+        ttl = self.ttl if ttl is None else float(ttl)
+        cutoff = time.time() - ttl
+        removed = 0
+        try:
+            entries = os.listdir(self.root())
+        except FileNotFoundError:
+            return 0
+        for name in entries:
+            directory = os.path.join(self.root(), name)
+            try:
+                touched = max(os.path.getmtime(os.path.join(directory, f)) for f in os.listdir(directory))
+            except (FileNotFoundError, NotADirectoryError, ValueError):
+                touched = 0  # Empty or half-removed
+            if touched < cutoff:
+                shutil.rmtree(directory, ignore_errors=True)
+                removed += 1
+        if removed:
+            logger.info(f"Removed {removed} abandoned upload sessions")
+        metrics.incr('resumable.collected', removed)
+        return removed
+
+# One instance per worker process
+resumable_uploads = ResumableUploads()
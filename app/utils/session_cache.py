@@ -0,0 +1,83 @@
+import copy
+import logging
+import threading
+import time
+from collections import OrderedDict
+from app.utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+class SessionCache:
+    """Per-worker LRU cache of decoded session payloads with a TTL.
+
+    Every entry is tagged with the version of the payload it was decoded
+    from. The version travels in the session cookie, so a lookup only hits
+    when the browser presents the payload version this worker already
+    holds; writes made by other workers change the cookie version and miss.
+    The TTL bounds how long an entry may outlive changes that do not go
+    through a cookie (expiry or deletion on the Redis side).
+    """
+
+    def __init__(self, max_entries=2048, ttl=30):
+        self.max_entries = max(1, int(max_entries))
+        self.ttl = float(ttl)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, sid, version):
+        """Return a private copy of the cached data for sid, or None"""
+        if not version:
+            metrics.incr('session_cache.misses')
+            return None
+
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(sid)
+            if entry is None:
+                data = None
+            elif entry[2] <= now:
+                del self._entries[sid]
+                metrics.incr('session_cache.expired')
+                data = None
+            elif entry[0] != version:
+                data = None
+            else:
+                self._entries.move_to_end(sid)
+                data = entry[1]
+
+        if data is None:
+            metrics.incr('session_cache.misses')
+            return None
+        metrics.incr('session_cache.hits')
+        # Callers mutate the session in place, never hand out the cached dict
+        return copy.deepcopy(data)
+
+    def put(self, sid, version, data):
+        """Store a copy of decoded session data under its payload version"""
+        if not version:
+            return
+        entry = (version, copy.deepcopy(data), time.monotonic() + self.ttl)
+        with self._lock:
+            self._entries[sid] = entry
+            self._entries.move_to_end(sid)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                metrics.incr('session_cache.evictions')
+
+    def invalidate(self, sid):
+        """Drop any cached data for sid"""
+        with self._lock:
+            if self._entries.pop(sid, None) is not None:
+                metrics.incr('session_cache.invalidations')
+
+    def clear(self):
+        """Drop all cached sessions"""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """Return cache counters and current size"""
+        stats = metrics.snapshot('session_cache.')
+        with self._lock:
+            stats['session_cache.size'] = len(self._entries)
+        return stats
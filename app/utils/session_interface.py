@@ -1,11 +1,17 @@
 import json
+import base64
+import hashlib
 import logging
+import time
 from datetime import datetime, timedelta
 from uuid import uuid4
-import asyncio
 from flask.sessions import SessionInterface, SessionMixin
 from werkzeug.datastructures import CallbackDict
-from itsdangerous import Signer, BadSignature, want_bytes
+from itsdangerous import Signer, TimestampSigner, BadSignature, SignatureExpired, want_bytes
+from app.utils.async_utils import background_loop
+from app.utils.session_cache import SessionCache
+from app.utils.session_serializer import create_serializer
+from app.utils.metrics import metrics
 
 logger = logging.getLogger(__name__)
 
@@ -15,12 +21,169 @@ class RedisSession(CallbackDict, SessionMixin):
             self.modified = True
         CallbackDict.__init__(self, initial, on_update)
         self.sid = sid
+        self.version = None  # Version of the stored payload this session was loaded from
+        self.previous_sid = None  # Set while a session ID regeneration is pending
+        self.touched = None  # Unix time the stored session's TTL was last set
+        self.revalidated = False  # The Redis key was confirmed for an aging identity hint
         if permanent:
             self.permanent = permanent
         self.modified = False
 
+_MISSING = object()
+
+class SessionNotHinted(RuntimeError):
+    """Raised when a session opened on the ASGI event loop needs data its hint does not hold"""
+
+class LazyRedisSession(RedisSession):
+    """Session that defers the Redis fetch until its data is needed.
+
+    The session cookie carries a signed identity hint with the few keys
+    Flask-Login, Flask and the replica router read on every request (user
+    id, session identifier, freshness, remember flag, permanence, last
+    database write) plus whether flashes are pending. Those lookups are
+    answered from the hint; anything else loads the full payload first.
+
+    The hint is only trusted while the cookie is younger than the session
+    lifetime; past SESSION_HINT_REVALIDATE_SECONDS the session interface
+    confirms the Redis key still exists and issues a fresh cookie.
+    """
+
+    # Keys whose values are copied into the hint
+    HINT_KEYS = ('_user_id', '_last_user_id', '_id', '_fresh', '_remember', '_permanent', '_db_write_at')
+    # Keys whose presence, but not value, is recorded in the hint
+    PRESENCE_KEYS = ('_flashes',)
+
+    def __init__(self, sid=None, hint=None, loader=None):
+        super().__init__(sid=sid)
+        self.hint = hint or {}
+        self.loaded = False
+        self._loader = loader
+
+    @classmethod
+    def make_hint(cls, session):
+        """Build the identity hint for a session's current data"""
+        hint = {key: session[key] for key in cls.HINT_KEYS if key in session}
+        hint.update({key: 1 for key in cls.PRESENCE_KEYS if key in session})
+        hint['#'] = len(session)
+        return hint
+
+    def ensure_loaded(self):
+        """Fetch the session data now instead of on first access"""
+        self._load()
+
+    def _load(self):
+        if not self.loaded:
+            self.loaded = True
+            data = self._loader(self)
+            if data:
+                dict.update(self, data)
+            metrics.incr('session.lazy_loads')
+
+    def _hinted(self, key):
+        """Value of key according to the hint, _MISSING if absent, None if unknown"""
+        if key in self.HINT_KEYS:
+            return self.hint.get(key, _MISSING), True
+        if key in self.PRESENCE_KEYS and key not in self.hint:
+            return _MISSING, True
+        return None, False
+
+    def get(self, key, default=None):
+        if not self.loaded:
+            value, known = self._hinted(key)
+            if known:
+                return default if value is _MISSING else value
+            self._load()
+        return super().get(key, default)
+
+    def __getitem__(self, key):
+        if not self.loaded:
+            value, known = self._hinted(key)
+            if known:
+                if value is _MISSING:
+                    raise KeyError(key)
+                return value
+            self._load()
+        return super().__getitem__(key)
+
+    def __contains__(self, key):
+        if not self.loaded:
+            value, known = self._hinted(key)
+            if known:
+                return value is not _MISSING
+            self._load()
+        return super().__contains__(key)
+
+    def __bool__(self):
+        if not self.loaded:
+            return self.hint.get('#', 0) > 0
+        return super().__len__() > 0
+
+    def clear(self):
+        # Nothing to merge when everything is discarded
+        self.loaded = True
+        super().clear()
+        self.modified = True
+
+    # Everything else needs the real data
+    def __iter__(self):
+        self._load()
+        return super().__iter__()
+
+    def __len__(self):
+        self._load()
+        return super().__len__()
+
+    def __eq__(self, other):
+        self._load()
+        return super().__eq__(other)
+
+    __hash__ = None
+
+    def __repr__(self):
+        self._load()
+        return super().__repr__()
+
+    def keys(self):
+        self._load()
+        return super().keys()
+
+    def values(self):
+        self._load()
+        return super().values()
+
+    def items(self):
+        self._load()
+        return super().items()
+
+    def copy(self):
+        self._load()
+        return dict(super().items())
+
+    def __setitem__(self, key, value):
+        self._load()
+        super().__setitem__(key, value)
+
+    def __delitem__(self, key):
+        self._load()
+        super().__delitem__(key)
+
+    def pop(self, key, *default):
+        self._load()
+        return super().pop(key, *default)
+
+    def popitem(self):
+        self._load()
+        return super().popitem()
+
+    def setdefault(self, key, default=None):
+        self._load()
+        return super().setdefault(key, default)
+
+    def update(self, *args, **kwargs):
+        self._load()
+        super().update(*args, **kwargs)
+
 class UpstashRedisSessionInterface(SessionInterface):
-    serializer = json
     session_class = RedisSession
 
     def __init__(self, redis, app, key_prefix='session:', use_signer=True, permanent=True):
@@ -29,61 +192,150 @@ class UpstashRedisSessionInterface(SessionInterface):
         self.key_prefix = key_prefix
         self.use_signer = use_signer
         self.permanent = permanent
-        self._loop = None
         if not app.secret_key:
             raise RuntimeError('The session is unavailable because no secret '
                              'key was set. Set the secret_key on the '
                              'application to something unique and secret.')
-        self.signer = Signer(app.secret_key, salt='flask-session', key_derivation='hmac')
+        # The signature carries the time the cookie was issued, which bounds how long its hint is trusted
+        self.signer = TimestampSigner(app.secret_key, salt='flask-session', key_derivation='hmac')
+        # Cookies signed before timestamps were added; accepted without their hint
+        self.legacy_signer = Signer(app.secret_key, salt='flask-session', key_derivation='hmac')
+        # Reads accept every stored format, the setting only picks what is written
+        self.serializer = create_serializer(
+            app.config.get('SESSION_SERIALIZER', 'json'),
+            compress_threshold=app.config.get('SESSION_COMPRESS_THRESHOLD', 512)
+        )
+        self.cache = None
+        if app.config.get('SESSION_CACHE_ENABLED', True):
+            self.cache = SessionCache(
+                max_entries=app.config.get('SESSION_CACHE_MAX_ENTRIES', 2048),
+                ttl=app.config.get('SESSION_CACHE_TTL', 30)
+            )
+        self.lazy = app.config.get('SESSION_LAZY_LOADING', True)
         logger.debug(f"Initialized session interface with key_prefix={key_prefix}, use_signer={use_signer}")
 
     def _should_regenerate(self, session):
-        """Check if session should be regenerated for security."""
+        """Check if session should be regenerated for security.
+
+        Only a change of the logged-in user (a privilege change) counts.
+        _last_user_id records the user the current ID was issued for, so
+        each login regenerates exactly once.
+        """
         if not session:
             return False
-        should_regen = session.get('_fresh', False) or session.get('_user_id', None) != session.get('_last_user_id', None)
+        should_regen = session.get('_user_id', None) != session.get('_last_user_id', None)
         if should_regen:
             logger.debug(f"Session regeneration required for user_id={session.get('_user_id')}")
         return should_regen
 
     def _regenerate_sid(self, session):
-        """Regenerate session ID to prevent session fixation."""
-        old_sid = self.key_prefix + session.sid
-        new_sid = self.key_prefix + self._generate_sid()
+        """Regenerate session ID to prevent session fixation.
+
+        The new ID is only assigned here; save_session moves the data to it
+        and removes the old key with one atomic server-side script.
+        """
+        if session.previous_sid is None:
+            session.previous_sid = session.sid
+        session.sid = self._generate_sid()
         session['_last_user_id'] = session.get('_user_id')
-        
-        logger.debug(f"Regenerating session - old_sid={old_sid}, new_sid={new_sid}")
-        
-        # Get current session data
-        val = self.serializer.dumps(dict(session))
-        
-        # Atomically recreate session with new ID
+        metrics.incr('session.regenerations')
+        logger.debug(f"Regenerating session - old_sid={session.previous_sid}, new_sid={session.sid}")
+
+    def _write_session(self, session, val, expiry):
+        """Write session data to Redis in one round trip, completing any pending regeneration"""
+        old_sid = session.previous_sid
+        if old_sid is None:
+            self.redis_manager.sync.set(self.key_prefix + session.sid, val, ex=expiry)
+            return
+
         try:
-            loop = self._get_or_create_event_loop()
-            success = loop.run_until_complete(asyncio.ensure_future(
-                self.redis_manager.recreate_session(old_sid, new_sid, val)
-            ))
+            success = self.redis_manager.sync.recreate_session(self.key_prefix + old_sid,
+                                                               self.key_prefix + session.sid,
+                                                               val, expiry=expiry)
             logger.debug(f"Session regeneration {'succeeded' if success else 'failed'}")
         except Exception as e:
             logger.error(f"Session regeneration failed: {str(e)}")
             success = False
-        
+
+        if self.cache:
+            self.cache.invalidate(old_sid)
         if success:
-            session.sid = new_sid.replace(self.key_prefix, '', 1)  # Remove prefix for cookie
-        else:
-            logger.warning(f"Failed to regenerate session ID for user {session.get('user_id')}")
+            session.previous_sid = None
+            return
+
+        # Keep the data under the old ID rather than losing the session
+        logger.warning(f"Failed to regenerate session ID for user {session.get('user_id')}")
+        session.sid = old_sid
+        session.previous_sid = None
+        self.redis_manager.sync.set(self.key_prefix + session.sid, val, ex=expiry)
+
+    def _session_keys(self, session):
+        """Redis keys holding data for a session, including one pending regeneration"""
+        sids = [sid for sid in (session.sid, session.previous_sid) if sid]
+        return [self.key_prefix + sid for sid in sids]
+
+    def _invalidate_cached(self, session):
+        """Drop cached data for the session and any ID it is replacing"""
+        if self.cache:
+            for sid in (session.sid, session.previous_sid):
+                if sid:
+                    self.cache.invalidate(sid)
 
-    def _get_or_create_event_loop(self):
-        """Get existing event loop or create a new one"""
+    def _payload_version(self, val):
+        """Short content hash identifying a serialized session payload"""
+        return hashlib.blake2b(want_bytes(val), digest_size=8).hexdigest()
+
+    def _expiry(self, app):
+        """Session TTL in seconds (minimum 5 minutes, maximum 30 days)"""
+        lifetime = app.permanent_session_lifetime
+        if isinstance(lifetime, timedelta):
+            return max(300, min(int(lifetime.total_seconds()), 2592000))
+        return 86400  # Default to 1 day
+
+    def _unsign(self, app, value):
+        """Check a cookie's signature, returning (value, issued unix time or None); None when invalid.
+
+        Cookies older than the session lifetime are rejected. Cookies from
+        before timestamped signatures come back with issued None.
+        """
+        try:
+            value, issued = self.signer.unsign(value, max_age=self._expiry(app), return_timestamp=True)
+            return value.decode(), issued.timestamp()
+        except SignatureExpired:
+            logger.debug("Session cookie older than the session lifetime")
+            return None
+        except BadSignature:
+            pass
         try:
-            loop = asyncio.get_event_loop()
-            if loop.is_closed():
-                raise RuntimeError("Event loop is closed")
-            return loop
-        except RuntimeError:
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            return loop
+            return self.legacy_signer.unsign(value).decode(), None
+        except BadSignature:
+            return None
+
+    def _trusted_hint(self, app, issued, touched, hint):
+        """Decoded identity hint, or None when the cookie is too old to answer from it.
+
+        Returns (hint, confirm) where confirm says the Redis key must be
+        checked before the hint may be used.
+        """
+        if not hint or issued is None:
+            return None, False
+        now = time.time()
+        # The Redis key has expired by now, whatever the cookie says
+        if touched is not None and now - touched > self._expiry(app):
+            return None, False
+        hint = self._decode_hint(hint)
+        if hint is None:
+            return None, False
+        return hint, now - issued > app.config.get('SESSION_HINT_REVALIDATE_SECONDS', 60)
+
+    def _session_exists(self, sid):
+        """Whether the session's Redis key still exists; None if Redis could not be asked"""
+        try:
+            metrics.incr('session.revalidations')
+            return bool(self.redis_manager.sync.exists(self.key_prefix + sid))
+        except Exception as e:
+            logger.error(f"Failed to revalidate session: {str(e)}")
+            return None
 
     def open_session(self, app, request):
         """Open a Flask session."""
@@ -98,37 +350,187 @@ class UpstashRedisSessionInterface(SessionInterface):
             logger.debug(f"New session created with sid={sid}")
             return self.session_class(sid=sid, permanent=self.permanent)
 
+        issued = None
         if self.use_signer:
-            try:
-                sid_as_bytes = self.signer.unsign(sid)
-                sid = sid_as_bytes.decode()
-                logger.debug(f"Unsigned session ID: {sid}")
-            except BadSignature:
-                logger.warning("Invalid session signature, creating new session")
+            unsigned = self._unsign(app, sid)
+            if unsigned is None:
+                logger.warning("Invalid or expired session signature, creating new session")
                 sid = self._generate_sid()
                 return self.session_class(sid=sid, permanent=self.permanent)
+            sid, issued = unsigned
+            logger.debug(f"Unsigned session ID: {sid}")
 
-        loop = self._get_or_create_event_loop()
+        sid, version, touched, hint = self._parse_cookie_value(sid)
+        metrics.incr('session.opened')
+
+        data = self.cache.get(sid, version) if self.cache else None
+        if data is not None:
+            logger.debug(f"Session cache hit for sid={sid}")
+        elif self.lazy and hint:
+            hint, confirm = self._trusted_hint(app, issued, touched, hint)
+            exists = self._session_exists(sid) if hint is not None and confirm else True
+            if exists is False:
+                # Logged out, expired or deleted elsewhere; the hint must not outlive the data
+                return self.session_class(sid=self._generate_sid(), permanent=self.permanent)
+            if hint is not None and exists:
+                return self._lazy_session(sid, version, touched, hint, confirm, self._load_lazy)
+
+        if data is None:
+            data, version = self._fetch_session_data(sid)
+            if data is None:
+                return self.session_class(sid=self._generate_sid(), permanent=self.permanent)
+
+        logger.debug(f"Loaded session data: user_id={data.get('user_id')}, fresh={data.get('_fresh')}")
+        session = self.session_class(data, sid=sid)
+        session.version = version
+        session.touched = touched
+        return session
+
+    def _lazy_session(self, sid, version, touched, hint, revalidated, loader):
+        session = LazyRedisSession(sid=sid, hint=hint, loader=loader)
+        session.version = version
+        session.touched = touched
+        session.revalidated = revalidated
+        metrics.incr('session.lazy_deferred')
+        return session
+
+    async def open_session_async(self, app, request):
+        """open_session for the ASGI event loop; None when the request needs open_session.
+
+        Only a session answered by its identity hint is opened here, with an
+        async EXISTS once the cookie is older than
+        SESSION_HINT_REVALIDATE_SECONDS. Reading a key the hint does not
+        hold raises SessionNotHinted instead of blocking the loop on Redis.
+        """
+        cookie = request.cookies.get(app.config['SESSION_COOKIE_NAME'])
+        if not cookie or not self.lazy or not self.use_signer:
+            return None
+        unsigned = self._unsign(app, cookie)
+        if unsigned is None:
+            return None
+        value, issued = unsigned
+        sid, version, touched, hint = self._parse_cookie_value(value)
+        hint, confirm = self._trusted_hint(app, issued, touched, hint)
+        if hint is None:
+            return None
+        if confirm:
+            try:
+                metrics.incr('session.revalidations')
+                exists = await background_loop.run_async(self.redis_manager.exists(self.key_prefix + sid),
+                                                         timeout=self.redis_manager.command_timeout)
+            except Exception as e:
+                logger.error(f"Failed to revalidate session: {str(e)}")
+                return None
+            if not exists:
+                return None  # open_session starts the new session
+        metrics.incr('session.opened')
+        return self._lazy_session(sid, version, touched, hint, confirm, self._refuse_load)
+
+    def _refuse_load(self, session):
+        raise SessionNotHinted(f"Session {session.sid} needs its data from Redis")
+
+    def _fetch_session_data(self, sid):
+        """Read and decode session data from Redis, returning (data, version)"""
         try:
             logger.debug(f"Fetching session data for sid={sid}")
-            coro = asyncio.ensure_future(self.redis_manager.get(self.key_prefix + sid))
-            val = loop.run_until_complete(coro)
+            metrics.incr('session.redis_reads')
+            val = self.redis_manager.sync.get(self.key_prefix + sid)
         except Exception as e:
             logger.error(f"Failed to get session data: {str(e)}")
             val = None
-        
-        if val is not None:
-            try:
-                data = self.serializer.loads(val)
-                logger.debug(f"Loaded session data: user_id={data.get('user_id')}, fresh={data.get('_fresh')}")
-                session = self.session_class(data, sid=sid)
-                if self._should_regenerate(session):
-                    self._regenerate_sid(session)
-                return session
-            except Exception as e:
-                logger.error(f"Failed to load session data: {str(e)}")
-                return self.session_class(sid=self._generate_sid(), permanent=self.permanent)
-        return self.session_class(sid=self._generate_sid(), permanent=self.permanent)
+
+        if val is None:
+            return None, None
+
+        try:
+            data = self.serializer.loads(val)
+        except Exception as e:
+            logger.error(f"Failed to load session data: {str(e)}")
+            return None, None
+
+        version = self._payload_version(val)
+        if self.cache:
+            self.cache.put(sid, version, data)
+        return data, version
+
+    def _load_lazy(self, session):
+        """Loader for LazyRedisSession, starting afresh if the data is gone"""
+        sid = session.previous_sid or session.sid
+        data, version = self._fetch_session_data(sid)
+        if data is None:
+            session.sid = self._generate_sid()
+            session.previous_sid = None
+            session.version = None
+            return {}
+        session.version = version
+        return data
+
+    def peek_hint(self, cookie_value):
+        """Identity hint in a session cookie, checked without Redis; None when unavailable.
+
+        Used where a request is answered outside Flask (the ASGI download
+        path); only signed cookies young enough to skip revalidation are
+        trusted, anything older goes through Flask, which confirms the
+        session and issues a fresh cookie.
+        """
+        if not cookie_value or not self.lazy or not self.use_signer:
+            return None
+        unsigned = self._unsign(self.app, cookie_value)
+        if unsigned is None:
+            return None
+        value, issued = unsigned
+        _, _, touched, hint = self._parse_cookie_value(value)
+        hint, confirm = self._trusted_hint(self.app, issued, touched, hint)
+        return None if confirm else hint
+
+    def _parse_cookie_value(self, value):
+        """Split an unsigned cookie into (sid, version, touched, hint).
+
+        Cookies carry the payload version, the time the TTL was last set and
+        the identity hint after the session ID: sid:version:touched:hint
+        """
+        sid, version, touched, hint = (value.split(':', 3) + ['', '', ''])[:4]
+        try:
+            touched = int(touched)
+        except ValueError:
+            touched = None
+        return sid, version, touched, hint
+
+    def _cookie_value(self, session):
+        value = f"{session.sid}:{session.version or ''}:{session.touched or ''}"
+        if self.lazy:
+            value = f"{value}:{self._encode_hint(session)}"
+        if self.use_signer:
+            value = self.signer.sign(want_bytes(value)).decode('utf-8')
+        return value
+
+    def _needs_refresh(self, app, session, expiry, now):
+        """Check whether an unchanged session is old enough to have its TTL extended"""
+        if not app.config.get('SESSION_REFRESH_EACH_REQUEST', True) or not session.permanent:
+            return False
+        if session.version is None:
+            return False  # Nothing has been stored for this session ID yet, there is no TTL to extend
+        if session.touched is None:
+            return True
+        fraction = app.config.get('SESSION_REFRESH_FRACTION', 0.5)
+        return now - session.touched >= expiry * fraction
+
+    def _encode_hint(self, session):
+        if isinstance(session, LazyRedisSession) and not session.loaded:
+            hint = session.hint  # Unchanged, and rebuilding it would force a load
+        else:
+            hint = LazyRedisSession.make_hint(session)
+        payload = json.dumps(hint, separators=(',', ':'))
+        return base64.urlsafe_b64encode(payload.encode('utf-8')).rstrip(b'=').decode('ascii')
+
+    def _decode_hint(self, value):
+        try:
+            padded = value + '=' * (-len(value) % 4)
+            hint = json.loads(base64.urlsafe_b64decode(padded))
+            return hint if isinstance(hint, dict) else None
+        except (ValueError, TypeError):
+            logger.warning("Invalid session identity hint, loading session eagerly")
+            return None
 
     def save_session(self, app, session, response):
         domain = self._get_domain(app)
@@ -143,12 +545,11 @@ class UpstashRedisSessionInterface(SessionInterface):
             if session.modified:
                 logger.debug("Empty modified session, deleting")
                 try:
-                    loop = self._get_or_create_event_loop()
-                    coro = asyncio.ensure_future(self.redis_manager.delete(self.key_prefix + session.sid))
-                    loop.run_until_complete(coro)
+                    self.redis_manager.sync.delete(*self._session_keys(session))
                 except Exception as e:
                     logger.error(f"Failed to delete null session: {str(e)}")
                 finally:
+                    self._invalidate_cached(session)
                     response.delete_cookie(app.config['SESSION_COOKIE_NAME'], 
                                         domain=domain, 
                                         path=path,
@@ -157,42 +558,93 @@ class UpstashRedisSessionInterface(SessionInterface):
                                         samesite=self.get_cookie_samesite(app))
             return
 
-        # Avoid empty sessions
-        if not session or not session.modified:
-            logger.debug("Session not modified, skipping save")
-            return
+        # Issue a new ID once per privilege change, as part of this save
+        if self._should_regenerate(session):
+            self._regenerate_sid(session)
 
-        # Set session expiry (minimum 5 minutes, maximum 30 days)
-        lifetime = app.permanent_session_lifetime
-        if isinstance(lifetime, timedelta):
-            expiry = max(300, min(int(lifetime.total_seconds()), 2592000))
+        expiry = self._expiry(app)
+        now = int(time.time())
+
+        val = None
+        if session.modified:
+            val = self.serializer.dumps(dict(session))
+            version = self._payload_version(val)
+            # Keys rewritten with the values they already had are not a change
+            if version == session.version and session.previous_sid is None:
+                logger.debug("Session keys rewritten with unchanged values")
+                val = None
+
+        if val is None and not self._needs_refresh(app, session, expiry, now):
+            if not session.revalidated:
+                logger.debug("Session not modified, skipping save")
+                metrics.incr('session.writes_skipped')
+                return
+            # Redis is untouched; the cookie is reissued so its hint is trusted again
+            logger.debug(f"Session revalidated, reissuing cookie - sid={session.sid}")
+        elif val is None:
+            # Only the TTL needs extending, the payload in Redis is already current
+            try:
+                self.redis_manager.sync.set_expiry(self.key_prefix + session.sid, expiry)
+                session.touched = now
+                metrics.incr('session.ttl_refreshes')
+                logger.debug(f"Session TTL refreshed - sid={session.sid}, expiry={expiry}s")
+            except Exception as e:
+                logger.error(f"Failed to refresh session expiry: {str(e)}")
+                return
         else:
-            expiry = 86400  # Default to 1 day
-        
-        val = self.serializer.dumps(dict(session))
-        sid = session.sid
-        logger.debug(f"Saving session - sid={sid}, expiry={expiry}s")
+            logger.debug(f"Saving session - sid={session.sid}, expiry={expiry}s")
+            try:
+                self._write_session(session, val, expiry)
+                session.version = version
+                session.touched = now
+                if self.cache:
+                    self.cache.put(session.sid, version, dict(session))
+                metrics.incr('session.writes')
+                logger.debug(f"Session saved successfully with expiry={expiry}s")
+            except Exception as e:
+                logger.error(f"Failed to save session data: {str(e)}")
+                if self.cache:
+                    self.cache.invalidate(session.sid)
 
-        if self.use_signer:
-            sid = self.signer.sign(want_bytes(sid)).decode('utf-8')
+        # The cookie is written last so it names the key that actually holds the data
+        self._set_cookie(app, session, response)
+
+    async def save_session_async(self, app, session, response):
+        """save_session for a session from open_session_async, on the ASGI event loop.
 
-        response.set_cookie(app.config['SESSION_COOKIE_NAME'], sid,
+        Handles the unchanged session: an async EXPIRE when its TTL is due
+        for a refresh and a reissued cookie. Returns False, having done
+        nothing, when the session changed; the caller then runs
+        save_session on a thread.
+        """
+        if session.modified or session.loaded or self._should_regenerate(session):
+            return False
+        expiry = self._expiry(app)
+        now = int(time.time())
+        if self._needs_refresh(app, session, expiry, now):
+            try:
+                await background_loop.run_async(self.redis_manager.set_expiry(self.key_prefix + session.sid, expiry),
+                                                timeout=self.redis_manager.command_timeout)
+                session.touched = now
+                metrics.incr('session.ttl_refreshes')
+            except Exception as e:
+                logger.error(f"Failed to refresh session expiry: {str(e)}")
+                return True
+        elif not session.revalidated:
+            metrics.incr('session.writes_skipped')
+            return True
+        self._set_cookie(app, session, response)
+        return True
+
+    def _set_cookie(self, app, session, response):
+        response.set_cookie(app.config['SESSION_COOKIE_NAME'], self._cookie_value(session),
                           expires=self.get_expiration_time(app, session),
                           httponly=self.get_cookie_httponly(app),
-                          domain=domain,
-                          path=path,
+                          domain=self._get_domain(app),
+                          path=self.get_cookie_path(app),
                           secure=self.get_cookie_secure(app),
                           samesite=self.get_cookie_samesite(app))
 
-        loop = self._get_or_create_event_loop()
-        try:
-            expiry = expiry or 86400  # Default to 1 day if not specified
-            coro = asyncio.ensure_future(self.redis_manager.set(self.key_prefix + session.sid, val, ex=expiry))
-            loop.run_until_complete(coro)
-            logger.debug(f"Session saved successfully with expiry={expiry}s")
-        except Exception as e:
-            logger.error(f"Failed to save session data: {str(e)}")
-
     def _generate_sid(self):
         """Generate a unique session ID."""
         return str(uuid4())
@@ -215,14 +667,14 @@ class UpstashRedisSessionInterface(SessionInterface):
         path = self.get_cookie_path(app)
         
         try:
-            loop = self._get_or_create_event_loop()
             if session.sid:
                 logger.debug(f"Deleting session - sid={session.sid}")
-                coro = asyncio.ensure_future(self.redis_manager.delete(self.key_prefix + session.sid))
-                loop.run_until_complete(coro)
+                self.redis_manager.sync.delete(*self._session_keys(session))
                 logger.debug("Session deleted successfully")
         except Exception as e:
             logger.error(f"Failed to delete session data: {str(e)}")
+        finally:
+            self._invalidate_cached(session)
         
         response.delete_cookie(app.config['SESSION_COOKIE_NAME'],
                              domain=domain,
@@ -0,0 +1,249 @@
+import base64
+import json
+import re
+import struct
+import zlib
+from abc import ABC, abstractmethod
+from app.utils.metrics import metrics
+
+# Stored payloads must stay valid UTF-8 text: the Upstash REST API and the
+# native backend both hand values back as strings. Binary payloads are
+# therefore base85 encoded behind a prefix that cannot start a JSON object.
+BINARY_PREFIX = '~'
+FORMAT_VERSION = 2
+FLAG_ZLIB = 0x01
+
+# Keys written on (almost) every session, stored as a single byte.
+# Append only: a key's position is its wire code.
+KEY_TABLE = (
+    '_user_id', '_last_user_id', '_id', '_fresh', '_remember', '_remember_seconds',
+    '_permanent', '_flashes', 'user_id', 'email', 'first_name', 'last_name', 'role',
+    'csrf_token', '_db_write_at',
+)
+KEY_CODES = {key: code for code, key in enumerate(KEY_TABLE)}
+# How many KEY_TABLE entries each format version knows. Appending a key needs a
+# new FORMAT_VERSION, so workers that predate it reject the payload by version.
+KEY_COUNTS = {1: 14, 2: 15}
+LITERAL_KEY = 0xFF
+
+# Value tags
+T_NONE, T_FALSE, T_TRUE, T_INT, T_FLOAT, T_STR, T_DIGITS, T_HEX, T_LIST, T_DICT = range(10)
+
+# Strings that round-trip exactly through int() and bytes.fromhex()
+_DIGITS_RE = re.compile(r'(?:0|[1-9][0-9]{0,17})')
+_HEX_RE = re.compile(r'(?:[0-9a-f]{2}){8,}')
+
+
+class SessionSerializer(ABC):
+    """Base session serializer with the json module's dumps/loads interface.
+
+    loads() accepts every format a serializer has ever written, whichever
+    one this instance writes, so the write format can be switched during a
+    rolling upgrade without losing sessions.
+    """
+
+    @abstractmethod
+    def dumps(self, data):
+        """Encode a session dict in this serializer's write format"""
+
+    def loads(self, value):
+        if isinstance(value, bytes):
+            value = value.decode('utf-8')
+        if value.startswith(BINARY_PREFIX):
+            return self._loads_binary(value)
+        metrics.incr('session.json_reads')
+        return json.loads(value)
+
+    @staticmethod
+    def _loads_binary(value):
+        try:
+            raw = base64.b85decode(value[len(BINARY_PREFIX):])
+        except ValueError as e:
+            raise ValueError(f"Invalid binary session payload: {e}")
+        if len(raw) < 2:
+            raise ValueError("Truncated binary session payload")
+        version, flags = raw[0], raw[1]
+        if version not in KEY_COUNTS:
+            raise ValueError(f"Unsupported session format version {version}")
+        body = raw[2:]
+        if flags & FLAG_ZLIB:
+            body = zlib.decompress(body)
+        decoder = _Decoder(body, KEY_COUNTS[version])
+        data = decoder.value()
+        if not decoder.done():
+            raise ValueError("Trailing bytes in binary session payload")
+        return data
+
+
+class JsonSessionSerializer(SessionSerializer):
+    """Writes plain JSON, as sessions were stored before the binary format"""
+
+    def dumps(self, data):
+        return json.dumps(data, separators=(',', ':'))
+
+
+class BinarySessionSerializer(SessionSerializer):
+    """Compact tagged binary format with optional zlib compression.
+
+    Layout: version byte, flags byte, then one encoded value. Known keys are
+    one byte, booleans and None are a bare tag, integers and decimal id
+    strings are varints, and hex digests are stored as raw bytes. Bodies of
+    at least compress_threshold bytes are compressed when that helps.
+    """
+
+    def __init__(self, compress_threshold=512, compress_level=6):
+        self.compress_threshold = compress_threshold
+        self.compress_level = compress_level
+
+    def dumps(self, data):
+        out = bytearray()
+        _encode(data, out)
+        flags = 0
+        body = bytes(out)
+        if self.compress_threshold is not None and len(body) >= self.compress_threshold:
+            compressed = zlib.compress(body, self.compress_level)
+            if len(compressed) < len(body):
+                body = compressed
+                flags |= FLAG_ZLIB
+                metrics.incr('session.compressed_writes')
+        payload = bytes((FORMAT_VERSION, flags)) + body
+        return BINARY_PREFIX + base64.b85encode(payload).decode('ascii')
+
+
+def create_serializer(name='json', compress_threshold=512):
+    """Pick the write format by name: 'binary' (compact) or 'json' (legacy)"""
+    if name == 'binary':
+        return BinarySessionSerializer(compress_threshold=compress_threshold)
+    if name == 'json':
+        return JsonSessionSerializer()
+    raise ValueError(f"Unsupported session serializer: {name!r}")
+
+
+def _write_varint(number, out):
+    while number >= 0x80:
+        out.append((number & 0x7F) | 0x80)
+        number >>= 7
+    out.append(number)
+
+
+def _write_bytes(data, out):
+    _write_varint(len(data), out)
+    out += data
+
+
+def _encode(value, out):
+    if value is None:
+        out.append(T_NONE)
+    elif value is True:
+        out.append(T_TRUE)
+    elif value is False:
+        out.append(T_FALSE)
+    elif isinstance(value, int):
+        out.append(T_INT)
+        _write_varint(value * 2 if value >= 0 else -value * 2 - 1, out)  # zigzag
+    elif isinstance(value, float):
+        out.append(T_FLOAT)
+        out += struct.pack('>d', value)
+    elif isinstance(value, str):
+        if _DIGITS_RE.fullmatch(value):
+            out.append(T_DIGITS)
+            _write_varint(int(value), out)
+        elif _HEX_RE.fullmatch(value):
+            out.append(T_HEX)
+            _write_bytes(bytes.fromhex(value), out)
+        else:
+            out.append(T_STR)
+            _write_bytes(value.encode('utf-8'), out)
+    elif isinstance(value, (list, tuple)):
+        out.append(T_LIST)
+        _write_varint(len(value), out)
+        for item in value:
+            _encode(item, out)
+    elif isinstance(value, dict):
+        out.append(T_DICT)
+        _write_varint(len(value), out)
+        for key, item in value.items():
+            if not isinstance(key, str):
+                raise TypeError(f"Session keys must be strings, not {type(key).__name__}")
+            code = KEY_CODES.get(key)
+            if code is None:
+                out.append(LITERAL_KEY)
+                _write_bytes(key.encode('utf-8'), out)
+            else:
+                out.append(code)
+            _encode(item, out)
+    else:
+        raise TypeError(f"Object of type {type(value).__name__} is not session serializable")
+
+
+class _Decoder:
+    """Cursor over a binary session body"""
+
+    def __init__(self, data, key_count=len(KEY_TABLE)):
+        self.data = data
+        self.key_count = key_count
+        self.pos = 0
+
+    def done(self):
+        return self.pos == len(self.data)
+
+    def _byte(self):
+        if self.pos >= len(self.data):
+            raise ValueError("Truncated binary session payload")
+        byte = self.data[self.pos]
+        self.pos += 1
+        return byte
+
+    def _take(self, length):
+        end = self.pos + length
+        if end > len(self.data):
+            raise ValueError("Truncated binary session payload")
+        chunk = self.data[self.pos:end]
+        self.pos = end
+        return chunk
+
+    def _varint(self):
+        number = shift = 0
+        while True:
+            byte = self._byte()
+            number |= (byte & 0x7F) << shift
+            if byte < 0x80:
+                return number
+            shift += 7
+
+    def _key(self):
+        code = self._byte()
+        if code == LITERAL_KEY:
+            return self._take(self._varint()).decode('utf-8')
+        if code >= self.key_count:
+            raise ValueError(f"Unknown session key code {code}")
+        return KEY_TABLE[code]
+
+    def value(self):
+        tag = self._byte()
+        if tag == T_NONE:
+            return None
+        if tag == T_FALSE:
+            return False
+        if tag == T_TRUE:
+            return True
+        if tag == T_INT:
+            number = self._varint()
+            return number >> 1 if not number & 1 else -(number >> 1) - 1
+        if tag == T_FLOAT:
+            return struct.unpack('>d', self._take(8))[0]
+        if tag == T_DIGITS:
+            return str(self._varint())
+        if tag == T_HEX:
+            return self._take(self._varint()).hex()
+        if tag == T_STR:
+            return self._take(self._varint()).decode('utf-8')
+        if tag == T_LIST:
+            return [self.value() for _ in range(self._varint())]
+        if tag == T_DICT:
+            data = {}
+            for _ in range(self._varint()):
+                key = self._key()
+                data[key] = self.value()
+            return data
+        raise ValueError(f"Unknown session value tag {tag}")
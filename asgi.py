@@ -0,0 +1,12 @@
+"""ASGI entry point.
+
+    uvicorn asgi:application --workers 4 --host 0.0.0.0 --port $PORT
+
+Downloads and the dashboards are served natively on the event loop, every
+other request by the Flask app on a thread pool (see app/asgi.py). The gevent configuration
+in the Procfile remains the default.
+"""
+from app import create_app
+from app.asgi import AsgiApp
+
+application = AsgiApp(create_app())
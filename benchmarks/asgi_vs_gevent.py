@@ -0,0 +1,113 @@
+"""Compare the gevent (Procfile) and ASGI (asgi.py) servers side by side.
+
+Logs in to each server as a student who has uploaded documents, collects
+the download links from the dashboard and then, per server, runs each
+scenario with --concurrency clients for --duration seconds: signed
+downloads, unsigned downloads (authorized by a database query) and the
+dashboard page itself. Prints requests per second and latency percentiles.
+
+    gunicorn "app:create_app()" --workers 4 --worker-class=gevent --worker-connections=1000 -b :8000
+    uvicorn asgi:application --workers 4 --port 8001
+    python benchmarks/asgi_vs_gevent.py --server gevent=http://localhost:8000 \\
+        --server asgi=http://localhost:8001 --email student@example.edu --password secret
+
+Both servers must use the same database, Redis and SECRET_KEY. Rate limits
+apply to the dashboard, so raise them or use a scratch deployment.
+"""
+import argparse
+import html
+import re
+import statistics
+import threading
+import time
+
+import requests
+
+from login_storm import CSRF_RE
+
+LINK_RE = re.compile(r'href="(/uploads/[^"]+)"')
+
+
+def login(base_url, email, password):
+    """A requests session logged in to base_url"""
+    client = requests.Session()
+    page = client.get(f'{base_url}/login')
+    match = CSRF_RE.search(page.text)
+    data = {'email': email, 'password': password}
+    if match:
+        data['csrf_token'] = match.group(1)
+    if client.post(f'{base_url}/login', data=data, allow_redirects=False).status_code != 302:
+        raise SystemExit(f'could not log in to {base_url}')
+    return client
+
+
+def run(client, urls, concurrency, duration):
+    """Fetch urls round-robin from concurrency threads; returns (latencies in ms, errors)"""
+    timings, errors = [], []
+    deadline = time.monotonic() + duration
+
+    def worker(offset):
+        with requests.Session() as own:
+            own.cookies.update(client.cookies)
+            own.headers.update(client.headers)
+            n = offset
+            while time.monotonic() < deadline:
+                started = time.perf_counter()
+                try:
+                    response = own.get(urls[n % len(urls)], allow_redirects=False)
+                    response.content
+                    ok = response.status_code == 200
+                except requests.RequestException:
+                    ok = False
+                (timings if ok else errors).append((time.perf_counter() - started) * 1000)
+                n += 1
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return timings, errors
+
+
+def report(name, timings, errors, duration):
+    if not timings:
+        print(f"    {name}: no successful requests, {len(errors)} errors")
+        return
+    timings = sorted(timings)
+    p95 = timings[int(len(timings) * 0.95) - 1] if len(timings) >= 20 else timings[-1]
+    print(f"    {name}: {len(timings) / duration:7.1f} req/s, p50 {statistics.median(timings):.1f} ms, "
+          f"p95 {p95:.1f} ms, max {timings[-1]:.1f} ms, {len(errors)} errors")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--server', action='append', required=True, metavar='NAME=URL',
+                        help='a server to measure, e.g. asgi=http://localhost:8001 (repeatable)')
+    parser.add_argument('--email', required=True, help='a student account with uploaded documents')
+    parser.add_argument('--password', required=True)
+    parser.add_argument('--concurrency', type=int, default=50, help='clients per scenario')
+    parser.add_argument('--duration', type=float, default=15, help='seconds per scenario')
+    args = parser.parse_args()
+
+    for server in args.server:
+        name, _, base_url = server.partition('=')
+        base_url = base_url.rstrip('/')
+        client = login(base_url, args.email, args.password)
+        page = client.get(f'{base_url}/student/dashboard').text
+        signed = [base_url + html.unescape(link) for link in LINK_RE.findall(page)]
+        if not signed:
+            parser.error(f'{name}: the dashboard shows no documents for this account')
+        scenarios = {
+            'signed downloads': signed,
+            'unsigned downloads': [link.split('?')[0] for link in signed],
+            'dashboard': [f'{base_url}/student/dashboard'],
+        }
+        print(f"{name} ({base_url}), {args.concurrency} clients, {args.duration:.0f}s per scenario")
+        for scenario, urls in scenarios.items():
+            timings, errors = run(client, urls, args.concurrency, args.duration)
+            report(scenario, timings, errors, args.duration)
+
+
+if __name__ == '__main__':
+    main()
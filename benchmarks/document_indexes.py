@@ -0,0 +1,160 @@
+"""Show the effect of the Document indexes on the dashboard and download queries.
+
+Seeds a scratch database with synthetic users and documents, then runs the
+queries behind student.dashboard, faculty.dashboard,
+faculty.reviewed_documents and main.uploaded_file without and with the
+indexes declared on Document, printing each plan and its median time.
+
+    python benchmarks/document_indexes.py --url postgresql://localhost/edusync_bench
+
+The user and document tables are created in the given database and dropped
+afterwards, so point it at a scratch database, never the application's.
+SQLite works for a quick local run (--url sqlite:////tmp/bench.db).
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, inspect, select, text
+from app import db
+from app.models import Document, User
+
+# Dialect-specific SQL fragments used by the seed queries
+SERIES = {
+    'postgresql': "generate_series(1, {n}) AS seq(g)",
+    'sqlite': "(WITH RECURSIVE seq(g) AS (SELECT 1 UNION ALL SELECT g + 1 FROM seq WHERE g < {n}) SELECT g FROM seq)",
+}
+MINUTES_AGO = {
+    'postgresql': "now() - ({minutes}) * interval '1 minute'",
+    'sqlite': "datetime('now', '-' || ({minutes}) || ' minutes')",
+}
+EXPLAIN = {
+    'postgresql': 'EXPLAIN (ANALYZE, BUFFERS) ',
+    'sqlite': 'EXPLAIN QUERY PLAN ',
+}
+
+
+def seed(conn, dialect, documents, students, faculty):
+    """Insert users and documents with set-based SQL"""
+    series, ago = SERIES[dialect], MINUTES_AGO[dialect]
+    users = students + faculty
+    conn.execute(text(f"""
+        INSERT INTO "user" (id, email, password_hash, role, first_name, last_name)
+        SELECT g, 'user' || g || '@bench.edu', 'x',
+               CASE WHEN g <= {faculty} THEN 'faculty' ELSE 'student' END, 'Bench', 'User'
+        FROM {series.format(n=users)}
+    """))
+    # 30% of documents are pending review, the rest were reviewed by the assigned faculty;
+    # the status is hashed from the id so it does not correlate with uploader or faculty
+    pending = 'g * 2654435761 % 1000003 % 10 < 3'
+    conn.execute(text(f"""
+        INSERT INTO document (id, filename, original_filename, file_path, file_type, upload_date,
+                              status, uploader_id, assigned_faculty_id, reviewer_id, review_date)
+        SELECT g, 'doc_' || g || '.pdf', 'doc_' || g || '.pdf',
+               'student_' || uploader || '/doc_' || g || '.pdf', 'pdf', {ago.format(minutes='g % 500000 + 60')},
+               CASE WHEN {pending} THEN 'pending_review' ELSE 'reviewed' END,
+               uploader, faculty,
+               CASE WHEN {pending} THEN NULL ELSE faculty END,
+               CASE WHEN {pending} THEN NULL ELSE {ago.format(minutes='g % 500000')} END
+        FROM (SELECT g, {faculty} + 1 + (g * 7919) % {students} AS uploader,
+                     1 + (g * 104729) % {faculty} AS faculty
+              FROM {series.format(n=documents)}) AS docs
+    """))
+
+
+def queries(conn):
+    """The dashboard and download queries, for one student and one faculty member"""
+    student_id, faculty_id = conn.execute(text(
+        "SELECT uploader_id, assigned_faculty_id FROM document WHERE id = 1"
+    )).one()
+    # The newest document, so a scan cannot stop early
+    file_path = conn.execute(text(
+        "SELECT file_path FROM document ORDER BY id DESC LIMIT 1"
+    )).scalar_one()
+    return {
+        'student.dashboard': select(Document)
+            .where(Document.uploader_id == student_id)
+            .order_by(Document.upload_date.desc()),
+        'faculty.dashboard (pending)': select(Document)
+            .where(Document.assigned_faculty_id == faculty_id, Document.status == 'pending_review')
+            .order_by(Document.upload_date.desc()),
+        'faculty.reviewed_documents': select(Document)
+            .where(Document.assigned_faculty_id == faculty_id, Document.reviewer_id == faculty_id,
+                   Document.status == 'reviewed')
+            .order_by(Document.review_date.desc()),
+        'main.uploaded_file': select(Document)
+            .where(Document.file_path == file_path)
+            .limit(1),
+    }
+
+
+def run_queries(conn, dialect, statements, repeat):
+    for name, statement in statements.items():
+        sql = str(statement.compile(conn, compile_kwargs={'literal_binds': True}))
+        plan = [' | '.join(str(col) for col in row) for row in conn.execute(text(EXPLAIN[dialect] + sql))]
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            rows = len(conn.execute(statement).all())
+            timings.append((time.perf_counter() - started) * 1000)
+        print(f"\n  {name}: {rows} rows, median {statistics.median(timings):.2f} ms")
+        for line in plan:
+            print(f"    {line}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--url', default=os.getenv('BENCH_DATABASE_URL'),
+                        help='scratch database URL (default: $BENCH_DATABASE_URL)')
+    parser.add_argument('--documents', type=int, default=1_000_000)
+    parser.add_argument('--students', type=int, default=20_000)
+    parser.add_argument('--faculty', type=int, default=200)
+    parser.add_argument('--repeat', type=int, default=5, help='timed runs per query')
+    args = parser.parse_args()
+    if not args.url:
+        parser.error('--url or BENCH_DATABASE_URL is required')
+
+    engine = create_engine(args.url.replace('postgres://', 'postgresql://', 1))
+    dialect = engine.dialect.name
+    if dialect not in SERIES:
+        parser.error(f'unsupported database: {dialect}')
+    tables = [User.__table__, Document.__table__]
+    if any(inspect(engine).has_table(table.name) for table in tables):
+        sys.exit('Refusing to run: the database already has user/document tables')
+
+    db.metadata.create_all(engine, tables=tables)
+    try:
+        with engine.begin() as conn:
+            for index in Document.__table__.indexes:
+                index.drop(conn)
+            started = time.perf_counter()
+            seed(conn, dialect, args.documents, args.students, args.faculty)
+            print(f"Seeded {args.documents} documents in {time.perf_counter() - started:.1f}s")
+            conn.execute(text('ANALYZE'))
+
+        with engine.connect() as conn:
+            statements = queries(conn)
+            print('\nWithout indexes:')
+            run_queries(conn, dialect, statements, args.repeat)
+
+        with engine.begin() as conn:
+            started = time.perf_counter()
+            for index in Document.__table__.indexes:
+                index.create(conn)
+            conn.execute(text('ANALYZE'))
+            print(f"\nCreated {len(Document.__table__.indexes)} indexes in {time.perf_counter() - started:.1f}s")
+
+        with engine.connect() as conn:
+            print('\nWith indexes:')
+            run_queries(conn, dialect, statements, args.repeat)
+    finally:
+        db.metadata.drop_all(engine, tables=tables)
+        engine.dispose()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+"""Measure how a burst of logins affects the latency of other requests.
+
+Probes a cheap endpoint at a steady rate, first on an idle server and then
+while --concurrency clients log in as fast as they can, and prints the
+probe latency percentiles for both phases together with the login
+throughput and the number of logins refused with 503 (hashing queue full).
+
+    python benchmarks/login_storm.py --url http://localhost:8000 \\
+        --email student@example.edu --password secret
+
+Run it against a gunicorn server started as in the Procfile, once with
+PASSWORD_HASH_WORKERS=0 (bcrypt inline on the request greenlet) and once
+with the default pool, to compare. Login rate limits apply, so raise them
+or use a scratch deployment.
+"""
+import argparse
+import re
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+CSRF_RE = re.compile(r'name="csrf_token"[^>]*value="([^"]+)"')
+
+
+def login_once(base_url, email, password):
+    """Log in with a fresh client, returning the final status code"""
+    with requests.Session() as client:
+        page = client.get(f'{base_url}/login')
+        match = CSRF_RE.search(page.text)
+        data = {'email': email, 'password': password}
+        if match:
+            data['csrf_token'] = match.group(1)
+        return client.post(f'{base_url}/login', data=data, allow_redirects=False).status_code
+
+
+def storm(base_url, email, password, concurrency, stop, results):
+    def client():
+        while not stop.is_set():
+            try:
+                results.append(login_once(base_url, email, password))
+            except requests.RequestException:
+                results.append(None)
+
+    with ThreadPoolExecutor(concurrency) as pool:
+        for _ in range(concurrency):
+            pool.submit(client)
+
+
+def probe(url, duration, interval):
+    """Request url every interval seconds for duration seconds, returning latencies in ms"""
+    timings = []
+    deadline = time.monotonic() + duration
+    with requests.Session() as client:
+        while time.monotonic() < deadline:
+            started = time.perf_counter()
+            client.get(url, allow_redirects=False)
+            timings.append((time.perf_counter() - started) * 1000)
+            time.sleep(max(0.0, interval - (time.perf_counter() - started)))
+    return timings
+
+
+def report(name, timings):
+    timings = sorted(timings)
+    p95 = timings[int(len(timings) * 0.95) - 1] if len(timings) >= 20 else timings[-1]
+    print(f"  {name}: {len(timings)} probes, p50 {statistics.median(timings):.1f} ms, "
+          f"p95 {p95:.1f} ms, max {timings[-1]:.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--url', required=True, help='base URL of a running server')
+    parser.add_argument('--email', required=True, help='an existing account')
+    parser.add_argument('--password', required=True)
+    parser.add_argument('--probe-path', default='/login', help='endpoint whose latency is measured')
+    parser.add_argument('--concurrency', type=int, default=50, help='clients logging in at once')
+    parser.add_argument('--duration', type=float, default=15, help='seconds per phase')
+    parser.add_argument('--interval', type=float, default=0.05, help='seconds between probes')
+    args = parser.parse_args()
+    base_url = args.url.rstrip('/')
+
+    if login_once(base_url, args.email, args.password) != 302:
+        parser.error('could not log in with the given account')
+
+    print(f"Probing {args.probe_path} for {args.duration:.0f}s per phase")
+    report('idle', probe(base_url + args.probe_path, args.duration, args.interval))
+
+    stop, results = threading.Event(), []
+    thread = threading.Thread(target=storm, daemon=True,
+                              args=(base_url, args.email, args.password, args.concurrency, stop, results))
+    thread.start()
+    time.sleep(1)  # Let the storm build up
+    timings = probe(base_url + args.probe_path, args.duration, args.interval)
+    stop.set()
+    thread.join()
+    report(f'{args.concurrency} concurrent logins', timings)
+
+    elapsed = args.duration + 1
+    print(f"  logins: {results.count(302) / elapsed:.1f}/s succeeded, "
+          f"{results.count(503)} refused with 503, "
+          f"{len(results) - results.count(302) - results.count(503)} other")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,160 @@
+"""Measure email throughput of the outbox sender against a local SMTP stand-in.
+
+Starts a minimal SMTP server that accepts and discards mail (with an
+optional delay per reply, to stand in for a remote server), queues
+--messages emails in a scratch database and sends them twice: once the
+way the outbox does (batches over one connection, `flask send-email`) and
+once with a new connection per message, printing messages per second and
+connections opened for both.
+
+    python benchmarks/outbox_throughput.py --messages 500 --latency 20
+
+The database defaults to a temporary SQLite file. The stand-in refuses
+recipients containing "reject" with 550, so it can also be pointed at by
+a development server (MAIL_SERVER=127.0.0.1 MAIL_PORT=<port>
+MAIL_USE_TLS=false) to try `flask send-email` by hand with --serve.
+"""
+import argparse
+import os
+import socketserver
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+from flask_mail import Message
+from app import db, mail
+from app.models import OutboxEmail
+from app.utils.outbox import email_outbox
+
+
+class SMTPHandler(socketserver.StreamRequestHandler):
+    def reply(self, line):
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        self.wfile.write(line.encode() + b'\r\n')
+
+    def handle(self):
+        with self.server.lock:
+            self.server.connections += 1
+        self.reply('220 stand-in ESMTP')
+        for raw in self.rfile:
+            command = raw.decode(errors='replace').strip()
+            verb = command[:4].upper()
+            if verb == 'EHLO':
+                self.wfile.write(b'250-stand-in\r\n')
+                self.reply('250 8BITMIME')
+            elif verb in ('HELO', 'MAIL', 'RSET', 'NOOP'):
+                self.reply('250 OK')
+            elif verb == 'RCPT':
+                self.reply('550 No such user' if 'reject' in command.lower() else '250 OK')
+            elif verb == 'DATA':
+                self.reply('354 End data with <CR><LF>.<CR><LF>')
+                for line in self.rfile:
+                    if line == b'.\r\n':
+                        break
+                with self.server.lock:
+                    self.server.messages += 1
+                self.reply('250 OK queued')
+            elif verb == 'QUIT':
+                self.reply('221 Bye')
+                return
+            else:
+                self.reply('502 Command not implemented')
+
+
+class SMTPStandIn(socketserver.ThreadingTCPServer):
+    """SMTP server on 127.0.0.1 that counts connections and accepted messages"""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, port=0, latency=0.0):
+        super().__init__(('127.0.0.1', port), SMTPHandler)
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.connections = 0
+        self.messages = 0
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def reset(self):
+        with self.lock:
+            self.connections = self.messages = 0
+
+
+def make_app(url, port):
+    app = Flask(__name__)
+    app.config.update(SQLALCHEMY_DATABASE_URI=url, MAIL_SERVER='127.0.0.1', MAIL_PORT=port,
+                      MAIL_USE_TLS=False, MAIL_DEFAULT_SENDER='bench@example.edu')
+    db.init_app(app)
+    mail.init_app(app)
+    email_outbox.init_app(app)
+    return app
+
+
+def queue(count, tag):
+    for n in range(count):
+        email_outbox.enqueue(f'bench-{tag}-{n}', f'student{n}@example.edu', f'Message {n}',
+                             'Your document has been reviewed.\n' * 20)
+    db.session.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--url', default=None, help='scratch database URL (default: a temporary SQLite file)')
+    parser.add_argument('--messages', type=int, default=500)
+    parser.add_argument('--latency', type=float, default=0.0, help='milliseconds the stand-in waits before each reply')
+    parser.add_argument('--serve', type=int, metavar='PORT', help='only run the stand-in on PORT until interrupted')
+    args = parser.parse_args()
+
+    if args.serve:
+        server = SMTPStandIn(args.serve, args.latency / 1000)
+        print(f"SMTP stand-in listening on 127.0.0.1:{args.serve}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            print(f"\n{server.messages} messages over {server.connections} connections")
+        return
+
+    server = SMTPStandIn(latency=args.latency / 1000).start()
+    scratch = None
+    if args.url is None:
+        scratch = tempfile.NamedTemporaryFile(suffix='.db', delete=False)
+        args.url = f'sqlite:///{scratch.name}'
+    app = make_app(args.url, server.server_address[1])
+    with app.app_context():
+        if db.inspect(db.engine).has_table(OutboxEmail.__tablename__):
+            sys.exit('Refusing to run: the database already has an email_outbox table')
+        OutboxEmail.__table__.create(db.engine)
+        try:
+            queue(args.messages, 'outbox')
+            started = time.perf_counter()
+            email_outbox.run(once=True)
+            elapsed = time.perf_counter() - started
+            print(f"outbox:              {server.messages / elapsed:8.1f} msg/s, "
+                  f"{server.messages} sent over {server.connections} connections")
+
+            server.reset()
+            rows = db.session.scalars(db.select(OutboxEmail)).all()
+            started = time.perf_counter()
+            for row in rows:
+                mail.send(Message(subject=row.subject, sender=row.sender, recipients=[row.recipient], body=row.body))
+            elapsed = time.perf_counter() - started
+            print(f"connection per mail: {server.messages / elapsed:8.1f} msg/s, "
+                  f"{server.messages} sent over {server.connections} connections")
+        finally:
+            db.session.remove()
+            OutboxEmail.__table__.drop(db.engine)
+    server.shutdown()
+    if scratch is not None:
+        os.unlink(scratch.name)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,11 @@
+"""Gunicorn settings, loaded automatically from the working directory.
+
+The Procfile flags still choose the workers; this file only adds hooks.
+"""
+import os
+
+
+def post_fork(server, worker):
+    # Runs in each worker before the app is created, so per-worker pools
+    # (the gevent Redis transport) can be sized to the greenlets that share them
+    os.environ['GUNICORN_WORKER_CONNECTIONS'] = str(worker.cfg.worker_connections)
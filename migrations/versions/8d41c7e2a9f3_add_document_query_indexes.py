@@ -0,0 +1,56 @@
+"""Add document query indexes
+
+Revision ID: 8d41c7e2a9f3
+Revises: 3060e60cf56b
+Create Date: 2026-10-18 10:12:40.318254
+
+Indexes for the student and faculty dashboards and for the file_path lookup
+in main.uploaded_file. On PostgreSQL they are built CONCURRENTLY so the
+document table stays writable; a failed concurrent build leaves an INVALID
+index behind that must be dropped before retrying. The unique index on
+file_path fails if duplicate paths already exist.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8d41c7e2a9f3'
+down_revision = '3060e60cf56b'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction
+    with op.get_context().autocommit_block():
+        # student.dashboard: uploader_id = ? ORDER BY upload_date DESC
+        op.create_index('ix_document_uploader_id_upload_date', 'document',
+                        ['uploader_id', 'upload_date'],
+                        postgresql_concurrently=True)
+        # faculty.dashboard: only the (small) pending part of the table is indexed
+        op.create_index('ix_document_pending_review', 'document',
+                        ['assigned_faculty_id', 'upload_date'],
+                        postgresql_where=sa.text("status = 'pending_review'"),
+                        sqlite_where=sa.text("status = 'pending_review'"),
+                        postgresql_concurrently=True)
+        # faculty.dashboard and faculty.reviewed_documents: reviewed documents by review_date
+        op.create_index('ix_document_faculty_reviewer_status_review_date', 'document',
+                        ['assigned_faculty_id', 'reviewer_id', 'status', 'review_date'],
+                        postgresql_concurrently=True)
+        # main.uploaded_file: file_path = ?
+        op.create_index('ix_document_file_path', 'document', ['file_path'], unique=True,
+                        postgresql_concurrently=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_document_file_path', table_name='document',
+                      postgresql_concurrently=True)
+        op.drop_index('ix_document_faculty_reviewer_status_review_date', table_name='document',
+                      postgresql_concurrently=True)
+        op.drop_index('ix_document_pending_review', table_name='document',
+                      postgresql_concurrently=True)
+        op.drop_index('ix_document_uploader_id_upload_date', table_name='document',
+                      postgresql_concurrently=True)
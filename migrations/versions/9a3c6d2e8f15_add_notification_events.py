@@ -0,0 +1,39 @@
+"""Add notification events
+
+Revision ID: 9a3c6d2e8f15
+Revises: 4b8e2f61d0a7
+Create Date: 2026-10-18 17:31:40.215903
+
+Events waiting to be coalesced into digest emails when
+NOTIFICATION_DIGEST_SECONDS is set.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9a3c6d2e8f15'
+down_revision = '4b8e2f61d0a7'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('notification_event',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('recipient_id', sa.Integer(), nullable=False),
+        sa.Column('kind', sa.String(length=20), nullable=False),
+        sa.Column('document_id', sa.Integer(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(['document_id'], ['document.id'], ),
+        sa.ForeignKeyConstraint(['recipient_id'], ['user.id'], ),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_notification_event_recipient_kind', 'notification_event',
+                    ['recipient_id', 'kind', 'created_at'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_notification_event_recipient_kind', table_name='notification_event')
+    op.drop_table('notification_event')
@@ -0,0 +1,32 @@
+"""Add document checksum and size
+
+Revision ID: c52f0e9b7d14
+Revises: 8d41c7e2a9f3
+Create Date: 2026-10-18 13:05:12.604117
+
+SHA-256 and byte count of the uploaded file, computed while the upload is
+streamed to disk. Both are nullable, so existing rows stay as they are and
+adding the columns does not rewrite the table.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c52f0e9b7d14'
+down_revision = '8d41c7e2a9f3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('document', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('sha256', sa.String(length=64), nullable=True))
+        batch_op.add_column(sa.Column('file_size', sa.BigInteger(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('document', schema=None) as batch_op:
+        batch_op.drop_column('file_size')
+        batch_op.drop_column('sha256')
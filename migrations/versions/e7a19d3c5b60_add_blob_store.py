@@ -0,0 +1,43 @@
+"""Add blob store
+
+Revision ID: e7a19d3c5b60
+Revises: c52f0e9b7d14
+Create Date: 2026-10-18 14:22:48.917530
+
+Reference-counted, content-addressed blobs behind the document and review
+file paths. Existing files stay where they are and keep being served from
+there; `flask migrate-blobs` moves them into the store while the
+application runs.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e7a19d3c5b60'
+down_revision = 'c52f0e9b7d14'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('blob',
+        sa.Column('sha256', sa.String(length=64), nullable=False),
+        sa.Column('size', sa.BigInteger(), nullable=False),
+        sa.Column('ref_count', sa.Integer(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('released_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('sha256')
+    )
+    with op.batch_alter_table('document', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('review_file1_sha256', sa.String(length=64), nullable=True))
+        batch_op.add_column(sa.Column('review_file2_sha256', sa.String(length=64), nullable=True))
+
+
+def downgrade():
+    # Files already moved into the store are no longer found by their documents afterwards
+    with op.batch_alter_table('document', schema=None) as batch_op:
+        batch_op.drop_column('review_file2_sha256')
+        batch_op.drop_column('review_file1_sha256')
+    op.drop_table('blob')
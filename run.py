@@ -1,5 +1,13 @@
+import signal
+import time
+import click
 from app import create_app, db
 from app.models import User, Document
+from app.utils.blob_store import blob_store
+from app.utils.resumable import resumable_uploads
+from app.utils.outbox import email_outbox
+from app.utils.notifications import notification_digests
+from app.utils.metrics import metrics
 
 app = create_app()
 
@@ -18,5 +26,40 @@ def init_db():
     db.create_all()
     print("Database initialized.")
 
+@app.cli.command("migrate-blobs")
+@click.option('--batch-size', default=100, help='Documents loaded per query')
+def migrate_blobs(batch_size):
+    """Move files uploaded before the blob store into it (safe while serving)"""
+    migrated = blob_store.migrate_legacy(batch_size=batch_size)
+    print(f"Moved {migrated} files into the blob store.")
+
+@app.cli.command("gc-blobs")
+@click.option('--grace', type=float, default=None, help='Seconds an unreferenced blob is kept (default: BLOB_GC_GRACE_SECONDS)')
+def gc_blobs(grace):
+    """Delete unreferenced blobs and orphaned blob files"""
+    deleted = blob_store.collect_garbage(grace=grace)
+    print(f"Deleted {deleted} blob files.")
+
+@app.cli.command("gc-uploads")
+@click.option('--ttl', type=float, default=None, help='Seconds an idle upload session is kept (default: RESUMABLE_UPLOAD_TTL)')
+def gc_uploads(ttl):
+    """Delete abandoned resumable upload sessions"""
+    removed = resumable_uploads.collect_garbage(ttl=ttl)
+    print(f"Removed {removed} upload sessions.")
+
+@app.cli.command("send-email")
+@click.option('--once', is_flag=True, help='Exit once nothing is due instead of polling')
+def send_email(once):
+    """Send queued notification emails in batches over one SMTP connection, queueing due digests first"""
+    stopping = []
+    signal.signal(signal.SIGTERM, lambda *_: stopping.append(True))
+    started = time.monotonic()
+    processed = email_outbox.run(once=once, should_stop=lambda: bool(stopping),
+                                 on_poll=notification_digests.flush)
+    elapsed = time.monotonic() - started
+    print(f"Processed {processed} emails in {elapsed:.1f}s: {metrics.get('outbox.sent')} sent "
+          f"({metrics.get('outbox.sent') / max(elapsed, 0.001):.1f}/s), "
+          f"{metrics.get('outbox.retries')} to retry, {metrics.get('outbox.dead')} given up.")
+
 if __name__ == '__main__':
     app.run(debug=True)
@@ -0,0 +1,31 @@
+import pytest
+
+from app import create_app, db
+from app.models import User
+from app.utils.metrics import metrics
+
+
+@pytest.fixture
+def app(tmp_path):
+    """App on a fresh SQLite database, with its app context pushed"""
+    app = create_app('testing', {
+        'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'test.db'}",
+        'UPLOAD_FOLDER': str(tmp_path / 'uploads'),
+    })
+    metrics.reset()
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+
+@pytest.fixture
+def users(app):
+    student = User(email='student@example.edu', password_hash='-', role='student',
+                   first_name='Sam', last_name='Student')
+    faculty = User(email='faculty@example.edu', password_hash='-', role='faculty',
+                   first_name='Fay', last_name='Faculty')
+    db.session.add_all([student, faculty])
+    db.session.commit()
+    return student, faculty
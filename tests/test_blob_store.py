@@ -0,0 +1,109 @@
+import os
+import time
+from datetime import datetime, timedelta
+
+from app import db
+from app.models import Blob, Document
+from app.utils.blob_store import blob_store
+from app.utils.file_utils import INCOMING_DIR, IngestFile, upload_root
+
+
+def store(content):
+    """Store content as a new upload would, returning its digest"""
+    ingest = IngestFile(os.path.join(upload_root(), INCOMING_DIR))
+    try:
+        ingest.write(content)
+        blob_store.store(ingest)
+        db.session.commit()
+        return ingest.sha256
+    finally:
+        ingest.close()
+
+
+def blob(sha256):
+    db.session.expire_all()
+    return db.session.get(Blob, sha256)
+
+
+def release(sha256, ago=timedelta(hours=2)):
+    """Drop a reference, as if it happened `ago`"""
+    blob_store.release(sha256)
+    db.session.commit()
+    row = blob(sha256)
+    if row.released_at is not None:
+        row.released_at = datetime.utcnow() - ago
+        db.session.commit()
+
+
+def test_identical_content_is_stored_once(app):
+    first = store(b'same bytes')
+    second = store(b'same bytes')
+
+    assert first == second
+    assert blob(first).ref_count == 2
+    assert open(blob_store.path(first), 'rb').read() == b'same bytes'
+    assert os.listdir(os.path.dirname(blob_store.path(first))) == [first]
+
+
+def test_release_counts_down_and_marks_unreferenced_blobs(app):
+    sha256 = store(b'content')
+    store(b'content')
+
+    blob_store.release(sha256)
+    db.session.commit()
+    assert blob(sha256).ref_count == 1
+    assert blob(sha256).released_at is None
+
+    blob_store.release(sha256)
+    blob_store.release(sha256)  # Never below zero
+    db.session.commit()
+    assert blob(sha256).ref_count == 0
+    assert blob(sha256).released_at is not None
+
+
+def test_garbage_collection_deletes_blobs_unreferenced_past_the_grace_period(app):
+    kept = store(b'still referenced')
+    recent = store(b'released just now')
+    old = store(b'released long ago')
+    release(recent, ago=timedelta(seconds=1))
+    release(old)
+
+    assert blob_store.collect_garbage(grace=3600) == 1
+
+    assert blob(old) is None and not blob_store.exists(old)
+    assert blob(recent) is not None and blob_store.exists(recent)
+    assert blob(kept).ref_count == 1 and blob_store.exists(kept)
+
+
+def test_garbage_collection_recounts_before_deleting(app, users):
+    student, faculty = users
+    sha256 = store(b'uploaded before the store counted references')
+    db.session.add(Document(filename='a.pdf', original_filename='a.pdf', file_path=f'student_{student.id}/a.pdf',
+                            file_type='pdf', sha256=sha256, uploader_id=student.id,
+                            assigned_faculty_id=faculty.id))
+    db.session.commit()
+    release(sha256)
+
+    assert blob_store.collect_garbage(grace=3600) == 0
+
+    assert blob(sha256).ref_count == 1
+    assert blob(sha256).released_at is None
+    assert blob_store.exists(sha256)
+
+
+def test_garbage_collection_deletes_old_files_without_a_row(app):
+    orphan = blob_store.path('ab' * 32)
+    os.makedirs(os.path.dirname(orphan))
+    with open(orphan, 'wb') as f:
+        f.write(b'from an upload that never committed')
+    fresh = blob_store.path('cd' * 32)
+    os.makedirs(os.path.dirname(fresh))
+    with open(fresh, 'wb') as f:
+        f.write(b'from an upload still committing')
+    hour_ago = time.time() - 3600
+    os.utime(orphan, (hour_ago, hour_ago))
+
+    assert blob_store.collect_garbage(grace=60) == 1
+
+    assert not os.path.exists(orphan)
+    assert os.path.exists(fresh)
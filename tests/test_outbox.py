@@ -0,0 +1,128 @@
+import smtplib
+from datetime import datetime, timedelta
+
+import pytest
+
+from app import db, mail
+from app.models import OutboxEmail
+from app.utils.outbox import EmailOutbox
+
+
+class ScriptedConnection:
+    """SMTP connection failing with the given errors in turn, then accepting every message"""
+
+    def __init__(self, *errors):
+        self.errors = list(errors)
+        self.sent = []
+
+    def send(self, message):
+        error = self.errors.pop(0) if self.errors else None
+        if error is not None:
+            raise error
+        self.sent.append(message)
+
+
+@pytest.fixture
+def outbox(app):
+    return EmailOutbox(batch_size=10, max_attempts=3, retry_base=30, retry_max=3600)
+
+
+def enqueue(outbox, key, subject='Your document was reviewed'):
+    queued = outbox.enqueue(key, 'student@example.edu', subject, 'See the dashboard.',
+                            sender='noreply@example.edu')
+    db.session.commit()
+    return queued
+
+
+def rows():
+    db.session.expire_all()
+    return {row.idempotency_key: row for row in OutboxEmail.query}
+
+
+def test_a_key_is_queued_once(outbox):
+    assert enqueue(outbox, 'review-1')
+    assert not enqueue(outbox, 'review-1')
+
+    assert list(rows()) == ['review-1']
+
+
+def test_sent_messages_use_the_key_as_message_id(outbox):
+    enqueue(outbox, 'review-1')
+    connection = ScriptedConnection()
+
+    assert outbox.send_batch(connection) == 1
+
+    assert connection.sent[0].msgId == '<review-1@example.edu>'
+    row = rows()['review-1']
+    assert (row.status, row.attempts, row.sent_at is not None) == ('sent', 1, True)
+    assert not outbox.has_due()
+
+
+def test_temporary_failures_are_retried_with_backoff(outbox):
+    enqueue(outbox, 'review-1')
+
+    outbox.send_batch(ScriptedConnection(smtplib.SMTPResponseException(451, b'Try again later')))
+
+    row = rows()['review-1']
+    assert (row.status, row.attempts) == ('pending', 1)
+    delay = (row.next_attempt_at - datetime.utcnow()).total_seconds()
+    assert 14 <= delay <= 30  # Full jitter over half to all of retry_base
+    assert 'Try again later' in row.last_error
+    assert not outbox.has_due()
+
+
+def test_messages_fail_after_max_attempts(outbox):
+    enqueue(outbox, 'review-1')
+
+    for _ in range(3):
+        row = rows()['review-1']
+        row.next_attempt_at = datetime.utcnow() - timedelta(seconds=1)
+        db.session.commit()
+        outbox.send_batch(ScriptedConnection(smtplib.SMTPResponseException(451, b'Try again later')))
+
+    row = rows()['review-1']
+    assert (row.status, row.attempts) == ('failed', 3)
+
+
+def test_permanent_refusals_are_not_retried(outbox):
+    enqueue(outbox, 'rejected')
+    enqueue(outbox, 'refused')
+    enqueue(outbox, 'partly-refused')
+
+    outbox.send_batch(ScriptedConnection(
+        smtplib.SMTPResponseException(550, b'Mailbox unavailable'),
+        smtplib.SMTPRecipientsRefused({'student@example.edu': (550, b'No such user')}),
+        smtplib.SMTPRecipientsRefused({'student@example.edu': (450, b'Mailbox busy')}),
+    ))
+
+    statuses = {key: row.status for key, row in rows().items()}
+    assert statuses == {'rejected': 'failed', 'refused': 'failed', 'partly-refused': 'pending'}
+
+
+def test_a_connection_error_reschedules_and_stops_the_batch(outbox):
+    enqueue(outbox, 'first')
+    enqueue(outbox, 'second')
+    connection = ScriptedConnection(smtplib.SMTPServerDisconnected('Connection lost'))
+
+    with pytest.raises(smtplib.SMTPServerDisconnected):
+        outbox.send_batch(connection)
+
+    first, second = rows()['first'], rows()['second']
+    assert (first.status, first.attempts) == ('pending', 1)
+    assert first.next_attempt_at > datetime.utcnow()
+    assert (second.status, second.attempts) == ('pending', 0)
+    assert connection.sent == []
+
+
+def test_a_message_that_cannot_be_built_fails_without_blocking_the_rest(outbox):
+    enqueue(outbox, 'bad-header', subject='Reviewed\nBcc: everyone@example.edu')
+    enqueue(outbox, 'good')
+
+    with mail.connect() as connection, mail.record_messages() as delivered:
+        assert outbox.send_batch(connection) == 2
+
+    bad, good = rows()['bad-header'], rows()['good']
+    assert (bad.status, bad.attempts) == ('failed', 1)
+    assert bad.last_error == 'BadHeaderError'
+    assert good.status == 'sent'
+    assert [message.msgId for message in delivered] == ['<good@example.edu>']
@@ -0,0 +1,83 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from app import db
+from app.models import Document
+from app.utils.pagination import InvalidCursor, paginate_keyset
+
+START = datetime(2024, 3, 1, 9, 0)
+
+
+@pytest.fixture
+def add_document(users):
+    student, faculty = users
+
+    def add(upload_date):
+        number = Document.query.count()
+        document = Document(filename=f'doc{number}.pdf', original_filename=f'doc{number}.pdf',
+                            file_path=f'student_{student.id}/doc{number}.pdf', file_type='pdf',
+                            upload_date=upload_date, uploader_id=student.id,
+                            assigned_faculty_id=faculty.id)
+        db.session.add(document)
+        db.session.commit()
+        return document.id
+    return add
+
+
+def page(cursor=None, per_page=3):
+    return paginate_keyset(Document.query, Document.upload_date, cursor=cursor, per_page=per_page)
+
+
+def all_pages(per_page=3):
+    ids, cursor = [], None
+    while True:
+        current = page(cursor, per_page)
+        ids.append([document.id for document in current])
+        if not current.has_next:
+            return ids
+        cursor = current.next_cursor
+
+
+def test_pages_walk_every_row_newest_first(add_document):
+    # Two uploads at the same time, split across the first page boundary: the id breaks the tie
+    ids = [add_document(START + timedelta(minutes=minutes)) for minutes in (0, 1, 2, 3, 3, 4, 5)]
+
+    pages = all_pages()
+
+    assert pages == [[ids[6], ids[5], ids[4]], [ids[3], ids[2], ids[1]], [ids[0]]]
+
+
+def test_new_rows_do_not_shift_later_pages(add_document):
+    ids = [add_document(START + timedelta(minutes=minutes)) for minutes in range(6)]
+    first = page()
+
+    add_document(START + timedelta(hours=1))
+    second = page(first.next_cursor)
+
+    assert [document.id for document in second] == [ids[2], ids[1], ids[0]]
+    assert second.cursor == first.next_cursor
+    assert not second.has_next
+
+
+def test_the_last_page_has_no_next_cursor(add_document):
+    for minutes in range(3):
+        add_document(START + timedelta(minutes=minutes))
+
+    assert not page().has_next
+    assert page(per_page=2).has_next
+
+
+def test_tampered_cursors_are_rejected(app, add_document):
+    for minutes in range(4):
+        add_document(START + timedelta(minutes=minutes))
+    cursor = page().next_cursor
+
+    with pytest.raises(InvalidCursor):
+        page(cursor[:-1] + ('A' if cursor[-1] != 'A' else 'B'))
+    with pytest.raises(InvalidCursor):
+        page('not-a-cursor')
+
+    app.secret_key = 'another key'
+    with pytest.raises(InvalidCursor):
+        page(cursor)
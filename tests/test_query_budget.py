@@ -0,0 +1,49 @@
+import pytest
+from sqlalchemy import text
+
+from app import db
+from app.utils.metrics import metrics
+from app.utils.query_budget import QueryBudgetExceeded, query_budget
+
+
+def run_queries(count):
+    for _ in range(count):
+        db.session.execute(text('SELECT 1'))
+    return 'ok'
+
+
+@pytest.fixture
+def client(app):
+    app.config['QUERY_BUDGET'] = 3
+    app.add_url_rule('/three', 'three', lambda: run_queries(3))
+    app.add_url_rule('/five', 'five', lambda: run_queries(5))
+    app.add_url_rule('/own-budget', 'own_budget', query_budget(10)(lambda: run_queries(5)))
+    return app.test_client()
+
+
+def test_queries_are_counted_per_request(client):
+    assert client.get('/three').status_code == 200
+    assert client.get('/three').status_code == 200
+
+    assert metrics.get('db.queries') == 6
+    assert metrics.get('db.query_budget_exceeded') == 0
+
+
+def test_requests_over_budget_are_flagged(client):
+    assert client.get('/five').status_code == 200
+
+    assert metrics.get('db.query_budget_exceeded') == 1
+
+
+def test_a_view_can_set_its_own_budget(client):
+    assert client.get('/own-budget').status_code == 200
+
+    assert metrics.get('db.query_budget_exceeded') == 0
+
+
+def test_strict_mode_raises_at_the_query_over_budget(app, client):
+    app.config['QUERY_BUDGET_STRICT'] = True
+
+    with pytest.raises(QueryBudgetExceeded, match='five ran more than 3 queries'):
+        client.get('/five')
+    assert client.get('/three').status_code == 200
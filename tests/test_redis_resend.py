@@ -0,0 +1,130 @@
+import asyncio
+import socket
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+from app.utils.redis_backends import GeventRespBackend, resendable
+from app.utils.redis_client import GeventRedisManager, RedisManager
+
+
+@pytest.fixture
+def dropping_server():
+    """RESP server that reads each command and closes the connection without replying.
+
+    The commands it received are collected in the returned list, so a test
+    can tell how often a client sent a command whose reply was lost.
+    """
+    listener = socket.socket()
+    listener.bind(('127.0.0.1', 0))
+    listener.listen(16)
+    received = []
+
+    def handle(conn):
+        with conn, conn.makefile('rb') as stream:
+            line = stream.readline()
+            if not line.startswith(b'*'):
+                return
+            args = []
+            for _ in range(int(line[1:])):
+                length = int(stream.readline()[1:])
+                args.append(stream.read(length + 2)[:-2].decode())
+            received.append(args)
+
+    def serve():
+        while True:
+            try:
+                conn, _ = listener.accept()
+            except OSError:
+                return
+            threading.Thread(target=handle, args=(conn,), daemon=True).start()
+
+    threading.Thread(target=serve, daemon=True).start()
+    yield f"redis://127.0.0.1:{listener.getsockname()[1]}/0", received
+    listener.close()
+
+
+def async_manager(url):
+    manager = RedisManager()
+    manager.init_app(SimpleNamespace(config={'REDIS_URL': url, 'REDIS_COMMAND_TIMEOUT': 2}))
+    return manager
+
+
+def gevent_manager(url):
+    backend = GeventRespBackend(url, pool_size=2, timeout=2)
+    return GeventRedisManager(SimpleNamespace(command_timeout=2, _script_shas={}), backend)
+
+
+def test_gevent_incr_is_not_resent_after_the_connection_drops(dropping_server):
+    url, received = dropping_server
+    manager = gevent_manager(url)
+
+    with pytest.raises(ConnectionError):
+        manager.sync.increment('counter')
+
+    assert received == [['INCR', 'counter']]
+
+
+def test_gevent_reads_are_still_retried(dropping_server):
+    url, received = dropping_server
+    manager = gevent_manager(url)
+
+    with pytest.raises(ConnectionError):
+        manager.sync.get('key')
+
+    assert received == [['GET', 'key']] * 3
+
+
+def test_resendable_commands():
+    assert resendable([['GET', 'key'], ['SET', 'key', 'value', 'EX', 60], ['expire', 'key', 60]])
+    assert not resendable([['INCR', 'counter']])
+    assert not resendable([['GET', 'key'], ['EVALSHA', 'sha', 1, 'key']])
+    assert not resendable([['SET', 'lock', 'token', 'NX', 'EX', 10]])
+    assert not resendable([['SET', 'key', 'value', 'GET']])
+
+
+def test_incr_is_not_resent_after_the_connection_drops(dropping_server):
+    url, received = dropping_server
+    manager = async_manager(url)
+
+    with pytest.raises(ConnectionError):
+        asyncio.run(manager.increment('counter'))
+
+    assert received == [['INCR', 'counter']]
+
+
+def test_scripts_and_locks_are_not_resent(dropping_server):
+    url, received = dropping_server
+    manager = async_manager(url)
+
+    with pytest.raises(ConnectionError):
+        asyncio.run(manager.run_script('return 1'))
+    with pytest.raises(ConnectionError):
+        asyncio.run(manager.acquire_lock('job', expiry=10))
+
+    assert [command[0] for command in received] == ['EVALSHA', 'SET']
+
+
+def test_pipelines_are_resent_only_when_every_command_is_idempotent(dropping_server):
+    url, received = dropping_server
+    manager = async_manager(url)
+
+    with pytest.raises(ConnectionError):
+        asyncio.run(manager.execute_pipeline([['SET', 'key', 'value'], ['INCR', 'counter']]))
+    assert received == [['SET', 'key', 'value']]
+
+    received.clear()
+    with pytest.raises(ConnectionError):
+        asyncio.run(manager.execute_pipeline([['SET', 'key', 'value'], ['EXPIRE', 'key', '60']]))
+    assert received == [['SET', 'key', 'value']] * 3
+
+
+def test_reads_are_still_retried(dropping_server):
+    url, received = dropping_server
+    manager = async_manager(url)
+
+    with pytest.raises(ConnectionError):
+        asyncio.run(manager.get('key'))
+
+    assert received == [['GET', 'key']] * 3
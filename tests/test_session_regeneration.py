@@ -0,0 +1,38 @@
+import fakeredis
+import pytest
+
+from app.utils.redis_client import RECREATE_SESSION_SCRIPT
+
+
+@pytest.fixture
+def redis():
+    return fakeredis.FakeStrictRedis(decode_responses=True)
+
+
+def recreate(redis, old, new, data):
+    return redis.eval(RECREATE_SESSION_SCRIPT, 2, old, new, data, 60)
+
+
+def test_recreate_moves_the_session(redis):
+    redis.set('session:old', 'data')
+
+    assert recreate(redis, 'session:old', 'session:new', 'data') == 1
+    assert redis.get('session:old') is None
+    assert redis.get('session:new') == 'data'
+
+
+def test_recreate_is_idempotent_when_the_first_reply_is_lost(redis):
+    redis.set('session:old', 'data')
+    recreate(redis, 'session:old', 'session:new', 'data')
+
+    assert recreate(redis, 'session:old', 'session:new', 'data') == 1
+    assert redis.get('session:new') == 'data'
+
+
+def test_recreate_refuses_a_new_id_holding_other_data(redis):
+    redis.set('session:old', 'data')
+    redis.set('session:new', 'someone else')
+
+    assert recreate(redis, 'session:old', 'session:new', 'data') == 0
+    assert redis.get('session:old') == 'data'
+    assert redis.get('session:new') == 'someone else'
@@ -0,0 +1,94 @@
+import base64
+
+import pytest
+
+from app.utils.session_serializer import (
+    BINARY_PREFIX, FORMAT_VERSION, BinarySessionSerializer, JsonSessionSerializer, create_serializer,
+)
+
+SESSION = {
+    '_user_id': '42',
+    '_last_user_id': '42',
+    '_id': 'ab' * 64,
+    '_fresh': True,
+    '_remember': None,
+    '_permanent': True,
+    '_flashes': [['success', 'Document uploaded successfully'], ['info', 'Grüße']],
+    '_db_write_at': 1760000000.25,
+    'csrf_token': '0123456789abcdef' * 4,
+    'email': 'student@example.edu',
+    'role': 'student',
+    'counter': -7,
+    'zero_padded': '007',
+    'custom': {'nested': [1, 2, {'deep': False}]},
+}
+
+
+def payload(version, body, flags=0):
+    """A binary session payload with a hand-picked format version"""
+    return BINARY_PREFIX + base64.b85encode(bytes((version, flags)) + body).decode('ascii')
+
+
+def test_binary_round_trip():
+    serializer = BinarySessionSerializer()
+
+    value = serializer.dumps(SESSION)
+
+    assert value.startswith(BINARY_PREFIX)
+    assert serializer.loads(value) == SESSION
+    assert len(value) < len(JsonSessionSerializer().dumps(SESSION))
+
+
+def test_large_payloads_are_compressed():
+    serializer = BinarySessionSerializer(compress_threshold=64)
+    data = dict(SESSION, notes=['the same note'] * 50)
+
+    value = serializer.dumps(data)
+
+    assert base64.b85decode(value[len(BINARY_PREFIX):])[1] & 0x01
+    assert serializer.loads(value) == data
+
+
+def test_each_format_reads_the_other():
+    binary, json = create_serializer('binary'), create_serializer('json')
+
+    assert json.loads(binary.dumps(SESSION)) == SESSION
+    assert binary.loads(json.dumps(SESSION)) == SESSION
+
+
+def test_payloads_carry_the_format_version():
+    value = BinarySessionSerializer().dumps(SESSION)
+
+    assert base64.b85decode(value[len(BINARY_PREFIX):])[0] == FORMAT_VERSION
+
+
+def test_version_1_payloads_are_still_read():
+    # A dict of two entries: key code 0 with a digit string, then a key outside
+    # the table spelled out, with a plain string
+    body = bytes((9, 2, 0, 6, 42, 0xFF, 1)) + b'x' + bytes((5, 1)) + b'y'
+
+    assert BinarySessionSerializer().loads(payload(1, body)) == {'_user_id': '42', 'x': 'y'}
+
+
+def test_version_1_payloads_cannot_use_newer_key_codes():
+    # Code 14 (_db_write_at) was added in version 2
+    body = bytes((9, 1, 14, 0))
+
+    with pytest.raises(ValueError, match='Unknown session key code 14'):
+        BinarySessionSerializer().loads(payload(1, body))
+    assert BinarySessionSerializer().loads(payload(2, body)) == {'_db_write_at': None}
+
+
+def test_unknown_versions_are_rejected():
+    with pytest.raises(ValueError, match='Unsupported session format version'):
+        BinarySessionSerializer().loads(payload(FORMAT_VERSION + 1, bytes((9, 0))))
+
+
+def test_corrupt_payloads_are_rejected():
+    value = BinarySessionSerializer().dumps(SESSION)
+    raw = base64.b85decode(value[len(BINARY_PREFIX):])
+
+    with pytest.raises(ValueError, match='Truncated'):
+        BinarySessionSerializer().loads(payload(raw[0], raw[2:-3], raw[1]))
+    with pytest.raises(ValueError, match='Trailing bytes'):
+        BinarySessionSerializer().loads(payload(raw[0], raw[2:] + b'\0', raw[1]))